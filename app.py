@@ -1,78 +1,125 @@
 # app.py (MODIFIED FOR POSTGRESQL ON RENDER)
  
-from flask import Flask, render_template, abort, session, redirect, url_for, request, flash, jsonify
+# Load .env before anything else: db, carts, search_index, the caches and the
+# chat guard read their settings from the environment when they are imported.
+from dotenv import load_dotenv
+load_dotenv()
+
+from flask import Flask, Blueprint, render_template, abort, session, redirect, url_for, request, flash, jsonify, g, Response, stream_with_context
 # import sqlite3 # --- REMOVED ---
 import psycopg2 # --- ADDED for PostgreSQL
 from psycopg2.extras import DictCursor # --- ADDED to get dict-like rows
-from urllib.parse import urlparse # --- ADDED to parse the database URL
+from db import get_pool, pool_stats
+from catalog import get_catalog, get_sales_ranks, keyset_page, sort_key
+import search_index
+import tasks
+import jobs
+import chatbot
+import chat_cache
+from chat_guard import model_gate, model_breaker, rate_limiter, guard_stats
+import intents
+import metrics
+import log_config
+from carts import create_cart_store, new_cart_id
+from render_cache import render_fragment, cached_page, render_cache_stats
+from http_cache import conditional_page
+import images
+from assets import asset_urls
+from user_cache import get_cached_user, cache_user, invalidate_user, user_cache_stats
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+from werkzeug.middleware.proxy_fix import ProxyFix
+from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user, user_logged_in, user_loaded_from_cookie
 from datetime import datetime
 import os
-from dotenv import load_dotenv
-import google.generativeai as genai
-import threading # Ensure threading is imported for background tasks
-# app.py (MODIFIED)
-
-# ... (all your imports should be at the top)
+import functools
+import hmac
+import json
+import math
+import logging
+import secrets
 from whitenoise import WhiteNoise
 
-# Load environment variables once at the top
-load_dotenv()
- 
-# --- App Initialization ---
-app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
-# --- FINAL, ROBUST WHITENOISE CONFIGURATION ---
-# Construct the absolute path to the 'static' directory
-static_folder_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
-# Configure WhiteNoise with the absolute path and the correct prefix
-app.wsgi_app = WhiteNoise(app.wsgi_app, root=static_folder_root, prefix="static/")
-# -------------------------------------------
+STATIC_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
 
-# IMPORTANT FIX: Use a *separate* secret key for Flask sessions.
-app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'your_super_secret_fallback_key_CHANGE_THIS_IN_PROD')
+# Importing this module only defines the views; create_app() (at the bottom)
+# builds the app. The Gemini client, connection pool and job workers are all
+# created on first use in each process, so gunicorn can preload the app once
+# and fork workers from it (see gunicorn.conf.py).
+bp = Blueprint('main', __name__)
 
-# ... (the rest of your app.py file continues as normal)
-# Configure Gemini API
-api_key = os.environ.get('GEMINI_API_KEY')
-if not api_key:
-    print("ERROR: GEMINI_API_KEY not found in environment variables. Chatbot will not work.")
-else:
-    print(f"Loaded GEMINI_API_KEY (first time check): {api_key}")
-    genai.configure(api_key=api_key)
- 
- 
 # --- Flask-Login Setup ---
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login_page'
+login_manager.login_view = 'main.login_page'
 login_manager.login_message_category = "danger"
  
-# --- START: DATABASE CONNECTION MODIFIED FOR POSTGRESQL ---
+# --- START: POOLED, REQUEST-SCOPED DATABASE CONNECTIONS ---
 def get_db_connection():
-    """Establishes a connection to the PostgreSQL database."""
-    db_url = os.environ.get("DATABASE_URL")
-    if not db_url:
-        raise ValueError("DATABASE_URL environment variable is not set.")
-    
-    # Parse the database URL
-    result = urlparse(db_url)
-    username = result.username
-    password = result.password
-    database = result.path[1:]
-    hostname = result.hostname
-    port = result.port
-    
-    conn = psycopg2.connect(
-        dbname=database,
-        user=username,
-        password=password,
-        host=hostname,
-        port=port
-    )
-    return conn
-# --- END: DATABASE CONNECTION MODIFIED FOR POSTGRESQL ---
+    """
+    Returns the PostgreSQL connection for the current request.
+
+    The first call in a request borrows a connection from the process-wide pool
+    and keeps it on `g`; later calls in the same request reuse it. The connection
+    is handed back to the pool in `release_db_connection`, so callers must not
+    close it themselves.
+    """
+    if 'db_conn' not in g:
+        g.db_conn = get_pool().getconn()
+    return g.db_conn
+
+@bp.before_app_request
+def ensure_job_workers():
+    """Starts this process's in-process job workers on its first request (see jobs.py)."""
+    jobs.start_in_process_workers()
+
+def release_db_connection(exception):
+    """Returns the request's connection (if any) to the pool, rolling back open work."""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().putconn(conn)
+
+# --- Internal stats pages ---
+# For operators and scrapers only. They answer 404 unless STATS_TOKEN is set,
+# and then only to requests that send it as "Authorization: Bearer <token>".
+def stats_access_required(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        expected = os.environ.get('STATS_TOKEN')
+        if not expected:
+            abort(404)
+        auth = request.headers.get('Authorization', '')
+        token = auth[len('Bearer '):] if auth.startswith('Bearer ') else ''
+        if not hmac.compare_digest(token.encode(), expected.encode()):
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+@bp.route('/pool-stats')
+@stats_access_required
+def pool_stats_page():
+    """Connection pool counters for scraping (waits, wait time, in-use, created, recycled)."""
+    return jsonify(pool_stats() or {})
+
+@bp.route('/cache-stats')
+@stats_access_required
+def cache_stats_page():
+    """Hit/miss counters for the in-process caches."""
+    return jsonify({'users': user_cache_stats(), 'chat': chat_cache.chat_cache_stats(), 'carts': cart_store.stats(),
+                    **render_cache_stats()})
+
+@bp.route('/metrics')
+@stats_access_required
+def metrics_page():
+    """This worker's request, database, template, model and job metrics in the Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/chat-stats')
+@stats_access_required
+def chat_stats_page():
+    """Chat admission control (gate, rate limit, breaker) and how messages were answered."""
+    return jsonify({**guard_stats(), 'resolutions': intents.resolution_stats(), 'model': chatbot.model_call_stats()})
+# --- END: POOLED, REQUEST-SCOPED DATABASE CONNECTIONS ---
  
 # --- User Model ---
 class User(UserMixin):
@@ -83,36 +130,94 @@ class User(UserMixin):
  
 @login_manager.user_loader
 def load_user(user_id):
+    """Loads the session user, from the per-worker user cache when possible."""
+    cached = get_cached_user(user_id)
+    if cached:
+        return User(id=cached[0], username=cached[1], password_hash=None)
     conn = get_db_connection()
-    # --- MODIFIED: Use psycopg2 cursor and %s placeholder ---
     with conn.cursor(cursor_factory=DictCursor) as cur:
-        cur.execute('SELECT * FROM users WHERE id = %s', (user_id,))
+        cur.execute('SELECT id, username FROM users WHERE id = %s', (user_id,))
         user_data = cur.fetchone()
-    conn.close()
     if user_data:
-        return User(id=user_data['id'], username=user_data['username'], password_hash=user_data['password_hash'])
+        cache_user(user_data['id'], user_data['username'])
+        return User(id=user_data['id'], username=user_data['username'], password_hash=None)
     return None
  
-# --- Helper Function for Cart ---
+# --- Server-Side Cart (see carts.py) ---
+# The session holds only the cart id and the revision of the last write.
+cart_store = create_cart_store(get_db_connection)
+
+def _session_cart():
+    """(cart_id, revision) for this session; moves a cookie-held cart from older sessions into the store."""
+    legacy = session.pop('cart', None)
+    if legacy:
+        cart_id = session.setdefault('cart_id', new_cart_id())
+        revision = session.get('cart_rev')
+        for item in legacy.values():
+            revision = cart_store.add(cart_id, revision, int(item['id']), item.get('size') or '', int(item['quantity']))
+        _set_cart_revision(revision)
+    return session.get('cart_id'), session.get('cart_rev')
+
+def _set_cart_revision(revision):
+    session['cart_rev'] = revision
+    g.pop('cart_items', None)
+
+def get_cart_items():
+    """{(product_id, size): quantity} for this session's cart, loaded at most once per request."""
+    if 'cart_items' not in g:
+        cart_id, revision = _session_cart()
+        g.cart_items = cart_store.items(cart_id, revision) if cart_id else {}
+    return g.cart_items
+
+def get_cart_lines():
+    """The cart as display lines, with names, prices and images from the current catalog."""
+    catalog = get_catalog()
+    lines = []
+    for (product_id, size), quantity in sorted(get_cart_items().items()):
+        product = catalog.get(product_id)
+        if product is None:
+            continue  # no longer sold
+        lines.append({'id': product.id, 'name': product.name, 'price': product.price,
+                      'image': product.image_main, 'quantity': quantity, 'size': size})
+    return lines
+
 def get_cart_count():
-    return len(session.get('cart', {}))
+    return len(get_cart_items())
+
+def viewer_state():
+    """What a catalog page shows about the visitor (the navbar): (cart count, signed in)."""
+    return get_cart_count(), current_user.is_authenticated
+
+def claim_cart_on_login(sender, user):
+    """Merges the visitor's anonymous cart into the user's saved cart."""
+    cart_id, revision = cart_store.claim(_session_cart()[0], user.id)
+    if cart_id:
+        session['cart_id'] = cart_id
+        _set_cart_revision(revision)
+    else:
+        session.pop('cart_id', None)
+        session.pop('cart_rev', None)
+        g.pop('cart_items', None)
  
-@app.context_processor
+@bp.app_context_processor
 def inject_current_year():
     """Injects the current year into all templates."""
     return {'current_year': datetime.utcnow().year}
  
  
+def find_products(query, min_price=None, max_price=None, limit=None):
+    """Ranked product search; only touches the database when SEARCH_BACKEND=postgres."""
+    conn = get_db_connection() if search_index.SEARCH_BACKEND == 'postgres' else None
+    return search_index.search_products(get_catalog(), query, min_price, max_price, limit, conn=conn)
+ 
+ 
 # --- Standard Page Routes (with DB logic updated) ---
-@app.route('/')
+@bp.route('/')
+@conditional_page(viewer=viewer_state)
+@cached_page(vary=get_cart_count)
 def home():
-    """Renders the landing page and fetches trending products."""
-    conn = get_db_connection()
-    # --- MODIFIED: Use psycopg2 cursor and %s placeholder ---
-    with conn.cursor(cursor_factory=DictCursor) as cur:
-        cur.execute("SELECT * FROM products WHERE badge = 'Bestseller' LIMIT 3")
-        trending_products = cur.fetchall()
-    conn.close()
+    """Renders the landing page with trending products from the in-memory catalog."""
+    trending_products = get_catalog().with_badge('Bestseller', limit=3)
     return render_template(
         'index.html',
         cart_item_count=get_cart_count(),
@@ -120,73 +225,183 @@ def home():
         trending_products=trending_products
     )
  
-@app.route('/products')
-def products_page():
-    selected_categories = request.args.getlist('category')
-    selected_price = request.args.get('price')
-    base_query = "SELECT * FROM products"
-    conditions = []
-    params = []
-    if selected_categories:
-        placeholders = ','.join(['%s'] * len(selected_categories)) # Use %s
-        conditions.append(f"category IN ({placeholders})")
-        params.extend(selected_categories)
-    if selected_price and '-' in selected_price:
-        min_price, max_price = selected_price.split('-')
-        conditions.append("price BETWEEN %s AND %s") # Use %s
-        params.extend([float(min_price), float(max_price)])
-    if conditions:
-        base_query += " WHERE " + " AND ".join(conditions)
-    
-    conn = get_db_connection()
-    # --- MODIFIED: Use psycopg2 cursor ---
-    with conn.cursor(cursor_factory=DictCursor) as cur:
-        cur.execute(base_query, params)
-        products = cur.fetchall()
-    conn.close()
+# --- Product listings: sorted, keyset-paginated ---
+PRODUCTS_PAGE_SIZE = 24
+PRODUCTS_MAX_PAGE_SIZE = 96
+PRODUCT_SORTS = {
+    'featured': 'Featured',
+    'bestseller': 'Bestsellers',
+    'newest': 'Newest',
+    'price_asc': 'Price: Low to High',
+    'price_desc': 'Price: High to Low',
+}
+SEARCH_SORTS = dict(relevance='Most Relevant', **PRODUCT_SORTS)
+
+def encode_product_cursor(key):
+    """Keyset cursor for a product listing: the sort key of the last product shown."""
+    return '_'.join(repr(value) for value in key)
+
+def decode_product_cursor(cursor):
+    """Parses a cursor from encode_product_cursor; raises ValueError if it is malformed."""
+    key = tuple(int(part) if part.lstrip('-').isdigit() else float(part) for part in cursor.split('_'))
+    if not 1 <= len(key) <= 2 or not all(math.isfinite(value) for value in key):
+        raise ValueError(cursor)
+    return key
+
+def _listing_args(sorts, default_sort):
+    """Reads the filters, ?sort=, ?cursor= and ?limit= of a listing, rejecting malformed values."""
+    args = {
+        'categories': request.args.getlist('category'),
+        'price': request.args.get('price'),
+        'badge': request.args.get('badge') or None,
+        'sort': request.args.get('sort') or default_sort,
+        'after': None,
+        'limit': max(1, min(request.args.get('limit', PRODUCTS_PAGE_SIZE, type=int), PRODUCTS_MAX_PAGE_SIZE)),
+        'min_price': None,
+        'max_price': None,
+    }
+    if args['sort'] not in sorts:
+        abort(400)
+    try:
+        if args['price'] and '-' in args['price']:
+            min_price, max_price = args['price'].split('-')
+            args['min_price'], args['max_price'] = float(min_price), float(max_price)
+        if request.args.get('cursor'):
+            args['after'] = decode_product_cursor(request.args['cursor'])
+    except ValueError:
+        abort(400)
+    return args
+
+def _listing_url(endpoint, args, **overrides):
+    """URL of a listing with the same filters and sort, e.g. the next page's."""
+    params = {'category': args['categories'], 'price': args['price'], 'badge': args['badge'], 'q': args.get('query')}
+    if args['sort'] != _default_sort(endpoint):
+        params['sort'] = args['sort']
+    if args['limit'] != PRODUCTS_PAGE_SIZE:
+        params['limit'] = args['limit']
+    params.update(overrides)
+    return url_for(endpoint, **{k: v for k, v in params.items() if v})
+
+def _default_sort(endpoint):
+    return 'relevance' if endpoint.startswith('main.search') else 'featured'
+
+def product_listing(args):
+    """
+    One page of the catalog for the listing args. Returns (products, next cursor
+    or None, total, whether total is an estimate). Served from the in-memory
+    catalog; the bestseller sort also uses the cached sales ranks.
+    """
+    snapshot = get_catalog()
+    filters = dict(categories=args['categories'], min_price=args['min_price'],
+                   max_price=args['max_price'], badge=args['badge'])
+    sales = get_sales_ranks() if args['sort'] == 'bestseller' else None
+    products, last_key, total = snapshot.page(args['sort'], args['after'], args['limit'], sales=sales, **filters)
+    is_estimate = False
+    if total is None:
+        # Counting every match would mean walking the whole ordering; the
+        # index sizes give the count (or a close estimate) for free.
+        total, exact = snapshot.estimate_count(**filters)
+        is_estimate = not exact
+    next_cursor = encode_product_cursor(last_key) if last_key is not None else None
+    return products, next_cursor, total, is_estimate
+
+def search_listing(args):
+    """Like product_listing, over the products matching ?q= (ranked, or re-sorted by ?sort=)."""
+    matches = find_products(args['query'], args['min_price'], args['max_price'])
+    if args['sort'] == 'relevance':
+        rank = {p.id: position for position, p in enumerate(matches)}
+        key = lambda p: (rank[p.id],)
+    else:
+        sales = get_sales_ranks() if args['sort'] == 'bestseller' else None
+        key = sort_key(args['sort'], sales)
+        matches = sorted(matches, key=key)
+    products, last_key = keyset_page(matches, key, args['after'], args['limit'])
+    next_cursor = encode_product_cursor(last_key) if last_key is not None else None
+    return products, next_cursor, len(matches), False
+
+def _bestseller_version():
+    """Extra ETag state: bestseller pages change when the sales ranks are reloaded."""
+    if request.args.get('sort') == 'bestseller':
+        return get_sales_ranks().version
+    return None
+
+def render_listing(endpoint, args, listing, sorts):
+    products, next_cursor, total, is_estimate = listing
+    next_url = _listing_url(endpoint, args, cursor=next_cursor) if next_cursor else None
     return render_template(
-        'products.html', products=products, cart_item_count=get_cart_count(),
-        current_user=current_user, selected_categories=selected_categories, selected_price=selected_price
+        'products.html', products=products, cart_item_count=get_cart_count(), current_user=current_user,
+        selected_categories=args['categories'], selected_price=args['price'], selected_badge=args['badge'],
+        selected_sort=args['sort'], sort_options=sorts, search_query=args.get('query'),
+        listing_url=url_for(endpoint), total=total, total_is_estimate=is_estimate, next_url=next_url,
+        next_json_url=_listing_url(endpoint + '_json', args, cursor=next_cursor) if next_cursor else None,
     )
+
+def listing_json(endpoint, args, listing):
+    products, next_cursor, total, is_estimate = listing
+    return jsonify({
+        'products': [{'id': p.id, 'name': p.name, 'category': p.category, 'price': p.price,
+                      'badge': p.badge, 'image': p.image_main} for p in products],
+        'html': ''.join(render_fragment('_product_card.html', key=p.id, product=p) for p in products),
+        'next_cursor': next_cursor,
+        'next_url': _listing_url(endpoint, args, cursor=next_cursor) if next_cursor else None,
+        'next_json_url': _listing_url(endpoint + '_json', args, cursor=next_cursor) if next_cursor else None,
+        'total': total,
+        'total_is_estimate': is_estimate,
+    })
+
+@bp.route('/products')
+@conditional_page(viewer=viewer_state, extra=_bestseller_version)
+def products_page():
+    args = _listing_args(PRODUCT_SORTS, 'featured')
+    return render_listing('main.products_page', args, product_listing(args), PRODUCT_SORTS)
+
+@bp.route('/products/page')
+@conditional_page(viewer=viewer_state, extra=_bestseller_version)
+def products_page_json():
+    """JSON product listing, one keyset page at a time (for infinite scroll; pass back `next_cursor`)."""
+    args = _listing_args(PRODUCT_SORTS, 'featured')
+    return listing_json('main.products_page', args, product_listing(args))
  
-@app.route('/product/<int:product_id>')
+@bp.route('/product/<int:product_id>')
+@conditional_page(viewer=viewer_state)
 def product_detail_page(product_id):
-    conn = get_db_connection()
-    # --- MODIFIED: Use psycopg2 cursor and %s placeholder ---
-    with conn.cursor(cursor_factory=DictCursor) as cur:
-        cur.execute('SELECT * FROM products WHERE id = %s', (product_id,))
-        product = cur.fetchone()
-    conn.close()
+    product = get_catalog().get(product_id)
     if product is None: abort(404)
     return render_template('product-detail.html', product=product, cart_item_count=get_cart_count(), current_user=current_user)
  
-# --- Static Page Routes (No DB interaction, no changes needed) ---
-@app.route('/our-story')
+# --- Static Page Routes (No DB interaction; anonymous visitors get the cached page) ---
+@bp.route('/our-story')
+@cached_page(vary=get_cart_count)
 def our_story_page():
     return render_template('our-story.html', cart_item_count=get_cart_count(), current_user=current_user)
  
-@app.route('/careers')
+@bp.route('/careers')
+@cached_page(vary=get_cart_count)
 def careers_page():
     return render_template('careers.html', cart_item_count=get_cart_count(), current_user=current_user)
  
-@app.route('/press')
+@bp.route('/press')
+@cached_page(vary=get_cart_count)
 def press_page():
     return render_template('press.html', cart_item_count=get_cart_count(), current_user=current_user)
  
-@app.route('/sustainability')
+@bp.route('/sustainability')
+@cached_page(vary=get_cart_count)
 def sustainability_page():
     return render_template('sustainability.html', cart_item_count=get_cart_count(), current_user=current_user)
  
-@app.route('/contact')
+@bp.route('/contact')
+@cached_page(vary=get_cart_count)
 def contact_page():
     return render_template('contact.html', cart_item_count=get_cart_count(), current_user=current_user)
  
-@app.route('/faq')
+@bp.route('/faq')
+@cached_page(vary=get_cart_count)
 def faq_page():
     return render_template('faq.html', cart_item_count=get_cart_count(), current_user=current_user)
  
 # --- Authentication Routes (with DB logic updated) ---
-@app.route('/signup', methods=['GET', 'POST'])
+@bp.route('/signup', methods=['GET', 'POST'])
 def signup_page():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -198,18 +413,17 @@ def signup_page():
             user = cur.fetchone()
             if user:
                 flash('Username already exists.', 'danger')
-                conn.close()
-                return redirect(url_for('signup_page'))
+                return redirect(url_for('main.signup_page'))
             
             password_hash = generate_password_hash(password)
-            cur.execute('INSERT INTO users (username, password_hash) VALUES (%s, %s)', (username, password_hash))
+            cur.execute('INSERT INTO users (username, password_hash) VALUES (%s, %s) RETURNING id', (username, password_hash))
+            invalidate_user(cur.fetchone()[0], conn)
             conn.commit()
-        conn.close()
         flash('Account created successfully! Please log in.', 'success')
-        return redirect(url_for('login_page'))
+        return redirect(url_for('main.login_page'))
     return render_template('signup.html', cart_item_count=get_cart_count(), current_user=current_user)
  
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login_page():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -219,151 +433,247 @@ def login_page():
         with conn.cursor(cursor_factory=DictCursor) as cur:
             cur.execute('SELECT * FROM users WHERE username = %s', (username,))
             user_data = cur.fetchone()
-        conn.close()
         
         if user_data and check_password_hash(user_data['password_hash'], password):
             user_to_login = User(id=user_data['id'], username=user_data['username'], password_hash=user_data['password_hash'])
             login_user(user_to_login)
-            return redirect(url_for('home'))
+            return redirect(url_for('main.home'))
         else:
             flash('Invalid username or password.', 'danger')
-            return redirect(url_for('login_page'))
+            return redirect(url_for('main.login_page'))
     return render_template('login.html', cart_item_count=get_cart_count(), current_user=current_user)
  
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
+    # The cart belongs to the account now; the next visitor on this browser starts empty.
+    session.pop('cart_id', None)
+    session.pop('cart_rev', None)
     flash('You have been logged out.', 'info')
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
  
-# Note: The original file has two different save_order functions. I've updated both.
-# The `save_order_for_user` function seems unused by the checkout flow, but is updated for consistency.
-def save_order_for_user(user_id, cart):
-    conn = get_db_connection()
-    with conn.cursor() as cur:
-        # Note: NOW() is PostgreSQL for current timestamp
-        cur.execute('INSERT INTO orders (user_id, date) VALUES (%s, NOW()) RETURNING id', (user_id,))
-        order_id = cur.fetchone()[0]
-        for item in cart.values():
-            cur.execute('INSERT INTO order_items (order_id, product_id, name, size, quantity, price) VALUES (%s, %s, %s, %s, %s, %s)',
-                        (order_id, item['id'], item['name'], item.get('size'), item['quantity'], item['price']))
-        conn.commit()
-    conn.close()
- 
-def get_orders_for_user(user_id):
+ORDERS_PAGE_SIZE = 10
+ORDERS_MAX_PAGE_SIZE = 50
+
+def encode_order_cursor(order_date, order_id):
+    """Keyset cursor for order history: the (order_date, id) of the last order shown."""
+    return f"{order_date.isoformat()}_{order_id}"
+
+def decode_order_cursor(cursor):
+    """Parses a cursor from encode_order_cursor; raises ValueError if it is malformed."""
+    order_date, _, order_id = cursor.rpartition('_')
+    return datetime.fromisoformat(order_date), int(order_id)
+
+def get_orders_for_user(user_id, cursor=None, limit=ORDERS_PAGE_SIZE):
+    """
+    Returns one page of a user's orders (newest first) and the cursor for the next page.
+
+    Orders and their items come back from a single query: the page of orders is
+    selected by keyset on (order_date, id), then joined to its items and grouped here.
+    """
+    conditions = ['user_id = %s']
+    params = [user_id]
+    if cursor:
+        before_date, before_id = decode_order_cursor(cursor)
+        conditions.append('(order_date, id) < (%s, %s)')
+        params.extend([before_date, before_id])
+    params.append(limit + 1)  # one extra row tells us whether another page exists
+
     conn = get_db_connection()
-    orders = []
     with conn.cursor(cursor_factory=DictCursor) as cur:
-        cur.execute('SELECT * FROM orders WHERE user_id = %s ORDER BY order_date DESC', (user_id,))
-        order_rows = cur.fetchall()
-        for order_row in order_rows:
-            cur.execute('SELECT * FROM order_items WHERE order_id = %s', (order_row['id'],))
-            items = cur.fetchall()
-            
+        cur.execute(f'''
+            WITH page AS (
+                SELECT id, order_date, total_amount, status
+                FROM orders
+                WHERE {' AND '.join(conditions)}
+                ORDER BY order_date DESC, id DESC
+                LIMIT %s
+            )
+            SELECT page.id, page.order_date, page.total_amount, page.status,
+                   oi.id AS item_id, oi.product_id, oi.product_name, oi.product_price,
+                   oi.quantity, oi.size, oi.image
+            FROM page
+            LEFT JOIN order_items oi ON oi.order_id = page.id
+            ORDER BY page.order_date DESC, page.id DESC, oi.id
+        ''', params)
+        rows = cur.fetchall()
+
+    orders = []
+    for row in rows:
+        if not orders or orders[-1]['details']['id'] != row['id']:
             orders.append({
                 'details': {
-                    'id': order_row['id'],
-                    'order_date': order_row['order_date'],
-                    'total_amount': order_row['total_amount'],
-                    'status': order_row['status']
+                    'id': row['id'],
+                    'order_date': row['order_date'],
+                    'total_amount': row['total_amount'],
+                    'status': row['status']
                 },
-                'items': items
+                'items': []
             })
-    conn.close()
-    return orders
- 
-@app.route('/account')
+        if row['item_id'] is not None:
+            orders[-1]['items'].append({
+                'id': row['item_id'],
+                'product_id': row['product_id'],
+                'product_name': row['product_name'],
+                'product_price': row['product_price'],
+                'quantity': row['quantity'],
+                'size': row['size'],
+                'image': row['image']
+            })
+
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        last = orders[-1]['details']
+        next_cursor = encode_order_cursor(last['order_date'], last['id'])
+    return orders, next_cursor
+
+def _order_page_args():
+    """Reads ?cursor= and ?limit= for order history, rejecting malformed values."""
+    cursor = request.args.get('cursor') or None
+    limit = request.args.get('limit', ORDERS_PAGE_SIZE, type=int)
+    if cursor:
+        try:
+            decode_order_cursor(cursor)
+        except ValueError:
+            abort(400)
+    return cursor, max(1, min(limit, ORDERS_MAX_PAGE_SIZE))
+
+@bp.route('/account')
 @login_required
 def account_page():
-    orders = get_orders_for_user(current_user.id)
-    return render_template('account.html', cart_item_count=get_cart_count(), current_user=current_user, orders=orders)
- 
-def update_order_status_in_background(order_id):
-    import time
-    time.sleep(5)
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute('UPDATE orders SET status = %s WHERE id = %s', ('Shipped', order_id))
-            conn.commit()
-    finally:
-        conn.close()
+    cursor, limit = _order_page_args()
+    orders, next_cursor = get_orders_for_user(current_user.id, cursor=cursor, limit=limit)
+    return render_template('account.html', cart_item_count=get_cart_count(), current_user=current_user,
+                           orders=orders, next_cursor=next_cursor, is_first_page=cursor is None)
+
+@bp.route('/account/orders')
+@login_required
+def account_orders_json():
+    """JSON order history, one keyset page at a time (pass back `next_cursor`)."""
+    cursor, limit = _order_page_args()
+    orders, next_cursor = get_orders_for_user(current_user.id, cursor=cursor, limit=limit)
+    for order in orders:
+        details = order['details']
+        details['order_date'] = details['order_date'].isoformat()
+        details['total_amount'] = float(details['total_amount']) if details['total_amount'] is not None else None
+        for item in order['items']:
+            item['product_price'] = float(item['product_price']) if item['product_price'] is not None else None
+    return jsonify({'orders': orders, 'next_cursor': next_cursor})
  
-@app.route('/cart')
+@bp.route('/cart')
 def cart_page():
-    cart_items = session.get('cart', {}).values()
+    cart_items = get_cart_lines()
     total_price = sum(item['price'] * item['quantity'] for item in cart_items)
-    return render_template('cart.html', cart_items=list(cart_items), total_price=total_price, cart_item_count=get_cart_count(), current_user=current_user)
+    return render_template('cart.html', cart_items=cart_items, total_price=total_price, cart_item_count=len(cart_items), current_user=current_user)
  
-@app.route('/add_to_cart', methods=['POST'])
+@bp.route('/add_to_cart', methods=['POST'])
 def add_to_cart():
-    product_id = request.form.get('product_id')
-    selected_size = request.form.get('selected_size')
-    cart = session.get('cart', {})
-    product_id_str = str(product_id)
-    found = False
-    for key, item in cart.items():
-        if item['id'] == int(product_id) and item.get('size') == selected_size:
-            cart[key]['quantity'] += 1
-            found = True
-            break
-    if not found:
-        conn = get_db_connection()
-        # --- MODIFIED: Use psycopg2 cursor and %s placeholder ---
-        with conn.cursor(cursor_factory=DictCursor) as cur:
-            cur.execute('SELECT * FROM products WHERE id = %s', (product_id,))
-            product = cur.fetchone()
-        conn.close()
-        
-        if product:
-            cart_key = f"{product_id_str}_{selected_size}"
-            cart[cart_key] = {
-                'id': product['id'],
-                'name': product['name'],
-                'price': float(product['price']),
-                'image': product['image_main'],
-                'quantity': 1,
-                'size': selected_size
-            }
-    session['cart'] = cart
-    session.modified = True
-    return redirect(url_for('cart_page'))
- 
-@app.route('/update_cart/<int:product_id>', methods=['POST'])
+    product_id = request.form.get('product_id', type=int)
+    selected_size = request.form.get('selected_size') or ''
+    product = get_catalog().get(product_id) if product_id is not None else None
+    if product:
+        cart_id, revision = _session_cart()
+        if cart_id is None:
+            cart_id = session['cart_id'] = new_cart_id()
+        _set_cart_revision(cart_store.add(cart_id, revision, product.id, selected_size))
+    return redirect(url_for('main.cart_page'))
+ 
+@bp.route('/update_cart/<int:product_id>', methods=['POST'])
 def update_cart(product_id):
-    product_id_str = str(product_id)
     quantity = int(request.form.get('quantity', 1))
-    cart = session.get('cart', {})
-    for key in list(cart.keys()):
-        if str(cart[key]['id']) == product_id_str:
-            if quantity > 0:
-                cart[key]['quantity'] = quantity
-            else:
-                cart.pop(key)
-            break
-    session['cart'] = cart
-    session.modified = True
-    return redirect(url_for('cart_page'))
+    size = request.form.get('size')  # None (older forms): every size of the product
+    cart_id, revision = _session_cart()
+    if cart_id:
+        _set_cart_revision(cart_store.set_quantity(cart_id, revision, product_id, size, quantity))
+    return redirect(url_for('main.cart_page'))
  
-@app.route('/remove_from_cart/<int:product_id>')
+@bp.route('/remove_from_cart/<int:product_id>')
 def remove_from_cart(product_id):
-    cart = session.get('cart', {})
-    product_id_str = str(product_id)
-    keys_to_remove = [key for key in cart if str(cart[key]['id']) == product_id_str]
-    for key in keys_to_remove:
-        cart.pop(key)
-    session['cart'] = cart
-    session.modified = True
-    return redirect(url_for('cart_page'))
- 
-@app.route('/checkout', methods=['GET', 'POST'])
+    cart_id, revision = _session_cart()
+    if cart_id:
+        _set_cart_revision(cart_store.set_quantity(cart_id, revision, product_id, request.args.get('size'), 0))
+    return redirect(url_for('main.cart_page'))
+ 
+def place_order(cur, user_id, items, idempotency_key, customer_name, shipping_address, city, postal_code, payment_method):
+    """
+    Inserts an order and all of its line items in a single statement (one round-trip).
+
+    Line items travel as parallel arrays and are expanded with unnest(). If an order with
+    the same (user_id, idempotency_key) already exists, nothing is inserted and the
+    existing order's id is returned instead. A new order also gets its delayed
+    'ship_order' job (tasks.py) and its quantities added to product_sales (the
+    bestseller ranking) in the same statement. Returns (order_id, created).
+    """
+    items = list(items)
+    total_amount = sum(item['price'] * item['quantity'] for item in items)
+    cur.execute(f'''
+        WITH new_order AS (
+            INSERT INTO orders (user_id, order_date, total_amount, status, customer_name, shipping_address,
+                                city, postal_code, payment_method, idempotency_key)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (user_id, idempotency_key) DO NOTHING
+            RETURNING id
+        ), new_items AS (
+            INSERT INTO order_items (order_id, product_id, product_name, product_price, quantity, size, image)
+            SELECT new_order.id, i.product_id, i.product_name, i.product_price, i.quantity, i.size, i.image
+            FROM new_order,
+                 unnest(%s::int[], %s::text[], %s::numeric[], %s::int[], %s::text[], %s::text[])
+                     AS i(product_id, product_name, product_price, quantity, size, image)
+            RETURNING product_id, quantity
+        ), sales AS (
+            INSERT INTO product_sales (product_id, units_sold)
+            SELECT product_id, SUM(quantity) FROM new_items
+            GROUP BY product_id
+            ORDER BY product_id  -- a fixed lock order, so concurrent checkouts cannot deadlock
+            ON CONFLICT (product_id) DO UPDATE SET units_sold = product_sales.units_sold + EXCLUDED.units_sold
+        ), ship_job AS (
+            {jobs.enqueue_sql("json_build_object('order_id', new_order.id)", source='new_order')}
+        )
+        SELECT id FROM new_order
+    ''', (
+        user_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), total_amount, 'Packed', customer_name,
+        shipping_address, city, postal_code, payment_method, idempotency_key,
+        [item['id'] for item in items],
+        [item['name'] for item in items],
+        [item['price'] for item in items],
+        [item['quantity'] for item in items],
+        [item.get('size') for item in items],
+        [item.get('image') for item in items],
+        tasks.SHIP_ORDER, tasks.SHIP_DELAY_SECONDS, jobs.DEFAULT_MAX_ATTEMPTS,
+    ))
+    row = cur.fetchone()
+    if row:
+        return row[0], True
+    # Duplicate submission: the first request already placed this order.
+    return find_order_by_idempotency_key(cur, user_id, idempotency_key), False
+
+def find_order_by_idempotency_key(cur, user_id, idempotency_key):
+    """Id of the order the user placed with this checkout token, or None."""
+    cur.execute('SELECT id FROM orders WHERE user_id = %s AND idempotency_key = %s', (user_id, idempotency_key))
+    row = cur.fetchone()
+    return row[0] if row else None
+ 
+@bp.route('/checkout', methods=['GET', 'POST'])
 @login_required
 def checkout_page():
-    cart = session.get('cart', {})
-    if not cart:
+    # One key per rendered checkout form; a double-click or retry re-sends the same key.
+    checkout_token = request.form.get('checkout_token') if request.method == 'POST' else None
+    if checkout_token:
+        # A retry that arrives after the first submission committed finds the
+        # cart already cleared; send it to the order it placed.
+        with get_db_connection().cursor() as cur:
+            order_id = find_order_by_idempotency_key(cur, current_user.id, checkout_token)
+        if order_id is not None:
+            session['last_order_id'] = order_id
+            session.pop('checkout_token', None)
+            return redirect(url_for('main.checkout_success'))
+
+    cart_items = get_cart_lines()
+    if not cart_items:
         flash("Your cart is empty.", "info")
-        return redirect(url_for('products_page'))
+        return redirect(url_for('main.products_page'))
  
     if request.method == 'POST':
         customer_name = request.form.get('customer_name')
@@ -371,50 +681,49 @@ def checkout_page():
         city = request.form.get('city')
         postal_code = request.form.get('postal_code')
         payment_method = request.form.get('payment_method')
+        idempotency_key = checkout_token or secrets.token_urlsafe(16)
         conn = get_db_connection()
-        new_order_id = None
         try:
             with conn.cursor() as cur:
-                total_amount = sum(item['price'] * item['quantity'] for item in cart.values())
-                # --- MODIFIED: Use RETURNING id to get the new order's ID ---
-                cur.execute(
-                    'INSERT INTO orders (user_id, order_date, total_amount, status, customer_name, shipping_address, city, postal_code, payment_method) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id',
-                    (current_user.id, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), total_amount, 'Packed', customer_name, shipping_address, city, postal_code, payment_method)
+                order_id, _created = place_order(
+                    cur, current_user.id, cart_items, idempotency_key,
+                    customer_name, shipping_address, city, postal_code, payment_method
                 )
-                new_order_id = cur.fetchone()[0] # Fetch the returned ID
-                
-                for item in cart.values():
-                    cur.execute(
-                        'INSERT INTO order_items (order_id, product_id, product_name, product_price, quantity, size, image) VALUES (%s, %s, %s, %s, %s, %s, %s)',
-                        (new_order_id, item['id'], item['name'], item['price'], item['quantity'], item.get('size'), item.get('image'))
-                    )
                 conn.commit()
         except psycopg2.Error as e: # Catch psycopg2 errors
             conn.rollback()
-            print(f"DB error during checkout: {e}")
+            logger.exception("DB error during checkout: %s", e)
             flash('There was an error placing your order. Please try again.', 'danger')
-            return redirect(url_for('cart_page'))
-        finally:
-            conn.close()
- 
-        if new_order_id:
-            thread = threading.Thread(target=update_order_status_in_background, args=(new_order_id,), daemon=True)
-            thread.start()
+            return redirect(url_for('main.cart_page'))
  
-        session['ordered_items'] = list(cart.values())
-        session.pop('cart', None)
-        return redirect(url_for('checkout_success'))
+        cart_id, revision = _session_cart()
+        _set_cart_revision(cart_store.clear(cart_id, revision))
+        session['last_order_id'] = order_id
+        session.pop('checkout_token', None)
+        return redirect(url_for('main.checkout_success'))
  
-    cart_items = list(cart.values())
     total_price = sum(item['price'] * item['quantity'] for item in cart_items)
-    return render_template('checkout.html', cart_items=cart_items, total_price=total_price, cart_item_count=len(cart_items), current_user=current_user)
+    checkout_token = session.setdefault('checkout_token', secrets.token_urlsafe(16))
+    return render_template('checkout.html', cart_items=cart_items, total_price=total_price, cart_item_count=len(cart_items),
+                           current_user=current_user, checkout_token=checkout_token)
  
-@app.route('/checkout-success')
+@bp.route('/checkout-success')
 @login_required
 def checkout_success():
-    ordered_items = session.pop('ordered_items', [])
+    order_id = session.pop('last_order_id', None)
+    if order_id is None:
+        return redirect(url_for('main.home'))
+    conn = get_db_connection()
+    with conn.cursor(cursor_factory=DictCursor) as cur:
+        cur.execute('''
+            SELECT oi.product_name AS name, oi.product_price AS price, oi.quantity, oi.size, oi.image
+            FROM order_items oi JOIN orders o ON o.id = oi.order_id
+            WHERE oi.order_id = %s AND o.user_id = %s
+            ORDER BY oi.id
+        ''', (order_id, current_user.id))
+        ordered_items = cur.fetchall()
     if not ordered_items:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     return render_template('checkout-success.html', ordered_items=ordered_items, cart_item_count=0, current_user=current_user)
  
 # --- CHATBOT SECTION (with DB logic updated) ---
@@ -423,8 +732,6 @@ def checkout_success():
 # START: UPGRADED CHATBOT LOGIC (DATABASE-CONNECTED & AI-POWERED)
 # ===================================================================
 
-import re # Make sure 're' is imported at the top of your app.py file
-
 # --- TOOL 1: DATABASE FUNCTION FOR PRODUCT SEARCHES ---
 def search_products_db(query: str = None, min_price: float = None, max_price: float = None):
     """
@@ -432,37 +739,16 @@ def search_products_db(query: str = None, min_price: float = None, max_price: fl
     a minimum price, a maximum price, or any combination of these.
     This is a tool for the AI chatbot.
     """
-    conn = get_db_connection() # Connects to your Render PostgreSQL database
-    
-    # Start building the SQL query dynamically and safely
-    base_query = "SELECT name, price, category, description FROM products"
-    conditions = []
-    params = []
+    return describe_products(chat_product_matches(query, min_price, max_price), query, min_price, max_price)
 
+def chat_product_matches(query=None, min_price=None, max_price=None):
+    """Up to 5 products for a chat search (always limited, to avoid overwhelming the AI)."""
     if query:
-        conditions.append("(name ILIKE %s OR category ILIKE %s)")
-        params.extend([f"%{query}%", f"%{query}%"])
-    
-    if min_price is not None:
-        conditions.append("price >= %s")
-        params.append(min_price)
-        
-    if max_price is not None:
-        conditions.append("price <= %s")
-        params.append(max_price)
-
-    # Combine conditions if any exist
-    if conditions:
-        base_query += " WHERE " + " AND ".join(conditions)
-    
-    base_query += " LIMIT 5" # Always limit results to avoid overwhelming the AI
-
-    # Execute the query against the live database
-    with conn.cursor(cursor_factory=DictCursor) as cur:
-        cur.execute(base_query, params)
-        products = cur.fetchall()
-    conn.close()
+        return find_products(query, min_price=min_price, max_price=max_price, limit=5)
+    return get_catalog().search(min_price=min_price, max_price=max_price, limit=5)
 
+def describe_products(products, query=None, min_price=None, max_price=None):
+    """The search tool's text for `products`, or a "not found" message naming the criteria."""
     if not products:
         # Provide a more helpful "not found" message
         search_term = f"matching '{query}'" if query else ""
@@ -479,7 +765,7 @@ def search_products_db(query: str = None, min_price: float = None, max_price: fl
     # Format the results into a clean string for the AI to understand
     results_string = "I found these products:\n"
     for p in products:
-        results_string += f"- Name: {p['name']}, Category: {p['category']}, Price: ₹{float(p['price']):.2f}\n"
+        results_string += f"- Name: {p.name}, Category: {p.category}, Price: ₹{p.price:.2f}\n"
     return results_string
 
 # --- TOOL 2: DATABASE FUNCTION FOR ORDER STATUS ---
@@ -488,111 +774,180 @@ def get_order_status_db(order_id: int, user_id: int):
     Gets the status and details of a specific order for a given user from the Render database.
     This is a tool for the AI chatbot.
     """
-    conn = get_db_connection() # Connects to your Render PostgreSQL database
+    conn = get_db_connection() # Borrows the request's pooled connection
     with conn.cursor(cursor_factory=DictCursor) as cur:
         cur.execute("SELECT id, status, order_date, total_amount FROM orders WHERE id = %s AND user_id = %s", (order_id, user_id))
         order = cur.fetchone()
-    conn.close()
 
     if not order:
-        return f"I couldn't find any order with the ID #{order_id} for this user. They might have the wrong ID or are not logged in."
+        return f"I couldn't find order #{order_id} on your account. Please check the order number on your account page."
 
     # Format the result into a clean string for the AI to understand
     return f"Order #{order['id']} Status: {order['status']}, Order Date: {order['order_date'].strftime('%Y-%m-%d')}, Total: ₹{float(order['total_amount']):.2f}."
 
-# --- FALLBACK: SIMPLE RULE-BASED CHAT ---
+# --- LOCAL ANSWERS: FAQ, PRODUCT AND ORDER QUESTIONS WITHOUT THE MODEL ---
+def local_chat_answer(message, user):
+    """An intents.LocalAnswer for questions the FAQ knowledge base or a direct lookup can answer, else None."""
+    tools = chat_tools(user)
+    snapshot = get_catalog()
+
+    def search(query, min_price, max_price):
+        # None when the words matched nothing: the engine then leaves the question to the model.
+        products = chat_product_matches(query, min_price, max_price)
+        if query and not products:
+            return None
+        return describe_products(products, query, min_price, max_price)
+
+    return intents.get_engine().answer(
+        message, user,
+        search=search,
+        order_status=lambda order_id: tools['get_order_status'](order_id=order_id),
+        categories=snapshot.by_category.keys(),
+        product_names=intents.product_names(snapshot),
+    )
+
 def rule_based_chat(message, user):
-    """Handles simple, fixed questions for a fast, free response."""
-    message = message.lower().strip()
-    if "hello" in message or "hi" in message: return "Hello! 👋 I'm the FITX Bot. How can I help you with our footwear today?"
-    if "shipping" in message: return "We provide shipping across India. Delivery usually takes 3–5 working days."
-    if "return" in message or "refund" in message: return "We accept returns within 30 days of delivery for unused items in their original packaging."
-    if "contact" in message: return "You can reach our human team via the 'Contact Us' page on our website."
-    return None
+    """Handles common questions for a fast, free response."""
+    answer = local_chat_answer(message, user)
+    return answer.text if answer else None
 
 # --- THE "BRAIN": MAIN AI LOGIC WITH TOOL-USING CAPABILITIES ---
-def process_chat_message(message, user):
-    """
-    Processes a user's message using the Gemini API, decides if a database tool is needed,
-    executes it against the Render DB, and then generates a final natural language response.
-    """
-    system_prompt = f"""
-You are FITX Bot, a helpful and friendly e-commerce assistant for a shoe store.
-Your goal is to answer the user's question about the store's products and their orders.
+USER_SPECIFIC_TOOLS = {'get_order_status'}  # answers using these are never cached
 
-Today's Date: {datetime.now().strftime('%Y-%m-%d')}
+CHAT_BUSY_REPLY = "⚠️ Our AI assistant is currently busy. Please try again in a moment."
+CHAT_UNAVAILABLE_REPLY = ("⚠️ Our AI assistant is taking a short break. I can still help with shipping, "
+                          "returns and contact details, or you can browse our products directly.")
+CHAT_RATE_LIMITED_REPLY = "You're sending messages a little too quickly. Please wait a moment and try again."
 
-TOOLS AVAILABLE:
-1. search_products(query: str = None, min_price: float = None, max_price: float = None): Use this to search for products. You can search by a text query, a price range, or both. For example, to find shoes under 10000, call it with max_price=10000. To find 'running shoes' over 8000, call it with query='running shoes' and min_price=8000.
-2. get_order_status(order_id: int): Use this to get the status of a specific order for a logged-in user.
+def chat_tools(user):
+    """The tool implementations the chat model may call, bound to the current user."""
+    def search_products(query=None, min_price=None, max_price=None):
+        min_price = float(min_price) if min_price is not None else None
+        max_price = float(max_price) if max_price is not None else None
+        # Product results don't depend on the user, so they are shared across chats.
+        version = get_catalog().version
+        result = chat_cache.get_search_result(query, min_price, max_price, version)
+        if result is None:
+            result = search_products_db(query=query, min_price=min_price, max_price=max_price)
+            chat_cache.store_search_result(query, min_price, max_price, version, result)
+        return result
 
-USER CONTEXT:
-- The user is {'LOGGED IN as user_id ' + str(user.id) if user.is_authenticated else 'NOT LOGGED IN'}.
+    def get_order_status(order_id):
+        if not user.is_authenticated:
+            return "The user is not logged in, so their orders can't be looked up."
+        return get_order_status_db(order_id=int(order_id), user_id=user.id)
 
-INSTRUCTIONS:
-1. **CRITICAL RULE:** Your ONLY purpose is to assist with the FITX shoe store. If the user asks any question that is NOT about our products, their orders, shipping, or store policies (e.g., asking for jokes, math problems, general knowledge, other companies), you MUST politely refuse. A perfect refusal is: "I'm the FITX Bot, and my expertise is limited to our products and your orders. How can I help you with our footwear today?"
-2. Analyze the user's question to see if it's related to our store.
-3. If you need to look up product information (like price or availability), respond ONLY with: [TOOL_CALL] search_products(...)
-4. If you need to look up an order status, respond ONLY with: [TOOL_CALL] get_order_status(...)
-5. If the question is simple and on-topic (e.g., "What are your return policies?"), you can answer it directly.
-6. If you call a tool, I will provide the result, and you must then formulate a final, friendly answer to the user based on that information.
-"""
+    return {'search_products': search_products, 'get_order_status': get_order_status}
 
-    initial_prompt = f"{system_prompt}\nUser's Question: \"{message}\"\n\nYour Response:"
-    
-    try:
-        model = genai.GenerativeModel("gemini-1.5-flash-latest")
-        initial_response = model.generate_content(initial_prompt)
-        ai_decision = initial_response.text.strip()
+def stream_chat_message(message, user, stream=True):
+    """
+    Runs the chat pipeline and yields events as they happen:
+      ('token', text)  a piece of the answer
+      ('tool', name)   a database tool is being called
+      ('error', text)  the model failed after part of the answer was sent
 
-        if ai_decision.startswith("[TOOL_CALL]"):
-            print(f"AI decided to call a tool: {ai_decision}")
-            tool_result = ""
-            
-            tool_match = re.search(r'search_products\((.*?)\)', ai_decision)
-            order_match = re.search(r'get_order_status\(order_id=(\d+)\)', ai_decision)
-
-            if tool_match:
-                args_str = tool_match.group(1)
-                query_arg = re.search(r'query="([^"]+)"', args_str)
-                min_price_arg = re.search(r'min_price=([\d\.]+)', args_str)
-                max_price_arg = re.search(r'max_price=([\d\.]+)', args_str)
-                
-                query = query_arg.group(1) if query_arg else None
-                min_price = float(min_price_arg.group(1)) if min_price_arg else None
-                max_price = float(max_price_arg.group(1)) if max_price_arg else None
-                
-                tool_result = search_products_db(query=query, min_price=min_price, max_price=max_price)
-                
-            elif order_match:
-                if not user.is_authenticated:
-                    return "You need to be logged in for me to check your order status."
-                order_id = int(order_match.group(1))
-                tool_result = get_order_status_db(order_id=order_id, user_id=user.id)
-            else:
-                tool_result = "An error occurred trying to use that tool."
+    The model calls tools natively (see chatbot.py); text is passed through chunk by
+    chunk. Answers that did not use a per-user tool are cached (chat_cache.py).
+    """
+    catalog_version = get_catalog().version
+    cached = chat_cache.get_answer(message, catalog_version, user.is_authenticated)
+    if cached:
+        intents.record_resolution('cache')
+        yield 'token', cached
+        return
 
-            final_prompt = f"{system_prompt}\nUser's Question: \"{message}\"\nYou decided to call a tool. Here is the result from the database:\n[TOOL_RESULT]\n{tool_result}\n\nNow, please provide a final, friendly, and natural-sounding answer to the user based on this information."
-            final_response = model.generate_content(final_prompt)
-            return final_response.text.strip()
-        else:
-            return ai_decision
+    answer, cacheable, resolution = [], True, 'model'
+    for kind, data in _generate_chat_events(message, user, stream):
+        if kind == 'fallback':
+            # A canned answer after a model failure: send it, but don't cache it.
+            kind, cacheable, resolution = 'token', False, 'fallback'
+        elif kind == 'error' or (kind == 'tool' and data in USER_SPECIFIC_TOOLS):
+            cacheable = False
+        if kind == 'token':
+            answer.append(data)
+        yield kind, data
+    intents.record_resolution(resolution)
+    if cacheable:
+        chat_cache.store_answer(message, catalog_version, user.is_authenticated, ''.join(answer).strip())
 
-    except Exception as e:
-        print(f"Gemini API Error in process_chat_message: {e}")
-        return rule_based_chat(message, user) or "I'm sorry, I had a little trouble processing that. Could you try asking in a different way?"
+def _generate_chat_events(message, user, stream):
+    """
+    The uncached pipeline behind stream_chat_message; yields 'fallback' instead of
+    'token' for canned answers. Model calls go through chat_guard: at most a few
+    run at once per process, and while the circuit breaker is open the model is
+    skipped and the rule-based answers are used instead.
+    """
+    if model_breaker.state == 'open':
+        yield 'fallback', rule_based_chat(message, user) or CHAT_UNAVAILABLE_REPLY
+        return
+    if not model_gate.acquire():
+        yield 'fallback', CHAT_BUSY_REPLY
+        return
+
+    emitted, outcome = False, None
+    try:
+        if not model_breaker.allow():
+            # Half-open and another request is already probing the model.
+            yield 'fallback', rule_based_chat(message, user) or CHAT_UNAVAILABLE_REPLY
+            return
+        try:
+            for kind, data in chatbot.run_chat(message, user, chat_tools(user), stream=stream):
+                emitted = emitted or kind == 'token'
+                yield kind, data
+            outcome = 'success'
+            model_breaker.record_success()
+        except Exception as e:
+            outcome = 'failure'
+            model_breaker.record_failure()
+            logger.exception("Gemini API error in process_chat_message: %s", e)
+            if emitted:
+                yield 'error', "I'm sorry, I lost my train of thought. Could you ask that again?"
+            else:
+                yield 'fallback', rule_based_chat(message, user) or "I'm sorry, I had a little trouble processing that. Could you try asking in a different way?"
+    finally:
+        if outcome is None:
+            model_breaker.record_cancelled()
+        model_gate.release()
+
+def process_chat_message(message, user):
+    """
+    Processes a user's message using the chat model, which calls database tools as
+    needed before giving a final natural language response (non-streaming).
+    """
+    return ''.join(data for kind, data in stream_chat_message(message, user, stream=False) if kind == 'token').strip()
 
 # --- FLASK ROUTE: THE CHATBOT ENDPOINT ---
-@app.route('/chatbot', methods=['POST'])
+def chat_client_key():
+    """Rate-limit key: the user id when logged in, otherwise the client's address."""
+    if current_user.is_authenticated:
+        return f"user:{current_user.id}"
+    # remote_addr is the client as seen by our own proxies (ProxyFix in create_app);
+    # the leftmost X-Forwarded-For entry is whatever the client chose to send.
+    return f"ip:{request.remote_addr}"
+
+def chat_rate_limited_response():
+    """A 429 reply when the client has used up its chat allowance, else None."""
+    if rate_limiter.allow(chat_client_key()):
+        return None
+    response = jsonify({'response': CHAT_RATE_LIMITED_REPLY})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, round(1 / rate_limiter.rate))) if rate_limiter.rate else '60'
+    return response
+
+@bp.route('/chatbot', methods=['POST'])
 def chatbot_response():
     user_message = request.json.get('message', '').strip()
     if not user_message:
         return jsonify({'response': "Please type something."})
+    limited = chat_rate_limited_response()
+    if limited:
+        return limited
     
-    # First, try the simple rule-based chat for instant answers
-    rule_response = rule_based_chat(user_message, current_user)
-    if rule_response:
-        return jsonify({'response': rule_response})
+    # First, try the local FAQ/product/order answers, which need no model call
+    local = local_chat_answer(user_message, current_user)
+    if local:
+        intents.record_resolution('local', local.intent)
+        return jsonify({'response': local.text})
     
     # If no rule matches, use the advanced AI logic
     try:
@@ -600,37 +955,71 @@ def chatbot_response():
         if not bot_response: raise ValueError("Empty response from Gemini")
         return jsonify({'response': bot_response})
     except Exception as e:
-        print(f"Major error in /chatbot route: {e}")
+        logger.exception("Major error in /chatbot route: %s", e)
         return jsonify({'response': "⚠️ Our AI assistant is currently busy. Please try again in a moment."})
 
+def sse_event(event, data):
+    """Formats one Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# --- FLASK ROUTE: STREAMING CHATBOT ENDPOINT (SERVER-SENT EVENTS) ---
+@bp.route('/chatbot/stream', methods=['POST'])
+def chatbot_stream():
+    """
+    Same pipeline as /chatbot, but answers arrive as `token` events while the model
+    is still generating, followed by a final `done` event.
+    """
+    user_message = (request.get_json(silent=True) or {}).get('message', '').strip()
+    user = current_user._get_current_object()
+    limited = user_message and chat_rate_limited_response()
+    if limited:
+        return limited
+
+    def events():
+        if not user_message:
+            yield sse_event('token', {'text': "Please type something."})
+        elif (local := local_chat_answer(user_message, user)):
+            intents.record_resolution('local', local.intent)
+            yield sse_event('token', {'text': local.text})
+        else:
+            for kind, data in stream_chat_message(user_message, user):
+                if kind == 'tool':
+                    yield sse_event('tool', {'name': data})
+                else:
+                    yield sse_event(kind, {'text': data})
+        yield sse_event('done', {})
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # ===================================================================
 # END: UPGRADED CHATBOT LOGIC
 # ===================================================================
  # --- Search Route (with DB logic updated) ---
-@app.route('/search')
+@bp.route('/search')
+@conditional_page(viewer=viewer_state, extra=_bestseller_version)
 def search():
     query = request.args.get('q', '')
     if not query:
         # Redirect to the products page if the search query is empty
-        return redirect(url_for('products_page'))
-        
-    conn = get_db_connection()
-    # --- MODIFIED: Use psycopg2 cursor and %s placeholder ---
-    with conn.cursor(cursor_factory=DictCursor) as cur:
-        # Use ILIKE for case-insensitive searching in PostgreSQL
-        cur.execute("SELECT * FROM products WHERE name ILIKE %s", ('%' + query + '%',))
-        products = cur.fetchall()
-    conn.close()
-    return render_template(
-        'products.html',
-        products=products,
-        cart_item_count=get_cart_count(),
-        current_user=current_user,
-        selected_categories=[],
-        selected_price=None
-    )
+        return redirect(url_for('main.products_page'))
+
+    args = _listing_args(SEARCH_SORTS, 'relevance')
+    args['query'] = query
+    return render_listing('main.search', args, search_listing(args), SEARCH_SORTS)
+
+@bp.route('/search/page')
+@conditional_page(viewer=viewer_state, extra=_bestseller_version)
+def search_json():
+    """JSON search results, one keyset page at a time (pass back `next_cursor`)."""
+    query = request.args.get('q', '')
+    if not query:
+        abort(400)
+    args = _listing_args(SEARCH_SORTS, 'relevance')
+    args['query'] = query
+    return listing_json('main.search', args, search_listing(args))
 # --- WISHLIST ROUTES (with DB logic updated) ---
-@app.route('/wishlist')
+@bp.route('/wishlist')
 @login_required
 def wishlist():
     conn = get_db_connection()
@@ -642,10 +1031,9 @@ def wishlist():
             WHERE w.user_id = %s
         ''', (current_user.id,))
         products = cur.fetchall()
-    conn.close()
     return render_template('wishlist.html', products=products, cart_item_count=get_cart_count())
  
-@app.route('/add_to_wishlist', methods=['POST'])
+@bp.route('/add_to_wishlist', methods=['POST'])
 @login_required
 def add_to_wishlist():
     product_id = request.form.get('product_id')
@@ -660,13 +1048,12 @@ def add_to_wishlist():
                     ON CONFLICT (user_id, product_id) DO NOTHING
                 ''', (current_user.id, product_id))
                 conn.commit()
-            conn.close()
             flash('Product added to wishlist!', 'success')
         except psycopg2.Error as e: # Catch psycopg2 errors
             flash(f'Error adding to wishlist: {e}', 'danger')
-    return redirect(request.referrer or url_for('home'))
+    return redirect(request.referrer or url_for('main.home'))
  
-@app.route('/remove_from_wishlist', methods=['POST'])
+@bp.route('/remove_from_wishlist', methods=['POST'])
 @login_required
 def remove_from_wishlist():
     product_id = request.form.get('product_id')
@@ -677,10 +1064,60 @@ def remove_from_wishlist():
                 cur.execute('DELETE FROM wishlist WHERE user_id = %s AND product_id = %s',
                              (current_user.id, product_id))
                 conn.commit()
-            conn.close()
             flash('Product removed from wishlist!', 'success')
         except psycopg2.Error as e: # Catch psycopg2 errors
             flash(f'Error removing from wishlist: {e}', 'danger')
-    return redirect(url_for('wishlist'))
- 
+    return redirect(url_for('main.wishlist'))
+
+
+# --- Application Factory ---
+def create_app():
+    """Builds the storefront app: configuration, middleware, extensions and the views above."""
+    # JSON logs through a background writer (see log_config.py).
+    log_config.configure_logging()
+
+    app = Flask(__name__)
+    # IMPORTANT FIX: Use a *separate* secret key for Flask sessions.
+    app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'your_super_secret_fallback_key_CHANGE_THIS_IN_PROD')
+
+    # WhiteNoise serves static/ with the correct prefix; content-hashed build
+    # output (build_images.py, build_assets.py) is cached for a year as immutable.
+    app.wsgi_app = WhiteNoise(app.wsgi_app, root=STATIC_ROOT, prefix="static/",
+                              immutable_file_test=images.is_immutable_asset)
+    # Behind a load balancer or reverse proxy, set TRUSTED_PROXY_HOPS to the number
+    # of proxies in front of the app so request.remote_addr (used by the chat rate
+    # limit) is the address the outermost proxy saw, not a client-supplied header.
+    trusted_hops = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+    if trusted_hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_hops, x_proto=trusted_hops)
+
+    # Request timing, Server-Timing headers and /metrics (see metrics.py).
+    metrics.init_app(app)
+    # Request ids on log records and X-Request-ID responses.
+    log_config.init_app(app)
+
+    login_manager.init_app(app)
+    user_logged_in.connect(claim_cart_on_login, app)
+    user_loaded_from_cookie.connect(claim_cart_on_login, app)
+    app.teardown_appcontext(release_db_connection)
+    app.jinja_env.globals.update(render_fragment=render_fragment, picture=images.picture, asset_urls=asset_urls)
+    app.register_blueprint(bp)
+
+    # The Gemini client itself is configured on the first chat message (chat_models.py).
+    if not os.environ.get('GEMINI_API_KEY'):
+        logger.error("GEMINI_API_KEY not found in environment variables. Chatbot will not work.")
+    return app
+
+
+_app = None
+
 
+def __getattr__(name):
+    # `gunicorn app:app`, `flask run` and the benchmark scripts look up `app.app`;
+    # build it on that first lookup rather than on import.
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
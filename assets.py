@@ -0,0 +1,55 @@
+# assets.py
+# Fingerprinted CSS/JS bundles, as written by build_assets.py.
+#
+# BUNDLES lists the source files that make up each bundle. After the build
+# step, `asset_urls(name)` (a template global) returns the single hashed
+# bundle URL, which WhiteNoise serves precompressed and immutable; without a
+# build it returns the source files' URLs, so development needs no build.
+
+import json
+import os
+
+from flask import url_for
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+MANIFEST_PATH = os.path.join(STATIC_DIR, 'build', 'assets', 'manifest.json')
+
+# bundle name -> source files (relative to static/), in load order
+BUNDLES = {
+    'site.css': ('assets/css/navbar.css', 'assets/css/style.css', 'assets/css/chatbot.css'),
+    'site.js': ('assets/js/navbar.js', 'assets/js/chatbot.js'),
+    'main.js': ('assets/js/main.js',),
+}
+
+_manifest = None
+_manifest_mtime = None
+
+
+def load_manifest():
+    """{'version': ..., 'bundles': {name: path}}, re-read when the build step rewrites it."""
+    global _manifest, _manifest_mtime
+    try:
+        mtime = os.path.getmtime(MANIFEST_PATH)
+    except OSError:
+        mtime = None
+    if _manifest is None or mtime != _manifest_mtime:
+        try:
+            with open(MANIFEST_PATH, encoding='utf-8') as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+        _manifest_mtime = mtime
+    return _manifest
+
+
+def asset_urls(name):
+    """URLs to include for bundle `name`: the built bundle, or its sources when there is none."""
+    built = load_manifest().get('bundles', {}).get(name)
+    if built:
+        return [url_for('static', filename=built)]
+    return [url_for('static', filename=source) for source in BUNDLES[name]]
+
+
+def assets_version():
+    """Identifies the current build ('' without one); part of page ETags, see http_cache.py."""
+    return load_manifest().get('version', '')
@@ -0,0 +1,216 @@
+# bench_storefront.py
+# End-to-end benchmark of the storefront routes, driven through the WSGI app
+# in-process at a fixed concurrency.
+#
+# For every route it records latency percentiles, throughput, status codes and
+# queries per request (statements counted by db.py's connections on the
+# request's thread), and can write the results as JSON so runs can be compared
+# before and after a change.
+#
+# Seed a local database first, e.g.:
+#     DATABASE_URL=postgres://... python create_db.py --products 5000 --users 500 --orders-per-user 20
+# then:
+#     python bench_storefront.py --concurrency 8 --requests 300 --output before.json
+#     ... make a change ...
+#     python bench_storefront.py --concurrency 8 --requests 300 --output after.json --compare before.json
+#
+# Logged-in routes use the seeded bench users (bench_user_<n>, see create_db.py).
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+SEARCH_TERMS = ['running', 'sneaker', 'leather', 'trail', 'hiking boot', 'sandal', 'runer', 'gym', 'classic', 'pro']
+SIZES = ['UK 7', 'UK 8', 'UK 9', 'UK 10']
+
+# name -> function(rng, product_ids) returning (method, path, form data or None).
+SCENARIOS = {
+    'home': lambda rng, ids: ('GET', '/', None),
+    'products': lambda rng, ids: ('GET', '/products', None),
+    'products_category': lambda rng, ids: ('GET', '/products?category=' + rng.choice(['Men', 'Women', 'Unisex']), None),
+    'products_price': lambda rng, ids: ('GET', '/products?price=' + rng.choice(['0-7000', '7000-10000', '10000-20000']), None),
+    'products_combined': lambda rng, ids: ('GET', '/products?category=Women&category=Unisex&price=7000-15000&badge=Bestseller', None),
+    'product_detail': lambda rng, ids: ('GET', f'/product/{rng.choice(ids)}', None),
+    'search': lambda rng, ids: ('GET', '/search?q=' + rng.choice(SEARCH_TERMS), None),
+    'add_to_cart': lambda rng, ids: ('POST', '/add_to_cart', {'product_id': rng.choice(ids), 'selected_size': rng.choice(SIZES)}),
+    'update_cart': lambda rng, ids: ('POST', f'/update_cart/{ids[0]}', {'quantity': rng.randint(1, 3)}),
+    'checkout': lambda rng, ids: ('GET', '/checkout', None),
+    'account': lambda rng, ids: ('GET', '/account', None),
+    'wishlist': lambda rng, ids: ('GET', '/wishlist', None),
+}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class VirtualUser:
+    """One logged-in browser session with a few items in its cart."""
+
+    def __init__(self, app, username, password, product_ids):
+        self.client = app.test_client()
+        response = self.client.post('/login', data={'username': username, 'password': password})
+        if response.status_code != 302 or self.client.get('/account').status_code != 200:
+            raise RuntimeError(f"Could not log in as {username!r}; seed users with create_db.py --users N")
+        # update_cart and checkout need a non-empty cart.
+        for product_id in product_ids[:3]:
+            self.client.post('/add_to_cart', data={'product_id': product_id, 'selected_size': SIZES[0]})
+
+    def request(self, method, path, data):
+        if method == 'POST':
+            response = self.client.post(path, data=data)
+        else:
+            response = self.client.get(path)
+        response.get_data()  # consume streamed bodies
+        return response.status_code
+
+
+def run_scenario(users, scenario, product_ids, requests, warmup, seed):
+    """Runs one route at len(users) concurrency; returns its result dict."""
+    import db
+    make_request = SCENARIOS[scenario]
+    lock = threading.Lock()
+    remaining = [warmup + requests]
+    latencies, queries, statuses, errors = [], [], {}, []
+
+    def worker(user, worker_seed):
+        rng = random.Random(worker_seed)
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+                measured = remaining[0] < requests
+            method, path, data = make_request(rng, product_ids)
+            db.reset_query_count()
+            start = time.perf_counter()
+            try:
+                status = user.request(method, path, data)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{path}: {e!r}")
+                continue
+            elapsed = time.perf_counter() - start
+            if measured:
+                with lock:
+                    latencies.append(elapsed)
+                    queries.append(db.query_count())
+                    statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=worker, args=(user, seed * 1000 + i), daemon=True)
+               for i, user in enumerate(users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda pct: round(percentile(latencies, pct) * 1000, 2)
+    return {
+        'requests': len(latencies),
+        'errors': len(errors) + sum(n for status, n in statuses.items() if status >= 500),
+        'first_error': errors[0] if errors else None,
+        'status_counts': {str(k): v for k, v in sorted(statuses.items())},
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else 0.0,
+        'latency_ms': {'p50': ms(50), 'p95': ms(95), 'p99': ms(99),
+                       'mean': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+                       'max': round(latencies[-1] * 1000, 2) if latencies else 0.0},
+        'queries_per_request': {'mean': round(sum(queries) / len(queries), 2) if queries else 0.0,
+                                'max': max(queries) if queries else 0},
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    header = f"{'route':20} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'q/req':>6} {'errors':>6}"
+    print(header)
+    print('-' * len(header))
+    for route, r in results['routes'].items():
+        lat = r['latency_ms']
+        print(f"{route:20} {r['throughput_rps']:9.1f} {lat['p50']:8.2f} {lat['p95']:8.2f} {lat['p99']:8.2f} "
+              f"{r['queries_per_request']['mean']:6.2f} {r['errors']:6d}")
+        old = (baseline or {}).get('routes', {}).get(route)
+        if old:
+            change = lambda new, before: f"{(new - before) / before:+.0%}" if before else 'n/a'
+            print(f"{'  vs baseline':20} {change(r['throughput_rps'], old['throughput_rps']):>9} "
+                  f"{change(lat['p50'], old['latency_ms']['p50']):>8} {change(lat['p95'], old['latency_ms']['p95']):>8} "
+                  f"{change(lat['p99'], old['latency_ms']['p99']):>8} "
+                  f"{r['queries_per_request']['mean'] - old['queries_per_request']['mean']:+6.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the storefront routes in-process.")
+    parser.add_argument('--routes', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200, help="Measured requests per route.")
+    parser.add_argument('--warmup', type=int, default=20, help="Unmeasured requests per route first.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--user-prefix', default='bench_user_')
+    parser.add_argument('--password', default='benchmark')
+    parser.add_argument('--output', help="Write the results as JSON to this file.")
+    parser.add_argument('--compare', help="A previous --output file to compare against.")
+    args = parser.parse_args()
+
+    os.environ.setdefault('JOBS_IN_PROCESS', '0')  # no background job polling skewing the numbers
+    import app as storefront
+    from catalog import get_catalog
+
+    app = storefront.create_app()
+    with app.app_context():
+        product_ids = [p.id for p in get_catalog().products]
+    if not product_ids:
+        sys.exit("The catalog is empty; seed the database with create_db.py first.")
+    rng = random.Random(args.seed)
+    users = [VirtualUser(app, f'{args.user_prefix}{i + 1}', args.password, rng.sample(product_ids, 3))
+             for i in range(args.concurrency)]
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'catalog_size': len(product_ids),
+            'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'password')},
+        },
+        'routes': {},
+    }
+    for route in args.routes:
+        results['routes'][route] = run_scenario(users, route, product_ids, args.requests, args.warmup, args.seed)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    for route, r in results['routes'].items():
+        if r['first_error']:
+            print(f"{route}: first error: {r['first_error']}", file=sys.stderr)
+    return 1 if any(r['errors'] for r in results['routes'].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
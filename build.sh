@@ -4,4 +4,7 @@ set -o errexit
 
 pip install -r requirements.txt
 
+python build_images.py
+python build_assets.py
+
 python create_db.py
\ No newline at end of file
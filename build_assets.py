@@ -0,0 +1,122 @@
+# build_assets.py
+# Build step for the storefront's CSS and JavaScript.
+#
+# Concatenates and minifies each bundle in assets.BUNDLES, writes it to
+# static/build/assets/ under a content-hashed name with gzip and (if the
+# `brotli` package is installed) brotli siblings, and records the names in
+# static/build/assets/manifest.json for assets.asset_urls. WhiteNoise serves
+# the .br/.gz files to clients that accept them, and the hashed names are
+# cached as immutable (see app.py), so repeat visits re-download nothing
+# until a file changes.
+#
+#     python build_assets.py
+#
+# The minifiers are deliberately conservative (comments and whitespace only):
+# no renaming, no rewriting of strings, regexes or template literals.
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+
+from assets import BUNDLES, MANIFEST_PATH, STATIC_DIR
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+OUTPUT_DIR = 'build/assets'  # relative to static/
+
+_CSS_STRING = r'"(?:\\.|[^"\\])*"' + r"|'(?:\\.|[^'\\])*'"
+_CSS_STRING_RE = re.compile(f'({_CSS_STRING})')
+# Strings are matched too, so that a "/*" inside one is not taken for a comment.
+_CSS_COMMENT_RE = re.compile(rf'({_CSS_STRING})|/\*.*?\*/', re.S)
+_CSS_SPACE_RE = re.compile(r'\s+')
+_CSS_PUNCT_RE = re.compile(r'\s*([{};,>])\s*')
+
+
+def _squeeze_css(text):
+    text = _CSS_SPACE_RE.sub(' ', text)
+    text = _CSS_PUNCT_RE.sub(r'\1', text)
+    return text.replace(';}', '}')
+
+
+def minify_css(text):
+    """Drops comments and collapses whitespace; string literals ("...", '...') are left as they are."""
+    text = _CSS_COMMENT_RE.sub(lambda m: m.group(1) or '', text)
+    # re.split with a group alternates code and strings: code at even indexes.
+    parts = _CSS_STRING_RE.split(text)
+    return ''.join(part if i % 2 else _squeeze_css(part) for i, part in enumerate(parts)).strip()
+
+
+def minify_js(text):
+    """Drops indentation, blank lines and whole-line comments; keeps line breaks (ASI)."""
+    lines, in_block_comment = [], False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if in_block_comment:
+            in_block_comment = '*/' not in stripped
+            continue
+        if stripped.startswith('/*'):
+            in_block_comment = '*/' not in stripped
+            continue
+        if not stripped or stripped.startswith('//'):
+            continue
+        lines.append(stripped)
+    return '\n'.join(lines)
+
+
+def build_bundle(name, sources):
+    """Writes one bundle (plus compressed siblings); returns (static-relative path, raw size, built size)."""
+    minify = minify_css if name.endswith('.css') else minify_js
+    parts, raw_size = [], 0
+    for source in sources:
+        with open(os.path.join(STATIC_DIR, source), encoding='utf-8') as f:
+            text = f.read()
+        raw_size += len(text.encode('utf-8'))
+        # A newline (and for JS a semicolon) between files keeps one file's last
+        # statement from running into the next file's first.
+        parts.append(minify(text) + (';' if name.endswith('.js') else ''))
+    data = '\n'.join(parts).encode('utf-8')
+
+    stem, ext = os.path.splitext(name)
+    relative = f"{OUTPUT_DIR}/{stem}.{hashlib.sha1(data).hexdigest()[:12]}{ext}"
+    path = os.path.join(STATIC_DIR, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    with open(path + '.gz', 'wb') as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + '.br', 'wb') as f:
+            f.write(brotli.compress(data, quality=11))
+    return relative, raw_size, len(data)
+
+
+def main():
+    if brotli is None:
+        print("brotli is not installed; writing gzip variants only.", file=sys.stderr)
+    bundles = {}
+    for name, sources in BUNDLES.items():
+        relative, raw_size, size = build_bundle(name, sources)
+        bundles[name] = relative
+        print(f"{name}: {len(sources)} files, {raw_size / 1024:.1f} KB -> {size / 1024:.1f} KB ({relative})")
+
+    # Remove bundles from earlier builds (and their compressed siblings).
+    keep = {os.path.basename(p) for p in bundles.values()} | {os.path.basename(MANIFEST_PATH)}
+    output_root = os.path.join(STATIC_DIR, OUTPUT_DIR)
+    for file_name in os.listdir(output_root):
+        if re.sub(r'\.(gz|br)$', '', file_name) not in keep:
+            os.remove(os.path.join(output_root, file_name))
+
+    version = hashlib.sha1(json.dumps(bundles, sort_keys=True).encode()).hexdigest()[:12]
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'bundles': bundles}, f, indent=1, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
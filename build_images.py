@@ -0,0 +1,202 @@
+# build_images.py
+# Build step for the storefront's raster images.
+#
+# For every JPEG/PNG under static/assets it writes resized variants (AVIF and
+# WebP at several widths, plus one re-encoded fallback in the original format)
+# to static/build/images/ under content-hashed names, and records them in
+# static/build/images/manifest.json keyed on the source path as the templates
+# and the database know it ("assets/products/1.jpeg"). images.py reads the
+# manifest to emit <picture>/srcset markup; the hashed names let WhiteNoise
+# serve the files with far-future immutable caching.
+#
+# Run it after changing images (build.sh runs it on deploy):
+#     python build_images.py
+#     python build_images.py --formats webp --widths 320 640   # quicker
+# Sources whose content has not changed since the last build are skipped.
+
+import argparse
+import concurrent.futures
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+
+from PIL import Image, ImageOps, features
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+SOURCE_DIRS = ('assets/products', 'assets/images')
+OUTPUT_DIR = 'build/images'  # relative to static/
+MANIFEST_NAME = 'manifest.json'
+
+DEFAULT_WIDTHS = (160, 320, 480, 640, 960, 1280, 1600)
+MAX_WIDTH = DEFAULT_WIDTHS[-1]
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# format -> (Pillow format name, file extension, save options)
+ENCODERS = {
+    'avif': ('AVIF', 'avif', {'quality': 55, 'speed': 6}),
+    'webp': ('WEBP', 'webp', {'quality': 78, 'method': 6}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', 'png', {'optimize': True}),
+}
+
+
+def slugify(relative_path):
+    """'assets/products/1 thumb-3 .jpeg' -> 'products/1-thumb-3' (no spaces or odd characters)."""
+    stem = os.path.splitext(relative_path)[0]
+    if stem.startswith('assets/'):
+        stem = stem[len('assets/'):]
+    parts = [re.sub(r'[^a-z0-9]+', '-', part.lower()).strip('-') or 'image' for part in stem.split('/')]
+    return '/'.join(parts)
+
+
+def file_sha1(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def target_widths(original_width, widths):
+    """The requested widths narrower than the original, plus the original (capped at MAX_WIDTH)."""
+    top = min(original_width, MAX_WIDTH)
+    return sorted({w for w in widths if w < top} | {top})
+
+
+def encode(image, fmt):
+    """Encodes `image` as `fmt`; returns the bytes."""
+    pil_format, _ext, options = ENCODERS[fmt]
+    if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def write_hashed(data, slug, width, fmt):
+    """Writes `data` as build/images/<slug>-<width>.<hash>.<ext>; returns that static-relative path."""
+    digest = hashlib.sha1(data).hexdigest()[:12]
+    relative = f"{OUTPUT_DIR}/{slug}-{width}.{digest}.{ENCODERS[fmt][1]}"
+    path = os.path.join(STATIC_DIR, relative)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+    return relative
+
+
+def build_entry(relative_source, formats, widths):
+    """Generates every variant of one source image; returns its manifest entry."""
+    with Image.open(os.path.join(STATIC_DIR, relative_source)) as opened:
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+    fallback_format = 'png' if image.mode in ('RGBA', 'LA', 'P') else 'jpeg'
+    if image.mode == 'P':
+        image = image.convert('RGBA')
+    slug = slugify(relative_source)
+    original_width, original_height = image.size
+
+    variants = {}
+    for width in target_widths(original_width, widths):
+        height = max(1, round(original_height * width / original_width))
+        resized = image if width == original_width else image.resize((width, height), Image.LANCZOS)
+        for fmt in formats:
+            variants.setdefault(fmt, []).append([width, write_hashed(encode(resized, fmt), slug, width, fmt)])
+        if width == min(original_width, MAX_WIDTH):
+            fallback = write_hashed(encode(resized, fallback_format), slug, width, fallback_format)
+
+    display_width = min(original_width, MAX_WIDTH)
+    return {
+        'width': display_width,
+        'height': max(1, round(original_height * display_width / original_width)),
+        'fallback': fallback,
+        'variants': variants,
+    }
+
+
+def find_sources():
+    for source_dir in SOURCE_DIRS:
+        for root, _dirs, files in os.walk(os.path.join(STATIC_DIR, source_dir)):
+            for name in sorted(files):
+                if name.lower().endswith(SOURCE_EXTENSIONS):
+                    yield os.path.relpath(os.path.join(root, name), STATIC_DIR).replace(os.sep, '/')
+
+
+def manifest_path():
+    return os.path.join(STATIC_DIR, OUTPUT_DIR, MANIFEST_NAME)
+
+
+def remove_orphans(manifest):
+    """Deletes files in the output directory that the manifest no longer references."""
+    keep = {MANIFEST_NAME}
+    for entry in manifest.values():
+        keep.add(entry['fallback'][len(OUTPUT_DIR) + 1:])
+        for variants in entry['variants'].values():
+            keep.update(path[len(OUTPUT_DIR) + 1:] for _width, path in variants)
+    output_root = os.path.join(STATIC_DIR, OUTPUT_DIR)
+    removed = 0
+    for root, _dirs, files in os.walk(output_root):
+        for name in files:
+            relative = os.path.relpath(os.path.join(root, name), output_root).replace(os.sep, '/')
+            if relative not in keep:
+                os.remove(os.path.join(root, name))
+                removed += 1
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build resized, content-hashed image variants and their manifest.")
+    parser.add_argument('--formats', nargs='+', choices=['avif', 'webp'], default=['avif', 'webp'])
+    parser.add_argument('--widths', nargs='+', type=int, default=list(DEFAULT_WIDTHS))
+    parser.add_argument('--force', action='store_true', help="Rebuild every image, even unchanged ones.")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help="Parallel encoder processes.")
+    args = parser.parse_args()
+
+    formats = [fmt for fmt in args.formats if features.check(fmt)]
+    for fmt in set(args.formats) - set(formats):
+        print(f"Skipping {fmt}: this Pillow build cannot encode it.", file=sys.stderr)
+
+    try:
+        with open(manifest_path(), encoding='utf-8') as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = {}
+
+    build_options = {'formats': formats, 'widths': sorted(args.widths)}
+    manifest, pending = {}, {}
+    for source in find_sources():
+        source_hash = file_sha1(os.path.join(STATIC_DIR, source))
+        old = previous.get(source)
+        if not args.force and old and old.get('source_sha1') == source_hash and old.get('options') == build_options:
+            manifest[source] = old
+        else:
+            pending[source] = source_hash
+
+    # Encoding (AVIF especially) is CPU-bound; one process per core.
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(build_entry, source, formats, args.widths): source for source in pending}
+        for future in concurrent.futures.as_completed(futures):
+            source = futures[future]
+            try:
+                entry = future.result()
+            except OSError as e:
+                print(f"Skipping {source}: {e}", file=sys.stderr)
+                continue
+            entry.update(source_sha1=pending[source], options=build_options)
+            manifest[source] = entry
+    built = sum(1 for source in pending if source in manifest)
+
+    os.makedirs(os.path.dirname(manifest_path()), exist_ok=True)
+    with open(manifest_path(), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    removed = remove_orphans(manifest)
+
+    source_bytes = sum(os.path.getsize(os.path.join(STATIC_DIR, s)) for s in manifest)
+    print(f"{len(manifest)} images ({built} rebuilt, {removed} stale files removed); "
+          f"sources {source_bytes / 1e6:.1f} MB -> {os.path.join('static', OUTPUT_DIR, MANIFEST_NAME)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,230 @@
+# carts.py
+# Server-side shopping carts.
+#
+# A cart is a map of (product_id, size) -> quantity stored under an opaque cart
+# id; the browser's session only carries that id (plus a short revision tag,
+# see below). Names, prices and images are looked up in the catalog when the
+# cart is shown, so they are never stale copies.
+#
+# Backends (CART_BACKEND):
+#   postgres  `carts` / `cart_items` tables (see migrations/); the default
+#             when DATABASE_URL is set
+#   memory    a process-local dict, for development without a database
+#
+# CartStore puts a write-through, in-process cache in front of the backend.
+# Each write gets a new revision tag that is stored in the cache entry and in
+# the user's session; a worker whose cached copy has a different tag than the
+# session (because another worker served the last write) reloads it from the
+# backend, so cached carts are never shown stale.
+
+import os
+import secrets
+import threading
+
+from cache import TTLCache
+
+MAX_QUANTITY = 10
+
+
+def new_cart_id():
+    return secrets.token_urlsafe(16)
+
+
+class MemoryCartBackend:
+    """Carts in a process-local dict. Not shared between workers."""
+
+    def __init__(self):
+        self._carts = {}    # cart_id -> {(product_id, size): quantity}
+        self._owners = {}   # user_id -> cart_id
+        self._lock = threading.Lock()
+
+    def load(self, cart_id):
+        with self._lock:
+            return dict(self._carts.get(cart_id, {}))
+
+    def add(self, cart_id, product_id, size, quantity):
+        with self._lock:
+            items = self._carts.setdefault(cart_id, {})
+            items[(product_id, size)] = min(items.get((product_id, size), 0) + quantity, MAX_QUANTITY)
+            return items[(product_id, size)]
+
+    def set_quantity(self, cart_id, product_id, size, quantity):
+        with self._lock:
+            items = self._carts.get(cart_id, {})
+            for key in [k for k in items if k[0] == product_id and (size is None or k[1] == size)]:
+                if quantity > 0:
+                    items[key] = min(quantity, MAX_QUANTITY)
+                else:
+                    del items[key]
+
+    def clear(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+    def claim(self, cart_id, user_id):
+        """Gives the anonymous cart `cart_id` (may be None) to a user; returns the user's cart id."""
+        with self._lock:
+            owned = self._owners.get(user_id)
+            if owned is None:
+                if cart_id is not None:
+                    self._owners[user_id] = cart_id
+                return cart_id
+            if cart_id is not None and cart_id != owned:
+                target = self._carts.setdefault(owned, {})
+                for key, quantity in self._carts.pop(cart_id, {}).items():
+                    target[key] = min(target.get(key, 0) + quantity, MAX_QUANTITY)
+            return owned
+
+
+class PostgresCartBackend:
+    """
+    Carts in PostgreSQL. `get_conn` returns the connection to use (the web app
+    passes its request-scoped connection); each write commits.
+    """
+
+    def __init__(self, get_conn):
+        self._get_conn = get_conn
+
+    def load(self, cart_id):
+        with self._get_conn().cursor() as cur:
+            cur.execute('SELECT product_id, size, quantity FROM cart_items WHERE cart_id = %s', (cart_id,))
+            return {(product_id, size): quantity for product_id, size, quantity in cur.fetchall()}
+
+    def add(self, cart_id, product_id, size, quantity):
+        conn = self._get_conn()
+        with conn.cursor() as cur:
+            # The cart row is created on first use; one round-trip either way.
+            cur.execute('''
+                WITH cart AS (
+                    INSERT INTO carts (id) VALUES (%s)
+                    ON CONFLICT (id) DO UPDATE SET updated_at = NOW()
+                )
+                INSERT INTO cart_items (cart_id, product_id, size, quantity) VALUES (%s, %s, %s, %s)
+                ON CONFLICT (cart_id, product_id, size)
+                DO UPDATE SET quantity = LEAST(cart_items.quantity + EXCLUDED.quantity, %s)
+                RETURNING quantity
+            ''', (cart_id, cart_id, product_id, size, min(quantity, MAX_QUANTITY), MAX_QUANTITY))
+            new_quantity = cur.fetchone()[0]
+        conn.commit()
+        return new_quantity
+
+    def set_quantity(self, cart_id, product_id, size, quantity):
+        conn = self._get_conn()
+        condition, params = 'cart_id = %s AND product_id = %s', [cart_id, product_id]
+        if size is not None:
+            condition += ' AND size = %s'
+            params.append(size)
+        with conn.cursor() as cur:
+            if quantity > 0:
+                cur.execute(f'UPDATE cart_items SET quantity = %s WHERE {condition}',
+                            [min(quantity, MAX_QUANTITY)] + params)
+            else:
+                cur.execute(f'DELETE FROM cart_items WHERE {condition}', params)
+        conn.commit()
+
+    def clear(self, cart_id):
+        conn = self._get_conn()
+        with conn.cursor() as cur:
+            # Keep the cart row itself: a logged-in user's cart stays theirs.
+            cur.execute('DELETE FROM cart_items WHERE cart_id = %s', (cart_id,))
+        conn.commit()
+
+    def claim(self, cart_id, user_id):
+        conn = self._get_conn()
+        with conn.cursor() as cur:
+            cur.execute('SELECT id FROM carts WHERE user_id = %s', (user_id,))
+            row = cur.fetchone()
+            if row is None:
+                if cart_id is not None:
+                    cur.execute('''INSERT INTO carts (id, user_id) VALUES (%s, %s)
+                                   ON CONFLICT (id) DO UPDATE SET user_id = EXCLUDED.user_id, updated_at = NOW()''',
+                                (cart_id, user_id))
+                owned = cart_id
+            else:
+                owned = row[0]
+                if cart_id is not None and cart_id != owned:
+                    cur.execute('''
+                        WITH moved AS (DELETE FROM carts WHERE id = %s AND user_id IS NULL RETURNING id),
+                             items AS (SELECT product_id, size, quantity FROM cart_items
+                                       WHERE cart_id = (SELECT id FROM moved))
+                        INSERT INTO cart_items (cart_id, product_id, size, quantity)
+                        SELECT %s, product_id, size, quantity FROM items
+                        ON CONFLICT (cart_id, product_id, size)
+                        DO UPDATE SET quantity = LEAST(cart_items.quantity + EXCLUDED.quantity, %s)
+                    ''', (cart_id, owned, MAX_QUANTITY))
+        conn.commit()
+        return owned
+
+
+class CartStore:
+    """A backend behind a write-through cache of cart_id -> (revision, items)."""
+
+    def __init__(self, backend, maxsize=10000, ttl=600):
+        self.backend = backend
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, name='carts')
+
+    def items(self, cart_id, revision):
+        """{(product_id, size): quantity} for the cart; treat it as read-only."""
+        entry = self._cache.get(cart_id)
+        if entry is not None and entry[0] == revision:
+            return entry[1]
+        items = self.backend.load(cart_id)
+        self._cache.set(cart_id, (revision, items))
+        return items
+
+    def _write(self, cart_id, revision, apply):
+        """Updates the cached copy after a backend write; returns the new revision."""
+        entry = self._cache.get(cart_id)
+        if entry is not None and entry[0] == revision:
+            items = dict(entry[1])
+            apply(items)
+        else:
+            items = self.backend.load(cart_id)
+        new_revision = secrets.token_hex(4)
+        self._cache.set(cart_id, (new_revision, items))
+        return new_revision
+
+    def add(self, cart_id, revision, product_id, size, quantity=1):
+        new_quantity = self.backend.add(cart_id, product_id, size, quantity)
+        return self._write(cart_id, revision, lambda items: items.__setitem__((product_id, size), new_quantity))
+
+    def set_quantity(self, cart_id, revision, product_id, size, quantity):
+        """Sets (or with quantity <= 0 removes) a line; size None means every size of the product."""
+        self.backend.set_quantity(cart_id, product_id, size, quantity)
+
+        def apply(items):
+            for key in [k for k in items if k[0] == product_id and (size is None or k[1] == size)]:
+                if quantity > 0:
+                    items[key] = min(quantity, MAX_QUANTITY)
+                else:
+                    del items[key]
+        return self._write(cart_id, revision, apply)
+
+    def clear(self, cart_id, revision):
+        self.backend.clear(cart_id)
+        return self._write(cart_id, revision, dict.clear)
+
+    def claim(self, cart_id, user_id):
+        """Merges an anonymous cart into the user's; returns (cart_id or None, revision)."""
+        owned = self.backend.claim(cart_id, user_id)
+        if cart_id is not None:
+            self._cache.invalidate(cart_id)
+        if owned is None:
+            return None, None
+        self._cache.invalidate(owned)
+        return owned, secrets.token_hex(4)
+
+    def stats(self):
+        return self._cache.stats()
+
+
+def create_cart_store(get_conn):
+    """The store selected by CART_BACKEND; `get_conn` supplies connections for the postgres backend."""
+    default = 'postgres' if os.environ.get('DATABASE_URL') else 'memory'
+    backend_name = os.environ.get('CART_BACKEND', default).lower()
+    backend = PostgresCartBackend(get_conn) if backend_name == 'postgres' else MemoryCartBackend()
+    return CartStore(
+        backend,
+        maxsize=int(os.environ.get('CART_CACHE_SIZE', 10000)),
+        ttl=float(os.environ.get('CART_CACHE_TTL', 600)),
+    )
@@ -0,0 +1,392 @@
+# catalog.py
+# Process-local, read-only snapshot of the `products` table.
+#
+# The catalog is small and read-mostly, so every worker keeps the whole table
+# in memory with a few secondary indexes and answers catalog reads without
+# touching PostgreSQL. `catalog_state.version` is bumped by a trigger on
+# `products` (see migrations/), which also sends NOTIFY catalog_changed; each
+# worker reloads on that notification, and a background poller checks the
+# version as a fallback in case a notification is missed.
+
+import bisect
+import logging
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import psycopg2
+
+from cache import TTLCache
+from db import PoolTimeout, get_pool
+from pg_listener import listener
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CHANNEL = 'catalog_changed'
+
+PRODUCT_COLUMNS = (
+    'id', 'name', 'category', 'price', 'mrp', 'description', 'style_code',
+    'origin', 'image_main', 'image_thumb1', 'image_thumb2', 'image_thumb3',
+    'image_thumb4', 'badge', 'colors_available',
+)
+
+
+class Product(NamedTuple):
+    """One immutable row of the `products` table. Prices are plain floats."""
+    id: int
+    name: str
+    category: Optional[str]
+    price: float
+    mrp: Optional[float]
+    description: Optional[str]
+    style_code: Optional[str]
+    origin: Optional[str]
+    image_main: Optional[str]
+    image_thumb1: Optional[str]
+    image_thumb2: Optional[str]
+    image_thumb3: Optional[str]
+    image_thumb4: Optional[str]
+    badge: Optional[str]
+    colors_available: Optional[int]
+
+    @classmethod
+    def from_row(cls, row):
+        values = dict(zip(PRODUCT_COLUMNS, row))
+        values['price'] = float(values['price'])
+        if values['mrp'] is not None:
+            values['mrp'] = float(values['mrp'])
+        return cls(**values)
+
+
+class CatalogSnapshot:
+    """An immutable set of products plus the indexes the storefront queries need."""
+
+    def __init__(self, products, version, updated_at=None):
+        self.version = version
+        self.loaded_at = time.time()
+        # When this version was written (epoch seconds), the same in every worker.
+        self.updated_at = updated_at if updated_at is not None else self.loaded_at
+        self.products = tuple(sorted(products, key=lambda p: p.id))
+        self.by_id = {p.id: p for p in self.products}
+
+        by_category, by_badge = {}, {}
+        for p in self.products:
+            by_category.setdefault(p.category, []).append(p)
+            if p.badge:
+                by_badge.setdefault(p.badge, []).append(p)
+        self.by_category = {k: tuple(v) for k, v in by_category.items()}
+        self.by_badge = {k: tuple(v) for k, v in by_badge.items()}
+
+        # Parallel arrays for price range queries via bisect.
+        self.by_price = tuple(sorted(self.products, key=lambda p: (p.price, p.id)))
+        self.price_keys = [p.price for p in self.by_price]
+        self._orderings = {}  # sort -> (sales version, products in that order)
+
+    def __len__(self):
+        return len(self.products)
+
+    def get(self, product_id):
+        return self.by_id.get(product_id)
+
+    def with_badge(self, badge, limit=None):
+        items = self.by_badge.get(badge, ())
+        return list(items[:limit] if limit is not None else items)
+
+    def in_price_range(self, min_price=None, max_price=None):
+        lo = 0 if min_price is None else bisect.bisect_left(self.price_keys, min_price)
+        hi = len(self.price_keys) if max_price is None else bisect.bisect_right(self.price_keys, max_price)
+        return self.by_price[lo:hi]
+
+    def search(self, query=None, min_price=None, max_price=None, fields=('name',), limit=None):
+        """Case-insensitive substring match over the given fields, with optional price bounds."""
+        pool = self.in_price_range(min_price, max_price) if (min_price is not None or max_price is not None) else self.products
+        needle = query.lower() if query else None
+        result = []
+        for p in sorted(pool, key=lambda p: p.id):
+            if needle and not any(needle in (getattr(p, f) or '').lower() for f in fields):
+                continue
+            result.append(p)
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+    # --- Sorted listings with keyset pagination ---
+    def ordering(self, sort, sales=None):
+        """Every product in `sort` order (see SORT_KEYS), built once per snapshot (and sales refresh)."""
+        version = sales.version if sort == 'bestseller' and sales is not None else None
+        cached = self._orderings.get(sort)
+        if cached is None or cached[0] != version:
+            if sort == 'featured':
+                ordered = self.products
+            elif sort == 'newest':
+                ordered = self.products[::-1]
+            elif sort == 'price_asc':
+                ordered = self.by_price
+            elif sort == 'price_desc':
+                ordered = self.by_price[::-1]
+            else:
+                ordered = tuple(sorted(self.products, key=sort_key(sort, sales)))
+            cached = self._orderings[sort] = (version, ordered)
+        return cached[1]
+
+    def _smallest_candidates(self, categories, min_price, max_price, badge):
+        """The smallest index slice covering the filters, or None when nothing is filtered."""
+        candidates = []
+        if categories:
+            candidates.append([p for c in dict.fromkeys(categories) for p in self.by_category.get(c, ())])
+        if badge:
+            candidates.append(self.by_badge.get(badge, ()))
+        if min_price is not None or max_price is not None:
+            candidates.append(self.in_price_range(min_price, max_price))
+        return min(candidates, key=len) if candidates else None
+
+    def page(self, sort='featured', after=None, limit=24, categories=None, min_price=None, max_price=None,
+             badge=None, sales=None):
+        """
+        One page of the products matching the filters, in `sort` order, starting
+        after the sort key `after`. Returns (products, key of the last product or
+        None if there are no more, total matches or None if not counted).
+
+        Unselective filters walk the presorted ordering and stop after one page;
+        selective ones (an index slice under 1/8 of the catalog) sort just the
+        matches, which also gives an exact count.
+        """
+        key = sort_key(sort, sales)
+        category_set = set(categories) if categories else None
+
+        def matches(p):
+            return ((category_set is None or p.category in category_set)
+                    and (not badge or p.badge == badge)
+                    and (min_price is None or p.price >= min_price)
+                    and (max_price is None or p.price <= max_price))
+
+        candidates = self._smallest_candidates(categories, min_price, max_price, badge)
+        if candidates is not None and len(candidates) * 8 < len(self.products):
+            ordered = sorted((p for p in candidates if matches(p)), key=key)
+            return keyset_page(ordered, key, after, limit) + (len(ordered),)
+        predicate = matches if candidates is not None else None
+        return keyset_page(self.ordering(sort, sales), key, after, limit, predicate) + (None,)
+
+    def estimate_count(self, categories=None, min_price=None, max_price=None, badge=None):
+        """
+        (count, exact) for the filters without scanning: exact for a single
+        filter (an index lookup), otherwise the catalog size times each
+        filter's selectivity, assuming they are independent.
+        """
+        total = len(self.products)
+        sizes = []
+        if categories:
+            sizes.append(sum(len(self.by_category.get(c, ())) for c in set(categories)))
+        if badge:
+            sizes.append(len(self.by_badge.get(badge, ())))
+        if min_price is not None or max_price is not None:
+            lo = 0 if min_price is None else bisect.bisect_left(self.price_keys, min_price)
+            hi = total if max_price is None else bisect.bisect_right(self.price_keys, max_price)
+            sizes.append(max(0, hi - lo))
+        if not sizes:
+            return total, True
+        if len(sizes) == 1:
+            return sizes[0], True
+        estimate = total
+        for size in sizes:
+            estimate *= size / total
+        return round(estimate), False
+
+
+# --- Sorting and keyset pagination ---
+# sort -> key(product, units sold by product id); every key ends in the id so
+# that the order is total and a key identifies a position exactly.
+SORT_KEYS = {
+    'featured': lambda p, units: (p.id,),
+    'newest': lambda p, units: (-p.id,),
+    'price_asc': lambda p, units: (p.price, p.id),
+    'price_desc': lambda p, units: (-p.price, -p.id),
+    'bestseller': lambda p, units: (-units.get(p.id, 0), p.id),
+}
+
+
+def sort_key(sort, sales=None):
+    units = sales.units if sales is not None else {}
+    key = SORT_KEYS[sort]
+    return lambda p: key(p, units)
+
+
+def keyset_page(ordered, key, after=None, limit=24, predicate=None):
+    """
+    Up to `limit` items of `ordered` (sorted by `key`) that come after the key
+    `after` and satisfy `predicate`. Returns (items, key of the last item, or
+    None if nothing matching follows it).
+    """
+    start = 0 if after is None else bisect.bisect_right(ordered, tuple(after), key=key)
+    items = []
+    for index in range(start, len(ordered)):
+        item = ordered[index]
+        if predicate is None or predicate(item):
+            items.append(item)
+            if len(items) > limit:
+                break
+    if len(items) > limit:
+        items = items[:limit]
+        return items, key(items[-1])
+    return items, None
+
+
+# --- Sales ranks (the bestseller sort) ---
+class SalesRanks(NamedTuple):
+    units: dict       # product id -> units sold
+    version: float    # when they were loaded
+
+
+SALES_RETRY_SECONDS = 30
+_sales = TTLCache(maxsize=1, ttl=float(os.environ.get('BESTSELLER_REFRESH_SECONDS', 300)), name='sales')
+
+
+def get_sales_ranks():
+    """
+    Units sold per product from `product_sales` (kept up to date by checkout),
+    reloaded at most every BESTSELLER_REFRESH_SECONDS per process.
+    """
+    ranks = _sales.get('ranks')
+    if ranks is None:
+        try:
+            with get_pool().connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT product_id, units_sold FROM product_sales')
+                    units = dict(cur.fetchall())
+                conn.rollback()
+        except (psycopg2.Error, PoolTimeout, ValueError):
+            # Fall back to featured order for a little while rather than failing the
+            # page (ValueError: no DATABASE_URL configured).
+            logger.exception("Could not load sales ranks; bestseller order falls back to featured")
+            ranks = SalesRanks({}, time.time())
+            _sales.set('ranks', ranks, ttl=SALES_RETRY_SECONDS)
+            return ranks
+        ranks = SalesRanks(units, time.time())
+        _sales.set('ranks', ranks)
+    return ranks
+
+
+# --- Loading and refresh ---
+def _fetch_state(cur):
+    """(version, updated_at as epoch seconds) from catalog_state; (0, None) if it is missing."""
+    try:
+        cur.execute('SELECT version, EXTRACT(EPOCH FROM updated_at::timestamptz) FROM catalog_state')
+        row = cur.fetchone()
+        return (row[0], float(row[1])) if row else (0, None)
+    except psycopg2.errors.UndefinedTable:
+        cur.connection.rollback()
+        logger.warning("catalog_state table is missing; run migrate.py to enable catalog refresh.")
+        return 0, None
+
+
+def _fetch_version(cur):
+    return _fetch_state(cur)[0]
+
+
+def load_snapshot(conn):
+    """Reads the whole products table (and its version) in one transaction."""
+    with conn.cursor() as cur:
+        version, updated_at = _fetch_state(cur)
+        cur.execute('SELECT %s FROM products' % ', '.join(PRODUCT_COLUMNS))
+        products = [Product.from_row(row) for row in cur.fetchall()]
+    conn.rollback()
+    return CatalogSnapshot(products, version, updated_at)
+
+
+class Catalog:
+    """Holds the current snapshot and keeps it fresh from a background poller."""
+
+    def __init__(self, refresh_interval=5.0):
+        self.refresh_interval = refresh_interval
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._poller = None
+        self._poller_pid = None
+        self._listeners = []
+
+    @property
+    def version(self):
+        return self.snapshot().version
+
+    def snapshot(self):
+        """The current snapshot, loading it synchronously on first use."""
+        snap = self._snapshot
+        if snap is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self.reload()
+                snap = self._snapshot
+        self._ensure_poller()
+        return snap
+
+    def reload(self):
+        with get_pool().connection() as conn:
+            snap = load_snapshot(conn)
+        self._install(snap)
+        return snap
+
+    def _install(self, snap):
+        previous = self._snapshot
+        self._snapshot = snap
+        if previous is None or previous.version != snap.version:
+            logger.info("Catalog loaded: %d products, version %s", len(snap), snap.version)
+            for callback in list(self._listeners):
+                try:
+                    callback(snap)
+                except Exception:
+                    logger.exception("Catalog change listener failed")
+
+    def on_change(self, callback):
+        """Registers `callback(snapshot)` to run whenever a new version is installed."""
+        self._listeners.append(callback)
+        return callback
+
+    def refresh_if_changed(self):
+        """Checks the version counter and reloads only when it moved."""
+        with get_pool().connection() as conn:
+            with conn.cursor() as cur:
+                version = _fetch_version(cur)
+            conn.rollback()
+            current = self._snapshot
+            if current is None or version != current.version:
+                self._install(load_snapshot(conn))
+
+    def _ensure_poller(self):
+        # Threads do not survive fork(), so each worker process starts its own.
+        if self.refresh_interval <= 0 or self._poller_pid == os.getpid():
+            return
+        with self._lock:
+            if self._poller_pid == os.getpid():
+                return
+            self._poller_pid = os.getpid()
+            self._poller = threading.Thread(target=self._poll_forever, name='catalog-poller', daemon=True)
+            self._poller.start()
+        listener.subscribe(CATALOG_CHANNEL, self._on_notify)
+
+    def _on_notify(self, payload):
+        try:
+            self.refresh_if_changed()
+        except Exception:
+            logger.exception("Catalog refresh after NOTIFY failed")
+
+    def _poll_forever(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh_if_changed()
+            except Exception:
+                logger.exception("Catalog refresh failed; serving the previous snapshot")
+
+
+_catalog = Catalog(refresh_interval=float(os.environ.get('CATALOG_REFRESH_SECONDS', 5)))
+
+
+def get_catalog():
+    """The current catalog snapshot for this process."""
+    return _catalog.snapshot()
+
+
+def catalog_manager():
+    """The process-wide Catalog, for registering change listeners or forcing a reload."""
+    return _catalog
@@ -0,0 +1,71 @@
+# chat_cache.py
+# Caches for the chatbot path.
+#
+# - Answer cache: final answers to questions that did not depend on who was
+#   asking, keyed on the normalized question, the catalog version and whether
+#   the asker was logged in (the system prompt differs between the two).
+# - Tool cache: short-lived `search_products` results keyed on
+#   (query, min_price, max_price) and the catalog version.
+# Per-user tools (order status) are never cached here.
+
+import os
+import re
+from datetime import date
+
+from cache import TTLCache
+from catalog import catalog_manager
+
+_answers = TTLCache(
+    maxsize=int(os.environ.get('CHAT_ANSWER_CACHE_SIZE', 1000)),
+    ttl=float(os.environ.get('CHAT_ANSWER_CACHE_TTL', 600)),
+    name='chat_answers',
+)
+_tool_results = TTLCache(
+    maxsize=int(os.environ.get('CHAT_TOOL_CACHE_SIZE', 512)),
+    ttl=float(os.environ.get('CHAT_TOOL_CACHE_TTL', 60)),
+    name='chat_tool_results',
+)
+
+_WORD_RE = re.compile(r'[a-z0-9₹]+')
+
+
+def normalize_question(message):
+    """Lower-cases and strips punctuation/extra spaces: "Shoes under 10000?" -> "shoes under 10000"."""
+    return ' '.join(_WORD_RE.findall((message or '').lower()))
+
+
+def _answer_key(message, catalog_version, authenticated):
+    # The system prompt carries today's date, so answers don't outlive the day.
+    return (normalize_question(message), catalog_version, bool(authenticated), date.today().isoformat())
+
+
+def get_answer(message, catalog_version, authenticated):
+    return _answers.get(_answer_key(message, catalog_version, authenticated))
+
+
+def store_answer(message, catalog_version, authenticated, answer):
+    if answer:
+        _answers.set(_answer_key(message, catalog_version, authenticated), answer)
+
+
+def _tool_key(query, min_price, max_price, catalog_version):
+    return (normalize_question(query) or None, min_price, max_price, catalog_version)
+
+
+def get_search_result(query, min_price, max_price, catalog_version):
+    return _tool_results.get(_tool_key(query, min_price, max_price, catalog_version))
+
+
+def store_search_result(query, min_price, max_price, catalog_version, result):
+    _tool_results.set(_tool_key(query, min_price, max_price, catalog_version), result)
+
+
+@catalog_manager().on_change
+def _on_catalog_change(snapshot):
+    # Keys already include the version; clearing just frees the memory early.
+    _tool_results.clear()
+    _answers.clear()
+
+
+def chat_cache_stats():
+    return {'answers': _answers.stats(), 'tool_results': _tool_results.stats()}
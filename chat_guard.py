@@ -0,0 +1,167 @@
+# chat_guard.py
+# Admission control for the chatbot, so a slow or failing model can't starve
+# the rest of the storefront:
+#   - ConcurrencyGate: at most N model conversations per process, a short
+#     bounded wait queue, and an immediate "busy" answer beyond that.
+#   - RateLimiter: a token bucket per user / client IP for /chatbot.
+#   - CircuitBreaker: after repeated model failures, skip the model entirely
+#     for a cool-down period and answer from the rule-based fallback.
+
+import os
+import threading
+import time
+
+from cache import TTLCache
+
+
+class ConcurrencyGate:
+    def __init__(self, max_concurrent=4, max_waiting=8, wait_timeout=2.0):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    def acquire(self):
+        """Takes a slot, waiting briefly if the queue has room. Returns False when busy."""
+        if self._semaphore.acquire(blocking=False):
+            with self._lock:
+                self.in_flight += 1
+            return True
+        with self._lock:
+            if self.waiting >= self.max_waiting:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+        acquired = self._semaphore.acquire(timeout=self.wait_timeout)
+        with self._lock:
+            self.waiting -= 1
+            if acquired:
+                self.in_flight += 1
+            else:
+                self.rejected += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        with self._lock:
+            return {'max_concurrent': self.max_concurrent, 'in_flight': self.in_flight,
+                    'waiting': self.waiting, 'rejected': self.rejected}
+
+
+class RateLimiter:
+    """Token buckets keyed by client; `rate` tokens per second, up to `burst` saved."""
+
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = TTLCache(maxsize=max_clients, ttl=max(burst / rate, 1.0) * 2 if rate else None)
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key) or (self.burst, now)
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            else:
+                self.limited += 1
+            self._buckets.set(key, (tokens, now))
+        return allowed
+
+    def stats(self):
+        return {'rate_per_second': self.rate, 'burst': self.burst, 'limited': self.limited,
+                'tracked_clients': len(self._buckets)}
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After `failure_threshold` consecutive failures it
+    opens and refuses calls for `reset_timeout` seconds, then lets a single
+    trial call through (half-open); success closes it, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_progress or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_in_progress:
+                    self.trips += 1
+                self._opened_at = time.monotonic()
+                self._trial_in_progress = False
+
+    def record_cancelled(self):
+        """The call ended with no outcome (e.g. the client went away); lets another trial through."""
+        with self._lock:
+            self._trial_in_progress = False
+
+    def stats(self):
+        with self._lock:
+            return {'state': self._state(), 'consecutive_failures': self._failures, 'trips': self.trips}
+
+
+# --- Process-wide instances ---
+model_gate = ConcurrencyGate(
+    max_concurrent=int(os.environ.get('CHAT_MAX_CONCURRENT', 4)),
+    max_waiting=int(os.environ.get('CHAT_MAX_WAITING', 8)),
+    wait_timeout=float(os.environ.get('CHAT_WAIT_TIMEOUT', 2)),
+)
+rate_limiter = RateLimiter(
+    rate=float(os.environ.get('CHAT_RATE_PER_MINUTE', 20)) / 60.0,
+    burst=float(os.environ.get('CHAT_RATE_BURST', 5)),
+)
+model_breaker = CircuitBreaker(
+    failure_threshold=int(os.environ.get('CHAT_BREAKER_FAILURES', 5)),
+    reset_timeout=float(os.environ.get('CHAT_BREAKER_RESET_SECONDS', 30)),
+)
+
+
+def guard_stats():
+    return {'gate': model_gate.stats(), 'rate_limit': rate_limiter.stats(), 'breaker': model_breaker.stats()}
@@ -0,0 +1,223 @@
+# chat_models.py
+# Model backends for the chatbot.
+#
+# Every backend implements one call:
+#   turn(contents, stream=True, allow_tools=True) -> iterator of events
+# where `contents` is the conversation so far as a list of plain dicts
+#   {'role': 'user',  'text': str}
+#   {'role': 'model', 'text': str, 'tool_calls': [ToolCall, ...]}
+#   {'role': 'tool',  'results': [(tool_name, result_text), ...]}
+# and the events are ('text', chunk) or ('tool_call', ToolCall), optionally
+# followed by one ('usage', (prompt_tokens, output_tokens)).
+#
+# CHAT_MODEL selects the backend: 'gemini' (default) or 'fake', a local
+# stand-in with configurable latency, tool-call scripts and error injection
+# so the chat path works (and can be load-tested) offline.
+
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import NamedTuple
+
+GEMINI_MODEL_NAME = os.environ.get('GEMINI_MODEL', 'gemini-1.5-flash-latest')
+# Upper bound on a single model call. The SDK's own retries are disabled so a
+# slow model fails fast and chat_guard's circuit breaker sees the failure.
+MODEL_TIMEOUT_SECONDS = float(os.environ.get('CHAT_MODEL_TIMEOUT', 15))
+
+
+class ToolCall(NamedTuple):
+    name: str
+    args: dict
+
+
+class GeminiModel:
+    """
+    Google Gemini via google-generativeai, using the SDK's structured function
+    calling. One instance (and one underlying client) is reused per process.
+    The SDK is imported and configured here, on the first chat message, rather
+    than when the web app starts: it is by far the slowest import.
+    """
+
+    def __init__(self, system_instruction=None, tools=None, model_name=GEMINI_MODEL_NAME,
+                 timeout=MODEL_TIMEOUT_SECONDS):
+        import google.generativeai as genai
+        genai.configure(api_key=os.environ.get('GEMINI_API_KEY'))
+        self._genai = genai
+        self._request_options = {'timeout': timeout, 'retry': None}
+        declarations = [genai.types.FunctionDeclaration(**tool) for tool in (tools or [])]
+        self._model = genai.GenerativeModel(
+            model_name,
+            system_instruction=system_instruction,
+            tools=[genai.protos.Tool(function_declarations=[d.to_proto() for d in declarations])] if declarations else None,
+        )
+
+    def _to_contents(self, contents):
+        protos = self._genai.protos
+        converted = []
+        for message in contents:
+            if message['role'] == 'user':
+                converted.append({'role': 'user', 'parts': [message['text']]})
+            elif message['role'] == 'model':
+                parts = [protos.Part(text=message['text'])] if message.get('text') else []
+                parts += [protos.Part(function_call=protos.FunctionCall(name=c.name, args=c.args))
+                          for c in message.get('tool_calls', ())]
+                converted.append({'role': 'model', 'parts': parts})
+            elif message['role'] == 'tool':
+                converted.append({'role': 'user', 'parts': [
+                    protos.Part(function_response=protos.FunctionResponse(name=name, response={'result': result}))
+                    for name, result in message['results']
+                ]})
+        return converted
+
+    def turn(self, contents, stream=True, allow_tools=True):
+        tool_config = None if allow_tools else {'function_calling_config': {'mode': 'NONE'}}
+        response = self._model.generate_content(self._to_contents(contents), stream=stream, tool_config=tool_config,
+                                               request_options=self._request_options)
+        for chunk in (response if stream else [response]):
+            for candidate in chunk.candidates[:1]:
+                for part in candidate.content.parts:
+                    if part.function_call.name:
+                        yield 'tool_call', ToolCall(part.function_call.name, dict(part.function_call.args))
+                    elif part.text:
+                        yield 'text', part.text
+        usage = getattr(response, 'usage_metadata', None)
+        if usage:
+            yield 'usage', (usage.prompt_token_count, usage.candidates_token_count)
+
+
+class FakeModelError(RuntimeError):
+    """An error injected by FakeModel."""
+
+
+class FakeModel:
+    """
+    Offline stand-in for Gemini, for development and load tests without network.
+
+    - Latency: `first_chunk_delay` before the first event and `chunk_delay`
+      between chunks, each stretched by up to +/- `jitter` (a fraction).
+    - Streaming: the reply is sent in `chunk_size` pieces; with stream=False
+      the whole reply arrives at once after the same total delay.
+    - Tool calls: `script` is a list of rules
+          {"match": "<regex>", "tool_calls": [{"name": ..., "args": {...}}], "reply": "..."}
+      The first rule whose regex matches the user's message supplies the tool
+      calls for the first turn (and optionally the final reply); tool results
+      are otherwise echoed back.
+    - Errors: `error_rate` fails a call before anything is sent, and
+      `stream_error_rate` fails it after the first chunk.
+    """
+
+    DEFAULT_REPLY = ("Thanks for asking! I'm the FITX Bot running in offline mode. "
+                     "Browse our Men, Women and Unisex collections to find your perfect pair.")
+
+    def __init__(self, reply=None, chunk_size=12, first_chunk_delay=0.05, chunk_delay=0.01, jitter=0.0,
+                 script=None, error_rate=0.0, stream_error_rate=0.0, seed=None):
+        self.reply = reply or self.DEFAULT_REPLY
+        self.chunk_size = chunk_size
+        self.first_chunk_delay = first_chunk_delay
+        self.chunk_delay = chunk_delay
+        self.jitter = jitter
+        self.script = [dict(rule, match=re.compile(rule.get('match', ''), re.I)) for rule in (script or [])]
+        self.error_rate = error_rate
+        self.stream_error_rate = stream_error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls):
+        """Configured by CHAT_FAKE_* environment variables (see the class docstring)."""
+        script = None
+        if os.environ.get('CHAT_FAKE_SCRIPT'):
+            with open(os.environ['CHAT_FAKE_SCRIPT'], encoding='utf-8') as f:
+                script = json.load(f)
+        seed = os.environ.get('CHAT_FAKE_SEED')
+        return cls(
+            reply=os.environ.get('CHAT_FAKE_REPLY'),
+            chunk_size=int(os.environ.get('CHAT_FAKE_CHUNK_SIZE', 12)),
+            first_chunk_delay=float(os.environ.get('CHAT_FAKE_LATENCY', 0.05)),
+            chunk_delay=float(os.environ.get('CHAT_FAKE_CHUNK_DELAY', 0.01)),
+            jitter=float(os.environ.get('CHAT_FAKE_JITTER', 0)),
+            script=script,
+            error_rate=float(os.environ.get('CHAT_FAKE_ERROR_RATE', 0)),
+            stream_error_rate=float(os.environ.get('CHAT_FAKE_STREAM_ERROR_RATE', 0)),
+            seed=int(seed) if seed else None,
+        )
+
+    def _chance(self, rate):
+        with self._lock:
+            return rate > 0 and self._random.random() < rate
+
+    def _delay(self, seconds):
+        if self.jitter:
+            with self._lock:
+                seconds *= 1 + self._random.uniform(-self.jitter, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def _chunks(self, text, stream):
+        fail_midway = self._chance(self.stream_error_rate)
+        self._delay(self.first_chunk_delay)
+        pieces = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        if not stream:
+            self._delay(self.chunk_delay * (len(pieces) - 1))
+            pieces = [text]
+        for i, piece in enumerate(pieces):
+            if i:
+                self._delay(self.chunk_delay)
+            yield 'text', piece
+            if fail_midway:
+                raise FakeModelError("injected error after the first chunk")
+
+    def _rule_for(self, contents):
+        message = next((m['text'] for m in contents if m['role'] == 'user'), '')
+        return next((rule for rule in self.script if rule['match'].search(message)), None)
+
+    def turn(self, contents, stream=True, allow_tools=True):
+        with self._lock:
+            self.calls += 1
+        if self._chance(self.error_rate):
+            raise FakeModelError("injected model error")
+        rule = self._rule_for(contents)
+        if contents and contents[-1]['role'] == 'tool':
+            # Echo tool results back so tool round-trips are visible offline.
+            return self._chunks(rule.get('reply') if rule and rule.get('reply') else
+                                '\n'.join(result for _name, result in contents[-1]['results']), stream)
+        if rule and rule.get('tool_calls') and allow_tools:
+            return self._tool_calls(rule['tool_calls'])
+        return self._chunks(rule.get('reply') if rule and rule.get('reply') else self.reply, stream)
+
+    def _tool_calls(self, calls):
+        self._delay(self.first_chunk_delay)
+        for call in calls:
+            yield 'tool_call', ToolCall(call['name'], dict(call.get('args', {})))
+
+
+_model = None
+_model_pid = None
+_model_lock = threading.Lock()
+
+
+def get_chat_model(system_instruction=None, tools=None):
+    """
+    The process-wide chat backend selected by CHAT_MODEL. It is created on first
+    use with the given system instruction and tool declarations, then reused.
+    A client inherited across fork() is not reused (its gRPC channel is not
+    fork-safe); each worker creates its own.
+    """
+    global _model, _model_pid
+    if _model is None or _model_pid != os.getpid():
+        with _model_lock:
+            if _model is None or _model_pid != os.getpid():
+                backend = os.environ.get('CHAT_MODEL', 'gemini').lower()
+                _model = FakeModel.from_env() if backend == 'fake' else GeminiModel(system_instruction, tools)
+                _model_pid = os.getpid()
+    return _model
+
+
+def set_chat_model(model):
+    """Overrides the process-wide backend (e.g. a scripted FakeModel)."""
+    global _model, _model_pid
+    _model, _model_pid = model, os.getpid()
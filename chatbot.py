@@ -0,0 +1,145 @@
+# chatbot.py
+# The FITX Bot conversation loop, built on the model's native function calling.
+#
+# The model is created once per process with a static system instruction and
+# the tool declarations below. Each chat message then costs one model call,
+# plus one more per round of tool calls (all calls requested in a round are
+# answered together), up to MAX_MODEL_CALLS per message. The tool
+# implementations are supplied by the caller (app.py), which owns the
+# database and catalog access.
+
+import os
+import threading
+import time
+from datetime import datetime
+
+import metrics
+from chat_models import get_chat_model
+
+MAX_MODEL_CALLS = int(os.environ.get('CHAT_MAX_MODEL_CALLS', 3))
+
+SYSTEM_INSTRUCTION = """
+You are FITX Bot, a helpful and friendly e-commerce assistant for a shoe store.
+Your goal is to answer the user's question about the store's products and their orders.
+
+Each user message starts with a [CONTEXT] line giving today's date and whether the user is logged in.
+
+INSTRUCTIONS:
+1. **CRITICAL RULE:** Your ONLY purpose is to assist with the FITX shoe store. If the user asks any question that is NOT about our products, their orders, shipping, or store policies (e.g., asking for jokes, math problems, general knowledge, other companies), you MUST politely refuse. A perfect refusal is: "I'm the FITX Bot, and my expertise is limited to our products and your orders. How can I help you with our footwear today?"
+2. Use the search_products tool to look up product information (like price or availability). You can search by a text query, a price range, or both. For example, to find shoes under 10000, call it with max_price=10000. To find 'running shoes' over 8000, call it with query='running shoes' and min_price=8000.
+3. Use the get_order_status tool to look up a specific order for a logged-in user.
+4. You may call several tools at once when the question needs more than one lookup.
+5. If the question is simple and on-topic (e.g., "What are your return policies?"), answer it directly.
+6. After a tool returns, give a final, friendly, and natural-sounding answer based on its result.
+""".strip()
+
+TOOL_DECLARATIONS = [
+    {
+        'name': 'search_products',
+        'description': "Search the FITX catalog by text (name or category) and/or price range. Returns up to 5 products.",
+        'parameters': {
+            'type': 'object',
+            'properties': {
+                'query': {'type': 'string', 'description': "Words to search for, e.g. 'running shoes' or 'Women'."},
+                'min_price': {'type': 'number', 'description': "Minimum price in rupees."},
+                'max_price': {'type': 'number', 'description': "Maximum price in rupees."},
+            },
+        },
+    },
+    {
+        'name': 'get_order_status',
+        'description': "Get the status, date and total of one of the logged-in user's orders.",
+        'parameters': {
+            'type': 'object',
+            'properties': {
+                'order_id': {'type': 'integer', 'description': "The order number, e.g. 42 for ALPHA-42."},
+            },
+            'required': ['order_id'],
+        },
+    },
+]
+
+LOGIN_REQUIRED_REPLY = "You need to be logged in for me to check your order status."
+
+_counts = {'messages': 0, 'model_calls': 0}
+_counts_lock = threading.Lock()
+
+
+def _count(key):
+    with _counts_lock:
+        _counts[key] += 1
+
+
+def model_call_stats():
+    """Messages that reached the model and the model calls they made."""
+    with _counts_lock:
+        messages, calls = _counts['messages'], _counts['model_calls']
+    return {'messages': messages, 'model_calls': calls,
+            'calls_per_message': calls / messages if messages else 0.0}
+
+
+def context_line(user):
+    # Deliberately no user id: tools resolve the user server-side.
+    status = "logged in" if user.is_authenticated else "not logged in"
+    return f"[CONTEXT] Today's date: {datetime.now().strftime('%Y-%m-%d')}. The user is {status}."
+
+
+def run_chat(message, user, tools, stream=True, max_model_calls=MAX_MODEL_CALLS):
+    """
+    Runs one chat message through the model and yields events:
+      ('token', text)  a piece of the answer
+      ('tool', name)   a tool is being called
+
+    `tools` maps tool names to callables taking the model's arguments as keywords.
+    Model errors propagate to the caller.
+    """
+    model = get_chat_model(SYSTEM_INSTRUCTION, TOOL_DECLARATIONS)
+    contents = [{'role': 'user', 'text': f"{context_line(user)}\n{message}"}]
+    _count('messages')
+
+    for call_number in range(1, max_model_calls + 1):
+        # The last allowed call must answer in text, so tools are switched off for it.
+        allow_tools = call_number < max_model_calls
+        _count('model_calls')
+        text, tool_calls = [], []
+        started, outcome, usage = time.perf_counter(), 'error', (None, None)
+        try:
+            for kind, data in model.turn(contents, stream=stream, allow_tools=allow_tools):
+                if kind == 'tool_call':
+                    tool_calls.append(data)
+                elif kind == 'usage':
+                    usage = data
+                else:
+                    text.append(data)
+                    yield 'token', data
+            outcome = 'ok'
+        except GeneratorExit:
+            outcome = 'cancelled'
+            raise
+        finally:
+            metrics.observe_model_call(time.perf_counter() - started, outcome, *usage)
+        if not tool_calls:
+            return
+
+        if not user.is_authenticated and all(c.name == 'get_order_status' for c in tool_calls):
+            # No point asking the model to phrase this; answer straight away.
+            yield 'tool', 'get_order_status'
+            yield 'token', LOGIN_REQUIRED_REPLY
+            return
+
+        results = []
+        for call in tool_calls:
+            yield 'tool', call.name
+            results.append((call.name, _run_tool(tools, call)))
+        contents.append({'role': 'model', 'text': ''.join(text), 'tool_calls': tool_calls})
+        contents.append({'role': 'tool', 'results': results})
+
+
+def _run_tool(tools, call):
+    func = tools.get(call.name)
+    if func is None:
+        return f"Unknown tool {call.name!r}."
+    try:
+        return func(**call.args)
+    except (TypeError, ValueError) as e:
+        return f"The tool could not run with those arguments: {e}"
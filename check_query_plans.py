@@ -0,0 +1,158 @@
+# check_query_plans.py
+# Plan check for the app's hot queries.
+#
+# EXPLAINs each query below (copies of the SQL in app.py, carts.py,
+# search_index.py and jobs.py, with parameters sampled from the database) and
+# fails if any plan reads a large table with a sequential scan, which usually
+# means a missing index (see migrations/). Run it against a database seeded at
+# realistic scale, where the planner's choices match production:
+#
+#     DATABASE_URL=postgres://... python create_db.py --products 100000 --users 20000 --orders-per-user 10
+#     DATABASE_URL=postgres://... python check_query_plans.py
+#
+# Keep the SQL here in step with the app when a hot query changes.
+
+import argparse
+import json
+import sys
+
+from db import connect
+
+# name -> (SQL, function(samples) returning its parameters)
+HOT_QUERIES = {
+    'load_user': (
+        'SELECT id, username FROM users WHERE id = %s',
+        lambda s: (s['user_id'],)),
+    'login': (
+        'SELECT * FROM users WHERE username = %s',
+        lambda s: (s['username'],)),
+    'order_history': ('''
+        WITH page AS (
+            SELECT id, order_date, total_amount, status
+            FROM orders
+            WHERE user_id = %s
+            ORDER BY order_date DESC, id DESC
+            LIMIT %s
+        )
+        SELECT page.id, page.order_date, page.total_amount, page.status,
+               oi.id AS item_id, oi.product_id, oi.product_name, oi.product_price,
+               oi.quantity, oi.size, oi.image
+        FROM page
+        LEFT JOIN order_items oi ON oi.order_id = page.id
+        ORDER BY page.order_date DESC, page.id DESC, oi.id
+    ''', lambda s: (s['user_id'], 11)),
+    'order_history_next_page': ('''
+        WITH page AS (
+            SELECT id, order_date, total_amount, status
+            FROM orders
+            WHERE user_id = %s AND (order_date, id) < (%s, %s)
+            ORDER BY order_date DESC, id DESC
+            LIMIT %s
+        )
+        SELECT page.id, page.order_date, page.total_amount, page.status,
+               oi.id AS item_id, oi.product_id, oi.product_name, oi.product_price,
+               oi.quantity, oi.size, oi.image
+        FROM page
+        LEFT JOIN order_items oi ON oi.order_id = page.id
+        ORDER BY page.order_date DESC, page.id DESC, oi.id
+    ''', lambda s: (s['user_id'], s['order_date'], s['order_id'], 11)),
+    'checkout_idempotency': (
+        'SELECT id FROM orders WHERE user_id = %s AND idempotency_key = %s',
+        lambda s: (s['user_id'], 'sample-key')),
+    'checkout_success': ('''
+        SELECT oi.product_name AS name, oi.product_price AS price, oi.quantity, oi.size, oi.image
+        FROM order_items oi JOIN orders o ON o.id = oi.order_id
+        WHERE oi.order_id = %s AND o.user_id = %s
+        ORDER BY oi.id
+    ''', lambda s: (s['order_id'], s['user_id'])),
+    'order_status': (
+        'SELECT id, status, order_date, total_amount FROM orders WHERE id = %s AND user_id = %s',
+        lambda s: (s['order_id'], s['user_id'])),
+    'wishlist': ('''
+        SELECT p.* FROM products p
+        JOIN wishlist w ON p.id = w.product_id
+        WHERE w.user_id = %s
+    ''', lambda s: (s['user_id'],)),
+    'cart_items': (
+        'SELECT product_id, size, quantity FROM cart_items WHERE cart_id = %s',
+        lambda s: ('sample-cart',)),
+    'cart_for_user': (
+        'SELECT id FROM carts WHERE user_id = %s',
+        lambda s: (s['user_id'],)),
+    'search': ('''
+        SELECT id
+        FROM products, to_tsquery('simple', %s) AS q
+        WHERE (search_vector @@ q OR name %% %s)
+        ORDER BY ts_rank_cd(search_vector, q) + similarity(name, %s) DESC, id
+        LIMIT %s
+    ''', lambda s: ('runner:*', 'runner', 'runner', 5)),
+    'claim_jobs': ('''
+        SELECT id FROM jobs
+        WHERE status = 'pending' AND run_at <= NOW()
+        ORDER BY run_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ''', lambda s: (50,)),
+}
+
+
+def sample_values(cur):
+    """Parameters that exist in the database: the user with the most recent order, and that order."""
+    cur.execute('SELECT id, user_id, order_date FROM orders ORDER BY id DESC LIMIT 1')
+    row = cur.fetchone()
+    order_id, user_id, order_date = row if row else (1, 1, '2000-01-01')
+    cur.execute('SELECT username FROM users WHERE id = %s', (user_id,))
+    row = cur.fetchone()
+    return {'order_id': order_id, 'user_id': user_id, 'order_date': order_date,
+            'username': row[0] if row else 'bench_user_1'}
+
+
+def table_sizes(cur):
+    cur.execute("SELECT relname, reltuples FROM pg_class WHERE relkind = 'r'")
+    return dict(cur.fetchall())
+
+
+def seq_scans(plan):
+    """Names of the relations `plan` (EXPLAIN FORMAT JSON) reads with a sequential scan."""
+    found = []
+    if plan.get('Node Type') == 'Seq Scan':
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if a hot query sequentially scans a large table.")
+    parser.add_argument('--min-rows', type=int, default=10000,
+                        help="Tables with fewer (estimated) rows may be scanned; the planner often prefers it.")
+    parser.add_argument('--verbose', action='store_true', help="Print every plan.")
+    args = parser.parse_args()
+
+    conn = connect()
+    failures = []
+    try:
+        with conn.cursor() as cur:
+            samples = sample_values(cur)
+            sizes = table_sizes(cur)
+            for name, (sql, params) in HOT_QUERIES.items():
+                cur.execute('EXPLAIN (FORMAT JSON) ' + sql, params(samples))
+                plan = cur.fetchone()[0][0]['Plan']
+                large = [t for t in seq_scans(plan) if sizes.get(t, 0) >= args.min_rows]
+                print(f"{name:25} cost {plan['Total Cost']:>12.1f}  {'SEQ SCAN on ' + ', '.join(large) if large else 'ok'}")
+                if args.verbose:
+                    print(json.dumps(plan, indent=1))
+                if large:
+                    failures.append(name)
+        conn.rollback()
+    finally:
+        conn.close()
+
+    if failures:
+        print(f"\n{len(failures)} hot queries scan large tables: {', '.join(failures)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+# check_startup.py
+# Import-time budget for the web app.
+#
+# Runs `python -X importtime -c "import app"` in a fresh interpreter (several
+# times, keeping the fastest run), then fails if importing app.py took longer
+# than the budget or pulled in a module that should only load on first use
+# (the Gemini SDK, Pillow, brotli). Also times create_app(), which is what a
+# gunicorn master pays once with preload_app (see gunicorn.conf.py).
+#
+#     python check_startup.py
+#     python check_startup.py --budget-ms 300 --top 15
+#
+# Exits 1 when over budget. test_startup.py runs the same checks with the
+# test suite.
+
+import argparse
+import os
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Imported lazily by the code paths that need them; never at startup.
+DEFERRED_MODULES = ('google.generativeai', 'PIL', 'brotli')
+
+
+def import_profile(statement):
+    """Runs `statement` under -X importtime; returns {module: (self_us, cumulative_us)} and the total wall time."""
+    code = f"import time; _t = time.perf_counter(); {statement}; print(time.perf_counter() - _t)"
+    env = dict(os.environ, JOBS_IN_PROCESS='0', LOG_FILE='')
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=BASE_DIR, env=env,
+                          capture_output=True, text=True, check=True)
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules, float(proc.stdout.strip().splitlines()[-1])
+
+
+def default_budget_ms():
+    return float(os.environ.get('IMPORT_BUDGET_MS', 500))
+
+
+def deferred_imports(modules):
+    """The DEFERRED_MODULES (or their submodules) among the imported `modules`."""
+    return [deferred for deferred in DEFERRED_MODULES
+            if any(name == deferred or name.startswith(deferred + '.') for name in modules)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that importing the web app stays within its time budget.")
+    parser.add_argument('--budget-ms', type=float, default=default_budget_ms(),
+                        help="Maximum time to import app.py.")
+    parser.add_argument('--runs', type=int, default=3, help="Take the fastest of this many runs.")
+    parser.add_argument('--top', type=int, default=10, help="List this many slowest imports.")
+    args = parser.parse_args()
+
+    runs = [import_profile('import app') for _ in range(args.runs)]
+    modules, import_seconds = min(runs, key=lambda run: run[1])
+    _, factory_seconds = import_profile('import app; app.create_app()')
+
+    print(f"import app:   {import_seconds * 1000:7.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print(f"create_app(): {(factory_seconds - import_seconds) * 1000:7.1f} ms")
+    print(f"\nSlowest imports (cumulative):")
+    for name, (_self_us, cumulative_us) in sorted(modules.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if import_seconds * 1000 > args.budget_ms:
+        failures.append(f"importing app took {import_seconds * 1000:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+    for deferred in deferred_imports(modules):
+        failures.append(f"{deferred} is imported at startup; import it where it is first used")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
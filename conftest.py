@@ -0,0 +1,34 @@
+# conftest.py
+# Shared pytest setup: the tests run without PostgreSQL, the Gemini API or a
+# log file, against an in-memory catalog built from create_db.products_data.
+
+import os
+
+# Set before any app module is imported; several read their settings on import.
+os.environ.setdefault('LOG_FILE', '')
+os.environ.setdefault('JOBS_IN_PROCESS', '0')
+os.environ.setdefault('CART_BACKEND', 'memory')
+os.environ.setdefault('CHAT_MODEL', 'fake')
+os.environ.setdefault('SEARCH_BACKEND', 'memory')
+os.environ['CATALOG_REFRESH_SECONDS'] = '0'
+
+import pytest
+
+
+@pytest.fixture
+def snapshot():
+    """A CatalogSnapshot of the 50 real products, installed as the current catalog."""
+    import catalog
+    from create_db import products_data
+
+    products = [
+        catalog.Product(p['id'], p['name'], p['category'], float(p['price']), float(p['mrp']), p['description'],
+                        None, None, f"assets/products/{p['id']}.jpeg", None, None, None, None, p['badge'], 1)
+        for p in products_data
+    ]
+    snap = catalog.CatalogSnapshot(products, version=1)
+    manager = catalog.catalog_manager()
+    previous = manager._snapshot
+    manager._install(snap)
+    yield snap
+    manager._snapshot = previous
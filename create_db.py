@@ -1,8 +1,16 @@
 # create_db.py (Modified to use psycopg2 for PostgreSQL)
 
+import argparse
+import array
 import os
-from app import get_db_connection # Import the new connection function from your modified app.py
+import random
+import time
+from datetime import datetime, timedelta
+from db import connect # Plain connection; the web app's request-scoped pool isn't needed here
+from migrate import migrate
 import psycopg2
+from psycopg2.extras import execute_values
+from werkzeug.security import generate_password_hash
 
 # --- Configuration (No changes here) ---
 IMAGE_FOLDER_PATH = 'assets/products/'
@@ -63,135 +71,278 @@ products_data = [
 ]
 
 
-def setup_database():
+# --- Scaled-up data for benchmarks (bench_storefront.py) ---
+BENCH_USER_PREFIX = 'bench_user_'
+BENCH_PASSWORD = 'benchmark'
+VARIANT_SUFFIXES = ['II', 'Pro', 'Lite', 'Max', 'Edge', 'Plus', 'Sport', 'Flex', 'Elite', 'Trail']
+ORDER_STATUSES = ['Packed', 'Shipped', 'Delivered', 'Delivered', 'Delivered']
+SIZES = ['UK 7', 'UK 8', 'UK 9', 'UK 10']
+# Synthetic users, orders and order items get ids from here up, far above
+# anything the SERIAL sequences hand out, so seeding a database that already
+# has real accounts and orders never collides with (or attaches data to) them.
+SYNTHETIC_ID_BASE = 1_000_000_000
+
+PRODUCT_COLUMNS = (
+    'id', 'name', 'category', 'price', 'mrp', 'description', 'style_code',
+    'origin', 'image_main', 'image_thumb1', 'image_thumb2', 'image_thumb3',
+    'image_thumb4', 'badge', 'colors_available',
+)
+
+
+def product_row(p, image_id=None):
+    """The INSERT tuple for one product; synthetic products borrow the images of `image_id`."""
+    image_id = image_id or p.get("id")
+    return (
+        p.get("id"),
+        p.get("name"),
+        p.get("category"),
+        p.get("price"),
+        p.get("mrp"),
+        p.get("description"),
+        f'ALPHA-{p.get("id"):03d}',
+        'Vietnam',
+        f'{IMAGE_FOLDER_PATH}{image_id}.{IMAGE_EXTENSION}',
+        f'{IMAGE_FOLDER_PATH}{image_id}-thumb1.{IMAGE_EXTENSION}',
+        f'{IMAGE_FOLDER_PATH}{image_id}-thumb2.{IMAGE_EXTENSION}',
+        f'{IMAGE_FOLDER_PATH}{image_id}-thumb3.{IMAGE_EXTENSION}',
+        f'{IMAGE_FOLDER_PATH}{image_id}-thumb4.{IMAGE_EXTENSION}',
+        p.get("badge"),
+        p.get("colors_available", 1)
+    )
+
+
+# --- Bulk loading ---
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _copy_field(value):
+    """One value in COPY's text format."""
+    if value is None:
+        return '\\N'
+    if type(value) is str:
+        return value.translate(_COPY_ESCAPES)
+    return repr(value) if type(value) is float else str(value)
+
+
+class CopyStream:
+    """A read()-able view of a row iterator as COPY text, produced as COPY consumes it."""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = b''
+        self.count = 0
+
+    def _fill(self, size):
+        chunks, filled = [self._buffer], len(self._buffer)
+        for row in self._rows:
+            line = ('\t'.join(map(_copy_field, row)) + '\n').encode('utf-8')
+            chunks.append(line)
+            filled += len(line)
+            self.count += 1
+            if filled >= size:
+                break
+        self._buffer = b''.join(chunks)
+
+    def read(self, size=65536):
+        if size is None or size < 0:
+            size = 1 << 62
+        if len(self._buffer) < size:
+            self._fill(size)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def copy_rows(cur, table, columns, rows, on_conflict='DO NOTHING'):
     """
-    Drops all tables, recreates them using raw SQL, and populates the 'products' table.
-    This is DESTRUCTIVE and will reset your database.
+    Streams `rows` into `table` with COPY through a temporary staging table,
+    then moves them across with INSERT ... ON CONFLICT, so re-running a seed
+    skips (or updates) rows that already exist instead of failing. Memory use
+    does not grow with the number of rows. Returns (rows copied, rows inserted).
+    """
+    column_list = ', '.join(columns)
+    staging = f'staging_{table}'
+    cur.execute(f'CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP')
+    stream = CopyStream(rows)
+    cur.copy_expert(f'COPY {staging} ({column_list}) FROM STDIN', stream, size=65536)
+    cur.execute(f'INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging} ON CONFLICT {on_conflict}')
+    inserted = cur.rowcount
+    cur.execute(f'DROP TABLE {staging}')
+    return stream.count, inserted
+
+
+def _load(conn, label, table, columns, rows):
+    """copy_rows in its own transaction, with progress output."""
+    started = time.perf_counter()
+    with conn.cursor() as cur:
+        copied, inserted = copy_rows(cur, table, columns, rows)
+        cur.execute(f'ANALYZE {table}')
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    print(f"{label}: {inserted} inserted, {copied - inserted} already present "
+          f"({elapsed:.1f}s, {copied / max(elapsed, 1e-9):,.0f} rows/s).")
+
+
+# --- Synthetic data ---
+def synthetic_product_rows(total, rng, prices):
+    """Products 51..total, each a re-priced variant of one of the 50 real products; records prices[id]."""
+    for product_id in range(len(products_data) + 1, total + 1):
+        base = products_data[(product_id - 1) % len(products_data)]
+        price = round(base["price"] * rng.uniform(0.8, 1.2), -2)
+        prices[product_id] = price
+        yield product_row({
+            "id": product_id,
+            "name": synthetic_product_name(product_id),
+            "category": base["category"],
+            "price": price,
+            "mrp": round(price * 1.18, -2),
+            "description": base["description"],
+            "badge": base["badge"] if rng.random() < 0.5 else None,
+        }, image_id=base["id"])
+
+
+def synthetic_product_name(product_id):
+    base = products_data[(product_id - 1) % len(products_data)]
+    if product_id <= len(products_data):
+        return base["name"]
+    series = (product_id - 1) // len(products_data)
+    return f'{base["name"]} {VARIANT_SUFFIXES[series % len(VARIANT_SUFFIXES)]} {series}'
+
+
+def popular_product(rng, product_count):
+    """A product id skewed towards the start of the catalog, like real order and wishlist traffic."""
+    return 1 + int(product_count * rng.random() ** 3)
+
+
+def synthetic_orders(rng, user_count, orders_per_user, product_count, prices, since):
+    """Yields (order row, [item rows]) for every synthetic user's orders, in id order."""
+    order_id = item_id = SYNTHETIC_ID_BASE
+    for n in range(1, user_count + 1):
+        for _ in range(orders_per_user):
+            order_id += 1
+            total, items = 0, []
+            for product_id in sorted({popular_product(rng, product_count) for _ in range(rng.randint(1, 3))}):
+                quantity = rng.randint(1, 2)
+                total += prices[product_id] * quantity
+                image_id = (product_id - 1) % len(products_data) + 1
+                item_id += 1
+                items.append((item_id, order_id, product_id, synthetic_product_name(product_id), prices[product_id],
+                              quantity, rng.choice(SIZES), f'{IMAGE_FOLDER_PATH}{image_id}.{IMAGE_EXTENSION}'))
+            order = (order_id, SYNTHETIC_ID_BASE + n, since + timedelta(seconds=rng.randint(0, 365 * 24 * 3600)),
+                     total, rng.choice(ORDER_STATUSES), f'Bench User {n}', '1 Benchmark Road', 'Mumbai',
+                     '400001', 'Cash on Delivery')
+            yield order, items
+
+
+def seed_benchmark_data(conn, product_count, user_count, orders_per_user, wishlist_per_user, seed=42):
+    """
+    Adds deterministic synthetic data on top of the 50 real products: extra
+    products, users `bench_user_<n>` (password BENCH_PASSWORD), their orders
+    with line items, and wishlist entries. The same seed and counts always give
+    the same rows, so re-running (or raising a count) only inserts what is
+    missing. Each table is streamed in with COPY and committed on its own.
+    """
+    product_count = max(product_count, len(products_data))
+    prices = array.array('d', [0.0]) * (product_count + 1)
+    for p in products_data:
+        prices[p["id"]] = p["price"]
+
+    _load(conn, "Products", 'products', PRODUCT_COLUMNS,
+          synthetic_product_rows(product_count, random.Random(f'{seed}:products'), prices))
+    if not user_count:
+        return
+
+    password_hash = generate_password_hash(BENCH_PASSWORD)  # hashing is slow; one hash for everyone
+    _load(conn, "Users", 'users', ('id', 'username', 'password_hash'),
+          ((SYNTHETIC_ID_BASE + n, f'{BENCH_USER_PREFIX}{n}', password_hash) for n in range(1, user_count + 1)))
+
+    if orders_per_user:
+        # Orders and their items are generated twice from the same seed, once
+        # per COPY, so that neither has to be held in memory.
+        since = datetime.combine(datetime.now().date(), datetime.min.time()) - timedelta(days=365)
+        orders = lambda: synthetic_orders(random.Random(f'{seed}:orders'), user_count, orders_per_user,
+                                          product_count, prices, since)
+        _load(conn, "Orders", 'orders',
+              ('id', 'user_id', 'order_date', 'total_amount', 'status', 'customer_name',
+               'shipping_address', 'city', 'postal_code', 'payment_method'),
+              (order for order, _items in orders()))
+        _load(conn, "Order items", 'order_items',
+              ('id', 'order_id', 'product_id', 'product_name', 'product_price', 'quantity', 'size', 'image'),
+              (item for _order, items in orders() for item in items))
+        refresh_product_sales(conn)
+
+    rng = random.Random(f'{seed}:wishlist')
+    _load(conn, "Wishlist entries", 'wishlist', ('user_id', 'product_id'),
+          ((SYNTHETIC_ID_BASE + n, product_id)
+           for n in range(1, user_count + 1)
+           for product_id in sorted({popular_product(rng, product_count) for _ in range(wishlist_per_user)})))
+
+
+def refresh_product_sales(conn):
+    """Recomputes product_sales (the bestseller ranking) from order_items after a bulk load."""
+    with conn.cursor() as cur:
+        cur.execute('''
+            INSERT INTO product_sales (product_id, units_sold)
+            SELECT product_id, COALESCE(SUM(quantity), 0)
+            FROM order_items
+            WHERE product_id IS NOT NULL
+            GROUP BY product_id
+            ON CONFLICT (product_id) DO UPDATE SET units_sold = EXCLUDED.units_sold
+            WHERE product_sales.units_sold IS DISTINCT FROM EXCLUDED.units_sold
+        ''')
+        print(f"Product sales: {cur.rowcount} products updated.")
+        cur.execute('ANALYZE product_sales')
+    conn.commit()
+
+
+def seed_products(cur):
+    """Inserts the 50 real products, updating any whose details have changed."""
+    updates = ', '.join(f'{column} = EXCLUDED.{column}' for column in PRODUCT_COLUMNS[1:])
+    changed = ' OR '.join(f'products.{column} IS DISTINCT FROM EXCLUDED.{column}' for column in PRODUCT_COLUMNS[1:])
+    execute_values(cur, f"""
+        INSERT INTO products ({', '.join(PRODUCT_COLUMNS)}) VALUES %s
+        ON CONFLICT (id) DO UPDATE SET {updates} WHERE {changed}
+    """, [product_row(p) for p in products_data])
+    return cur.rowcount
+
+
+def setup_database(product_count=len(products_data), user_count=0, orders_per_user=0, wishlist_per_user=0, seed=42,
+                   reset=False):
+    """
+    Applies pending schema migrations (migrate.py) and seeds the 'products' table. Safe to re-run:
+    existing rows are kept (the real products are updated in place). With
+    reset=True every table is dropped first, which is DESTRUCTIVE.
+    Optional counts add deterministic synthetic data for benchmarks (see seed_benchmark_data).
     """
     conn = None
     try:
         print("Connecting to the database...")
-        conn = get_db_connection()
+        conn = connect()
         with conn.cursor() as cur:
-            # --- Drop existing tables in reverse order of creation due to foreign keys ---
-            print("Dropping all database tables...")
-            cur.execute("DROP TABLE IF EXISTS wishlist, order_items, orders, users, products CASCADE;")
-
-            # --- Create all tables with proper schemas and constraints ---
-            print("Creating all database tables...")
-
-            # Users Table
-            cur.execute('''
-                CREATE TABLE users (
-                    id SERIAL PRIMARY KEY,
-                    username VARCHAR(100) UNIQUE NOT NULL,
-                    password_hash VARCHAR(255) NOT NULL
-                );
-            ''')
-
-            # Products Table
-            cur.execute('''
-                CREATE TABLE products (
-                    id INT PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    category VARCHAR(50),
-                    price NUMERIC(10, 2) NOT NULL,
-                    mrp NUMERIC(10, 2),
-                    description TEXT,
-                    style_code VARCHAR(50),
-                    origin VARCHAR(100),
-                    image_main VARCHAR(255),
-                    image_thumb1 VARCHAR(255),
-                    image_thumb2 VARCHAR(255),
-                    image_thumb3 VARCHAR(255),
-                    image_thumb4 VARCHAR(255),
-                    badge VARCHAR(50),
-                    colors_available INT DEFAULT 1
-                );
-            ''')
-
-            # Orders Table
-            cur.execute('''
-                CREATE TABLE orders (
-                    id SERIAL PRIMARY KEY,
-                    user_id INT REFERENCES users(id),
-                    order_date TIMESTAMP NOT NULL,
-                    total_amount NUMERIC(10, 2),
-                    status VARCHAR(50),
-                    customer_name VARCHAR(255),
-                    shipping_address TEXT,
-                    city VARCHAR(100),
-                    postal_code VARCHAR(20),
-                    payment_method VARCHAR(50)
-                );
-            ''')
-
-            # Order Items Table
-            cur.execute('''
-                CREATE TABLE order_items (
-                    id SERIAL PRIMARY KEY,
-                    order_id INT REFERENCES orders(id) ON DELETE CASCADE,
-                    product_id INT REFERENCES products(id),
-                    product_name VARCHAR(255),
-                    product_price NUMERIC(10, 2),
-                    quantity INT,
-                    size VARCHAR(50),
-                    image VARCHAR(255)
-                );
-            ''')
-
-            # Wishlist Table
-            cur.execute('''
-                CREATE TABLE wishlist (
-                    id SERIAL PRIMARY KEY,
-                    user_id INT REFERENCES users(id) ON DELETE CASCADE,
-                    product_id INT REFERENCES products(id) ON DELETE CASCADE,
-                    UNIQUE (user_id, product_id)
-                );
-            ''')
-            print("All tables created successfully.")
+            if reset:
+                # --- Drop existing tables in reverse order of creation due to foreign keys ---
+                print("Dropping all database tables...")
+                cur.execute("DROP TABLE IF EXISTS cart_items, carts, jobs, wishlist, product_sales, order_items, orders, users, products, catalog_state, schema_migrations CASCADE;")
+                conn.commit()
+
+        print("Applying schema migrations...")
+        migrate(conn)
 
+        with conn.cursor() as cur:
             # --- Seed the products table using the data list ---
             print("Seeding the products table...")
-            insert_query = """
-                INSERT INTO products (
-                    id, name, category, price, mrp, description, style_code,
-                    origin, image_main, image_thumb1, image_thumb2, image_thumb3,
-                    image_thumb4, badge, colors_available
-                ) VALUES (
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                );
-            """
-            for p in products_data:
-                product_tuple = (
-                    p.get("id"),
-                    p.get("name"),
-                    p.get("category"),
-                    p.get("price"),
-                    p.get("mrp"),
-                    p.get("description"),
-                    f'ALPHA-{p.get("id"):03d}',
-                    'Vietnam',
-                    f'{IMAGE_FOLDER_PATH}{p.get("id")}.{IMAGE_EXTENSION}',
-                    f'{IMAGE_FOLDER_PATH}{p.get("id")}-thumb1.{IMAGE_EXTENSION}',
-                    f'{IMAGE_FOLDER_PATH}{p.get("id")}-thumb2.{IMAGE_EXTENSION}',
-                    f'{IMAGE_FOLDER_PATH}{p.get("id")}-thumb3.{IMAGE_EXTENSION}',
-                    f'{IMAGE_FOLDER_PATH}{p.get("id")}-thumb4.{IMAGE_EXTENSION}',
-                    p.get("badge"),
-                    p.get("colors_available", 1)
-                )
-                cur.execute(insert_query, product_tuple)
-            
-            print(f"Inserted {len(products_data)} products into the database.")
-
-            # Commit all changes to the database
-            conn.commit()
-            print("Database seeding and population complete.")
+            changed = seed_products(cur)
+            print(f"Upserted {len(products_data)} products ({changed} new or changed).")
+        conn.commit()
+
+        if product_count > len(products_data) or user_count:
+            seed_benchmark_data(conn, product_count, user_count, orders_per_user, wishlist_per_user, seed)
+        print("Database seeding and population complete.")
 
     except (Exception, psycopg2.DatabaseError) as error:
         print(f"Error during database setup: {error}")
         if conn:
             conn.rollback() # Roll back any partial changes
+        raise  # a failed migration or seed must fail the build (build.sh runs this on deploy)
     finally:
         if conn:
             conn.close()
@@ -200,5 +351,13 @@ def setup_database():
 
 # This allows you to run 'python create_db.py' from your terminal
 if __name__ == '__main__':
-    setup_database()
-    
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Create missing tables and seed the database (idempotent).")
+    parser.add_argument('--reset', action='store_true', help="Drop every table first (DESTRUCTIVE).")
+    parser.add_argument('--products', type=int, default=len(products_data),
+                        help="Total catalog size; products beyond the real 50 are synthetic variants.")
+    parser.add_argument('--users', type=int, default=0, help="Benchmark users to create (bench_user_<n>).")
+    parser.add_argument('--orders-per-user', type=int, default=0)
+    parser.add_argument('--wishlist-per-user', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42, help="Random seed for the synthetic data.")
+    args = parser.parse_args()
+    setup_database(args.products, args.users, args.orders_per_user, args.wishlist_per_user, args.seed, args.reset)
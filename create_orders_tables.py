@@ -1,31 +0,0 @@
-import sqlite3
-
-conn = sqlite3.connect('products.db')
-cur = conn.cursor()
-
-# Create orders table
-cur.execute('''
-CREATE TABLE IF NOT EXISTS orders (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    date TEXT NOT NULL
-)
-''')
-
-# Create order_items table
-cur.execute('''
-CREATE TABLE IF NOT EXISTS order_items (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    order_id INTEGER NOT NULL,
-    product_id INTEGER NOT NULL,
-    name TEXT NOT NULL,
-    size TEXT,
-    quantity INTEGER NOT NULL,
-    price REAL NOT NULL,
-    FOREIGN KEY(order_id) REFERENCES orders(id)
-)
-''')
-
-conn.commit()
-conn.close()
-print("Order tables created successfully.")
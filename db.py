@@ -0,0 +1,323 @@
+# db.py
+# Bounded, thread-safe PostgreSQL connection pool shared by the web app,
+# background workers and the maintenance scripts.
+
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+import psycopg2
+import psycopg2.extensions
+from dotenv import load_dotenv
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+# --- Per-thread statement counting ---
+# Every connection made here counts the statements its cursors execute, and
+# the time they take, per thread. A request is served on one thread, so
+# reset_query_count() before it and query_count()/query_time() after it give
+# that request's queries-per-request and database time.
+_query_counter = threading.local()
+_counting_cursors = {}
+
+
+def query_count():
+    return getattr(_query_counter, 'count', 0)
+
+
+def query_time():
+    """Seconds spent in execute/executemany on this thread since the last reset."""
+    return getattr(_query_counter, 'seconds', 0.0)
+
+
+def reset_query_count():
+    _query_counter.count = 0
+    _query_counter.seconds = 0.0
+
+
+def _count_query(started):
+    _query_counter.count = getattr(_query_counter, 'count', 0) + 1
+    _query_counter.seconds = getattr(_query_counter, 'seconds', 0.0) + (time.perf_counter() - started)
+
+
+def _counting_cursor(base):
+    """A subclass of cursor class `base` whose execute/executemany are counted and timed (cached per class)."""
+    cls = _counting_cursors.get(base)
+    if cls is None:
+        def execute(self, query, vars=None):
+            started = time.perf_counter()
+            try:
+                return base.execute(self, query, vars)
+            finally:
+                _count_query(started)
+
+        def executemany(self, query, vars_list):
+            started = time.perf_counter()
+            try:
+                return base.executemany(self, query, vars_list)
+            finally:
+                _count_query(started)
+
+        cls = _counting_cursors[base] = type('Counting' + base.__name__, (base,),
+                                              {'execute': execute, 'executemany': executemany})
+    return cls
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    """A psycopg2 connection whose cursors (of any cursor_factory) count their statements."""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = _counting_cursor(base)
+        return super().cursor(*args, **kwargs)
+
+
+def _connect_kwargs(db_url):
+    """Turns a DATABASE_URL into keyword arguments for psycopg2.connect."""
+    result = urlparse(db_url)
+    return {
+        'dbname': result.path[1:],
+        'user': result.username,
+        'password': result.password,
+        'host': result.hostname,
+        'port': result.port,
+    }
+
+
+class ConnectionPool:
+    """
+    A fixed-size pool of psycopg2 connections.
+
+    Connections are health-checked when they are checked out and reset
+    (rolled back) when they are returned, so a borrower always gets a
+    connection with no open transaction.
+    """
+
+    def __init__(self, db_url, min_size=1, max_size=10, timeout=10.0,
+                 max_idle=300.0, max_lifetime=3600.0):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("Invalid pool size: min=%s max=%s" % (min_size, max_size))
+        self._connect_kwargs = _connect_kwargs(db_url)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+
+        self._lock = threading.Condition()
+        self._idle = deque()          # (conn, created_at, returned_at)
+        self._created_at = {}         # id(conn) -> creation time of checked-out conns
+        self._size = 0                # open connections, idle + in use
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'failed_health_checks': 0,
+        }
+
+        for _ in range(min_size):
+            conn = self._new_connection()
+            self._idle.append((conn, time.monotonic(), time.monotonic()))
+            self._size += 1
+
+    # --- Internal helpers ---
+    def _new_connection(self):
+        conn = psycopg2.connect(connection_factory=CountingConnection, **self._connect_kwargs)
+        with self._lock:
+            self._stats['created'] += 1
+        return conn
+
+    def _is_usable(self, conn, created_at, returned_at):
+        """Cheap health check: closed/broken connections and old ones are discarded."""
+        now = time.monotonic()
+        if conn.closed:
+            return False
+        if now - created_at > self.max_lifetime:
+            return False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if now - returned_at > self.max_idle:
+            # The server or a proxy may have dropped an idle socket; ping it.
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    # --- Public API ---
+    def getconn(self):
+        """Borrows a connection, waiting up to `timeout` seconds for one to free up."""
+        start = time.monotonic()
+        waited = False
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed.")
+                if self._idle:
+                    conn, created_at, returned_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout("Timed out waiting for a database connection.")
+                waited = True
+                self._lock.wait(remaining)
+
+            self._stats['checkouts'] += 1
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time_total'] += time.monotonic() - start
+
+        # Connecting and health checks happen outside the lock.
+        if conn is not None and not self._is_usable(conn, created_at, returned_at):
+            self._discard(conn)
+            with self._lock:
+                self._stats['failed_health_checks'] += 1
+                self._stats['recycled'] += 1
+            conn = None
+        if conn is None:
+            try:
+                conn = self._new_connection()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                    self._lock.notify()
+                raise
+            created_at = time.monotonic()
+
+        with self._lock:
+            self._created_at[id(conn)] = created_at
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Returns a connection to the pool, rolling back any open transaction."""
+        if not close and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                close = True
+
+        with self._lock:
+            created_at = self._created_at.pop(id(conn), time.monotonic())
+            expired = time.monotonic() - created_at > self.max_lifetime
+            if close or conn.closed or expired or self._closed:
+                self._size -= 1
+                self._stats['recycled'] += 1
+                self._discard(conn)
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._lock.notify()
+
+    def connection(self):
+        """Context manager for code running outside a request (threads, scripts)."""
+        return _PooledConnection(self)
+
+    def stats(self):
+        """A snapshot of pool counters, suitable for JSON or metrics export."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['size'] = self._size
+            snapshot['idle'] = len(self._idle)
+            snapshot['in_use'] = self._size - len(self._idle)
+            snapshot['min_size'] = self.min_size
+            snapshot['max_size'] = self.max_size
+        return snapshot
+
+    def closeall(self):
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._discard(conn)
+                self._size -= 1
+            self._lock.notify_all()
+
+
+class _PooledConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+
+    def __enter__(self):
+        self.conn = self.pool.getconn()
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.pool.putconn(self.conn)
+        self.conn = None
+        return False
+
+
+def _database_url():
+    if not os.environ.get("DATABASE_URL"):
+        # Scripts (create_db.py, migrate.py, jobs.py, ...) do not import app.py,
+        # which loads .env for the web app; the setting may only be there.
+        load_dotenv()
+    db_url = os.environ.get("DATABASE_URL")
+    if not db_url:
+        raise ValueError("DATABASE_URL environment variable is not set.")
+    return db_url
+
+
+def connect():
+    """Opens a dedicated, unpooled connection (for scripts and long-lived listeners)."""
+    return psycopg2.connect(connection_factory=CountingConnection, **_connect_kwargs(_database_url()))
+
+
+# --- Process-wide pool ---
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Returns the process-wide pool, creating it on first use from the environment.
+    A pool inherited across fork() is never reused; each worker builds its own.
+    """
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ConnectionPool(
+                _database_url(),
+                min_size=int(os.environ.get('DB_POOL_MIN', 1)),
+                max_size=int(os.environ.get('DB_POOL_MAX', 10)),
+                timeout=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+                max_idle=float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+                max_lifetime=float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600)),
+            )
+            _pool_pid = os.getpid()
+    return _pool
+
+
+def pool_stats():
+    """Pool counters, or None if no connection has been requested yet."""
+    if _pool is None or _pool_pid != os.getpid():
+        return None
+    return _pool.stats()
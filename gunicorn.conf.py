@@ -0,0 +1,29 @@
+# gunicorn.conf.py
+# Read automatically by `gunicorn app:app` when started from this directory.
+#
+# The app is imported and built once in the master (preload_app) and workers
+# are forked from it, so starting or recycling a worker costs a fork rather
+# than a fresh import. Everything that is not fork-safe (the connection pool,
+# the Gemini client, job worker threads, the log writer, the catalog listener)
+# is created lazily per process, keyed on the pid. The worker count comes
+# from WEB_CONCURRENCY, as gunicorn reads it by default.
+#
+# Workers are threaded (gthread): a chat request spends seconds waiting on the
+# model, and with one thread per worker it would block every other page on that
+# worker. It also gives chat_guard.ConcurrencyGate something to limit; its
+# CHAT_MAX_CONCURRENT slots and CHAT_MAX_WAITING queue are per process, so keep
+# GUNICORN_THREADS above their sum to leave threads for the rest of the site.
+
+import gc
+import os
+
+preload_app = True
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+
+
+def pre_fork(server, worker):
+    # Move everything the master has allocated so far out of the collector's
+    # reach, so that collections in the workers do not touch (and copy) those
+    # shared pages.
+    gc.freeze()
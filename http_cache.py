@@ -0,0 +1,104 @@
+# http_cache.py
+# HTTP validators (ETag / Last-Modified) for catalog pages.
+#
+# A catalog page is fully determined by the URL, the catalog version, the
+# templates and asset bundles it was rendered with, and the navbar's
+# per-visitor state (cart count, signed in or not). `conditional_page` hashes those into a strong
+# ETag *before* the view runs, so a revalidation that matches is answered with
+# a 304 without querying the database or rendering a template.
+#
+# Anonymous visitors without a cart all see the same page, so their responses
+# are marked public (and get a Last-Modified) so a shared cache or CDN can
+# hold them for CATALOG_CDN_MAX_AGE seconds; everyone else's are private.
+# Browsers revalidate either way, which is what the 304s make cheap.
+
+import functools
+import hashlib
+import os
+from datetime import date, datetime, timezone
+
+from flask import make_response, request
+
+from assets import assets_version
+from catalog import get_catalog
+
+CDN_MAX_AGE = int(os.environ.get('CATALOG_CDN_MAX_AGE', 60))
+
+_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+
+def _template_fingerprint():
+    """(hash, newest mtime) of the templates, so a deploy that edits them changes every ETag."""
+    digest, newest = hashlib.sha1(), 0.0
+    for name in sorted(os.listdir(_TEMPLATE_DIR)):
+        path = os.path.join(_TEMPLATE_DIR, name)
+        with open(path, 'rb') as f:
+            digest.update(name.encode() + b'\0' + f.read())
+        newest = max(newest, os.path.getmtime(path))
+    return digest.hexdigest()[:12], newest
+
+
+TEMPLATES_HASH, TEMPLATES_MTIME = _template_fingerprint()
+
+
+def _compute_etag(snapshot, viewer, extra=None):
+    # The footer shows the year; the bundle URLs change with every asset build.
+    parts = (request.path, tuple(sorted(request.args.items(multi=True))), snapshot.version,
+             TEMPLATES_HASH, assets_version(), date.today().year, viewer, extra)
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+
+def _not_modified(etag, last_modified):
+    # If-None-Match takes precedence; If-Modified-Since only counts without it.
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional_page(viewer, extra=None):
+    """
+    Decorator for catalog GET views. `viewer()` returns the hashable
+    per-visitor state the page shows (the app passes (cart count, signed in));
+    the falsy-everything state is treated as anonymous and public. `extra()`,
+    if given, returns any other hashable state the page depends on besides the
+    catalog (such as the sales ranks behind a bestseller sort), or None; pages
+    with extra state are validated by ETag only, as their age is not known.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            snapshot = get_catalog()
+            state = viewer()
+            public = not any(state)
+            extra_state = extra() if extra is not None else None
+            etag = _compute_etag(snapshot, state, extra_state)
+            last_modified = None
+            if public and extra_state is None:
+                # HTTP dates have whole-second precision.
+                last_modified = datetime.fromtimestamp(
+                    int(max(snapshot.updated_at, TEMPLATES_MTIME)), tz=timezone.utc)
+
+            if _not_modified(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.vary.add('Cookie')
+            if public:
+                # Browsers revalidate every time; a shared cache may serve it for CDN_MAX_AGE.
+                response.cache_control.public = True
+                response.cache_control.max_age = 0
+                response.cache_control.s_maxage = CDN_MAX_AGE
+            else:
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
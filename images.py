@@ -0,0 +1,94 @@
+# images.py
+# Responsive image markup from the manifest written by build_images.py.
+#
+# `picture(path, alt, sizes=...)` (a template global) turns a source path such
+# as product.image_main ("assets/products/1.jpeg") into a <picture> with AVIF
+# and WebP srcsets, a hashed fallback <img>, intrinsic width/height (no layout
+# shift) and lazy loading. Images missing from the manifest, or every image
+# when the build step has not run, fall back to a plain lazy <img> of the
+# original file, so the site works without a build.
+
+import json
+import logging
+import os
+import re
+
+from flask import url_for
+from markupsafe import Markup, escape
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+MANIFEST_PATH = os.path.join(STATIC_DIR, 'build', 'images', 'manifest.json')
+
+# Content-hashed build output: "<name>-<width>.<12 hex digits>.<ext>".
+_HASHED_RE = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+_SOURCE_TYPES = (('avif', 'image/avif'), ('webp', 'image/webp'))
+
+_manifest = None
+_manifest_mtime = None
+
+
+def is_immutable_asset(path, url):
+    """WhiteNoise `immutable_file_test`: hashed build files never change under the same name."""
+    return bool(_HASHED_RE.search(url))
+
+
+def load_manifest():
+    """The manifest, re-read when the build step rewrites it; {} if there is none."""
+    global _manifest, _manifest_mtime
+    try:
+        mtime = os.path.getmtime(MANIFEST_PATH)
+    except OSError:
+        mtime = None
+    if _manifest is None or mtime != _manifest_mtime:
+        try:
+            with open(MANIFEST_PATH, encoding='utf-8') as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            if mtime is not None:
+                logger.warning("Could not read the image manifest at %s; serving original images.", MANIFEST_PATH)
+            _manifest = {}
+        _manifest_mtime = mtime
+    return _manifest
+
+
+def _normalize(path):
+    """'static/assets/x.png', '/static/assets/x.png' and 'assets/x.png' all name 'assets/x.png'."""
+    path = (path or '').lstrip('/')
+    return path[len('static/'):] if path.startswith('static/') else path
+
+
+def _attributes(attrs):
+    # class_ -> class, fetchpriority etc. pass through; None drops the attribute.
+    parts = []
+    for name, value in attrs.items():
+        if value is None:
+            continue
+        name = name.rstrip('_').replace('_', '-')
+        parts.append(f' {name}="{escape(value)}"')
+    return ''.join(parts)
+
+
+def picture(path, alt='', sizes='100vw', lazy=True, **attrs):
+    """
+    Markup for one image. `sizes` is the image's rendered width for the
+    browser to pick a variant; `lazy=False` for above-the-fold images. Extra
+    keyword arguments become attributes of the <img> (class_ for class).
+    """
+    source = _normalize(path)
+    entry = load_manifest().get(source)
+    img_attrs = {'alt': alt, 'loading': 'lazy' if lazy else None, 'decoding': 'async', **attrs}
+    if entry is None:
+        return Markup(f'<img src="{escape(url_for("static", filename=source))}"{_attributes(img_attrs)}>')
+
+    parts = ['<picture>']
+    for fmt, mime in _SOURCE_TYPES:
+        variants = entry['variants'].get(fmt)
+        if variants:
+            srcset = ', '.join(f'{url_for("static", filename=file)} {width}w' for width, file in variants)
+            parts.append(f'<source type="{mime}" srcset="{escape(srcset)}" sizes="{escape(sizes)}">')
+    img_attrs = {'width': entry['width'], 'height': entry['height'], **img_attrs}
+    parts.append(f'<img src="{escape(url_for("static", filename=entry["fallback"]))}"{_attributes(img_attrs)}>')
+    parts.append('</picture>')
+    return Markup(''.join(parts))
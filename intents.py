@@ -0,0 +1,318 @@
+# intents.py
+# Local answers for the chatbot, so common questions never reach the model.
+#
+# - A data-driven FAQ knowledge base (chat_faq.json): each intent lists trigger
+#   phrases and either a canned answer or an action.
+# - A compiled multi-phrase matcher (Aho-Corasick over word tokens), so phrases
+#   only match whole words: "hi" no longer fires inside "shipping" or "this".
+# - A small parser for product questions ("running shoes under 5k",
+#   "women's sneakers between 3000 and 6000") that are answered with a direct
+#   catalog search, and for order-status questions that include an order number.
+#
+# Questions that name a catalog product ("does the Pace Runner fit wide
+# feet?") always go to the model, which can look the product up; so do long
+# messages in which the FAQ phrases are only a small part.
+#
+# Matching runs in microseconds; anything it isn't sure about returns None and
+# goes to the model.
+
+import json
+import os
+import re
+import threading
+from collections import Counter, deque
+from typing import NamedTuple
+
+from chatbot import LOGIN_REQUIRED_REPLY
+from search_index import tokenize
+
+KNOWLEDGE_BASE_PATH = os.environ.get(
+    'CHAT_FAQ_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chat_faq.json'))
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton whose alphabet is word tokens rather than characters.
+    `find(tokens)` returns every (end_index, phrase_length, payload) in one pass.
+    """
+
+    def __init__(self, phrases):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for tokens, payload in phrases:
+            state = 0
+            for token in tokens:
+                nxt = self._goto[state].get(token)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][token] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append((len(tokens), payload))
+
+        # Breadth-first pass to fill in failure links and merge outputs.
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(token, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, tokens):
+        matches, state = [], 0
+        for i, token in enumerate(tokens):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for length, payload in self._out[state]:
+                matches.append((i, length, payload))
+        return matches
+
+
+class Intent(NamedTuple):
+    name: str
+    answer: str
+    action: str
+    max_words: int
+    exclusive: bool  # only answers when the message has nothing else in it
+
+
+class LocalAnswer(NamedTuple):
+    intent: str
+    text: str
+
+
+# --- Product and order questions ---
+_AMOUNT = r'(?:₹|rs\.?|inr)?\s*(\d[\d,]*(?:\.\d+)?)\s*(k\b)?'
+_PRICE_PATTERNS = [
+    ('range', re.compile(rf'\b(?:between|from)\s+{_AMOUNT}\s*(?:and|to|-)\s*{_AMOUNT}')),
+    ('max', re.compile(rf'(?:\b(?:under|below|less than|cheaper than|within|up ?to|max(?:imum)?|not more than)|<)\s*{_AMOUNT}')),
+    ('min', re.compile(rf'(?:\b(?:over|above|more than|greater than|at least|min(?:imum)?|starting at)|>)\s*{_AMOUNT}')),
+]
+# "order #42", "order number 42", "ALPHA-42" always name an order; a bare
+# "order 42" or "#42" only does when the rest of the message is about orders
+# (not in "do you have size #9?").
+_ORDER_REF_RE = re.compile(r'(?:\border\s*(?:no\.?|number|id)\s*#?\s*|\border\s*#\s*|\balpha-)(\d+)\b')
+_BARE_ORDER_RE = re.compile(r'(?:\border\s+|#\s*)(\d+)\b')
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+PRODUCT_NOUNS = set(tokenize(
+    'shoe shoes sneaker sneakers trainer trainers boot boots sandal sandals slide slides slipper slippers '
+    'loafer loafers heels footwear kicks runners product products pair pairs'))
+# Words that carry no search meaning in a shopping question.
+QUERY_STOPWORDS = set(
+    'a an the me my i we you your do does have has any some show find get buy want need looking look for '
+    'please can could would like to of in with and or what which are is there that cost costs costing priced '
+    'price prices rs inr k shoe shoes footwear product products pair pairs something options option available '
+    'under below over above between from less more than cheaper within upto up max maximum min minimum at least '
+    'recommend suggest good best anything everything items stuff s hi hey hello rupee rupees'.split())
+
+# Words that may surround a greeting or a thank-you without making it a question.
+FILLER_WORDS = set(tokenize(' '.join(QUERY_STOPWORDS) + ' so much lot lots very again all guys team bot ok okay'))
+
+# An FAQ answer needs at least one matched phrase word per this many words of
+# the message; a single "shipping" in a long question is not enough to go on.
+WORDS_PER_MATCHED_WORD = 7
+
+
+def _amount(number, thousands):
+    value = float(number.replace(',', ''))
+    return value * 1000 if thousands else value
+
+
+def parse_price(text):
+    """(min_price, max_price, matched_span) from phrases like "under 5k" or "between 3000 and 6000"."""
+    for kind, pattern in _PRICE_PATTERNS:
+        m = pattern.search(text)
+        if not m:
+            continue
+        if kind == 'range':
+            low, high = sorted((_amount(m.group(1), m.group(2)), _amount(m.group(3), m.group(4))))
+            return low, high, m.span()
+        if kind == 'max':
+            return None, _amount(m.group(1), m.group(2)), m.span()
+        return _amount(m.group(1), m.group(2)), None, m.span()
+    return None, None, None
+
+
+class ProductNames:
+    """The catalog's product names (two words or more), found in a message as whole-word runs."""
+
+    def __init__(self, names):
+        self._names = {tuple(tokens) for tokens in map(tokenize, set(names)) if len(tokens) >= 2}
+        self._lengths = sorted({len(name) for name in self._names})
+
+    def mentioned_in(self, tokens):
+        return any(tuple(tokens[i:i + n]) in self._names
+                   for n in self._lengths for i in range(len(tokens) - n + 1))
+
+
+class IntentEngine:
+    """Compiled from a knowledge base dict ({'intents': [...]}, see chat_faq.json)."""
+
+    def __init__(self, knowledge_base):
+        self.intents = {}
+        phrases = []
+        for spec in knowledge_base['intents']:
+            intent = Intent(spec['name'], spec.get('answer'), spec.get('action'), spec.get('max_words'),
+                            spec.get('exclusive', False))
+            self.intents[intent.name] = intent
+            for phrase in spec['patterns']:
+                tokens = tokenize(phrase)
+                if tokens:
+                    phrases.append((tokens, intent.name))
+        self._order = {name: i for i, name in enumerate(self.intents)}
+        self.matcher = PhraseMatcher(phrases)
+
+    def score(self, tokens):
+        """Intent name -> score; each distinct phrase that matched adds its length in words."""
+        return self._match(tokens)[0]
+
+    def _match(self, tokens):
+        # (scores, intent name -> indexes of the tokens its phrases cover)
+        seen, scores, covered = set(), {}, {}
+        for end, length, name in self.matcher.find(tokens):
+            covered.setdefault(name, set()).update(range(end - length + 1, end + 1))
+            key = (name, tuple(tokens[end - length + 1:end + 1]))
+            if key not in seen:
+                seen.add(key)
+                scores[name] = scores.get(name, 0) + length
+        return scores, covered
+
+    def _is_only_content(self, name, tokens, covered):
+        """True if every word outside the intent's phrases is filler ("hi there", "thanks a lot")."""
+        return all(i in covered[name] or token in FILLER_WORDS for i, token in enumerate(tokens))
+
+    def answer(self, message, user, search=None, order_status=None, categories=(), product_names=None):
+        """
+        A LocalAnswer, or None when the question should go to the model.
+
+        `search(query, min_price, max_price)` and `order_status(order_id)` are the
+        chat tools, returning display text (`search` returns None when its query
+        words matched nothing); `categories` are the catalog's category names and
+        `product_names` its ProductNames.
+        """
+        text = (message or '').lower().strip()
+        tokens = tokenize(text)
+        if not tokens:
+            return None
+        scores, covered = self._match(tokens)
+        # "hi" or "thanks" only gets its canned reply when it is the whole message.
+        for name in [n for n in scores if self.intents[n].exclusive]:
+            if not self._is_only_content(name, tokens, covered):
+                del scores[name]
+
+        # 1. "Where is order 42?" - a number plus order wording.
+        order_match = _ORDER_REF_RE.search(text)
+        if not order_match and ('order_status' in scores or 'tracking' in scores):
+            order_match = _BARE_ORDER_RE.search(text)
+        if order_match and order_status is not None:
+            if not user.is_authenticated:
+                return LocalAnswer('order_status', LOGIN_REQUIRED_REPLY)
+            return LocalAnswer('order_status', order_status(int(order_match.group(1))))
+
+        # Anything about a particular product is for the model (and its product tools).
+        if product_names is not None and product_names.mentioned_in(tokens):
+            return None
+        min_score = len(tokens) / WORDS_PER_MATCHED_WORD
+
+        # 2. Product questions with a price limit, or a category plus a product word.
+        if search is not None:
+            product = self._product_search(text, tokens, search, categories)
+            if product is not None:
+                return product
+
+        # 3. FAQ answers: the best-scoring intent, plus a runner-up that isn't just noise.
+        ranked = sorted(
+            (name for name, intent in ((n, self.intents[n]) for n in scores)
+             if intent.answer and scores[name] >= min_score
+             and (intent.max_words is None or len(tokens) <= intent.max_words)),
+            key=lambda name: (-scores[name], self._order[name]))
+        if ranked:
+            top = scores[ranked[0]]
+            chosen = [name for name in ranked[:2] if scores[name] * 3 >= top]
+            return LocalAnswer(chosen[0], ' '.join(self.intents[name].answer for name in chosen))
+
+        # 4. Order questions without a number.
+        if scores.get('order_status', 0) >= min_score:
+            if not user.is_authenticated:
+                return LocalAnswer('order_status', LOGIN_REQUIRED_REPLY)
+            return LocalAnswer('order_status', "Which order would you like me to check? Tell me the order "
+                                               "number (for example ALPHA-42); you can find it on your account page.")
+        return None
+
+    def _product_search(self, text, tokens, search, categories):
+        min_price, max_price, span = parse_price(text)
+        token_set = set(tokens)
+        matched_categories = [c for c in categories if c and set(tokenize(c)) <= token_set]
+        has_product_word = bool(token_set & PRODUCT_NOUNS)
+        if span is None and not (matched_categories and has_product_word):
+            return None
+
+        remainder = text[:span[0]] + ' ' + text[span[1]:] if span else text
+        words = [w for w in _WORD_RE.findall(remainder)
+                 if w not in QUERY_STOPWORDS and not w.isdigit()]
+        if not words and matched_categories:
+            words = [matched_categories[0]]
+        query = ' '.join(dict.fromkeys(words)) or None
+        result = search(query, min_price, max_price)
+        if result is None:
+            # Words we could not match ("black", "kids") need the model, not a "none found".
+            return None
+        return LocalAnswer('product_search', result)
+
+
+# --- Process-wide engine and counters ---
+_engine = None
+_engine_lock = threading.Lock()
+_product_names = (None, None)  # (catalog snapshot, its ProductNames)
+
+_resolutions = Counter()
+_local_intents = Counter()
+_counter_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                with open(KNOWLEDGE_BASE_PATH, encoding='utf-8') as f:
+                    _engine = IntentEngine(json.load(f))
+    return _engine
+
+
+def product_names(snapshot):
+    """ProductNames for a catalog snapshot, built once per snapshot."""
+    global _product_names
+    built_for, names = _product_names
+    if built_for is not snapshot:
+        names = ProductNames(p.name for p in snapshot.products)
+        _product_names = (snapshot, names)
+    return names
+
+
+def record_resolution(how, intent=None):
+    """Counts how a chat message was answered: 'local', 'cache', 'model' or 'fallback'."""
+    with _counter_lock:
+        _resolutions[how] += 1
+        if intent:
+            _local_intents[intent] += 1
+
+
+def resolution_stats():
+    with _counter_lock:
+        total = sum(_resolutions.values())
+        return {
+            'total': total,
+            'by_resolution': dict(_resolutions),
+            'local_rate': _resolutions['local'] / total if total else 0.0,
+            'local_intents': dict(_local_intents),
+        }
@@ -0,0 +1,245 @@
+# jobs.py
+# A small durable job queue on top of PostgreSQL.
+#
+# Jobs live in the `jobs` table (see migrations/). Workers claim due jobs in
+# batches with FOR UPDATE SKIP LOCKED, so any number of worker threads and
+# processes can share the table without handing out the same job twice.
+# Handlers receive every claimed job of their kind at once, which lets them
+# apply one batched UPDATE instead of one per job. Failed jobs are retried
+# with exponential backoff until `max_attempts` is reached.
+#
+# Run workers separately from the web processes with:
+#     python jobs.py --workers 4
+
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import log_config
+import metrics
+from db import get_pool
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 3600
+STALE_LOCK_SECONDS = 600
+DEFAULT_MAX_ATTEMPTS = 5
+
+_handlers = {}
+
+
+def job_handler(kind):
+    """
+    Registers `func(conn, payloads)` as the handler for jobs of `kind`.
+    It receives a list of payload dicts and must not commit; the worker
+    commits the handler's work together with the jobs' completion.
+    """
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+
+def enqueue_sql(payload_sql='%s', source=None):
+    """
+    The INSERT that adds jobs, for use on its own or inside a larger statement
+    (checkout adds its ship_order job in the same statement as the order).
+    Adds one job per row of `source` (a FROM clause), or a single job without
+    one; `payload_sql` is the payload expression. Parameters, in order: kind,
+    any in `payload_sql`, delay in seconds, max_attempts.
+    """
+    return f'''
+        INSERT INTO jobs (kind, payload, run_at, max_attempts)
+        SELECT %s, {payload_sql}, NOW() + make_interval(secs => %s), %s
+        {f'FROM {source}' if source else ''}
+    '''
+
+
+def enqueue(cur, kind, payload, delay=0, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Adds a job using the caller's cursor, so it commits with the caller's transaction."""
+    cur.execute(enqueue_sql('%s::jsonb') + ' RETURNING id', (kind, json.dumps(payload), delay, max_attempts))
+    return cur.fetchone()[0]
+
+
+def _claim(conn, batch_size):
+    with conn.cursor() as cur:
+        cur.execute('''
+            UPDATE jobs SET status = 'running', locked_at = NOW(), attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM jobs
+                WHERE status = 'pending' AND run_at <= NOW()
+                ORDER BY run_at
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, kind, payload, attempts, max_attempts, EXTRACT(EPOCH FROM NOW() - run_at)
+        ''', (batch_size,))
+        rows = cur.fetchall()
+    conn.commit()
+    for row in rows:
+        metrics.JOB_LAG_SECONDS.observe(max(float(row[5]), 0.0), kind=row[1])
+    return [row[:5] for row in rows]
+
+
+def _release_stale(conn):
+    """Puts back jobs whose worker died mid-run (locked for longer than STALE_LOCK_SECONDS)."""
+    with conn.cursor() as cur:
+        cur.execute('''
+            UPDATE jobs SET status = 'pending', locked_at = NULL
+            WHERE status = 'running' AND locked_at < NOW() - make_interval(secs => %s)
+        ''', (STALE_LOCK_SECONDS,))
+        released = cur.rowcount
+    conn.commit()
+    return released
+
+
+def _backoff(attempts):
+    delay = min(RETRY_BASE_SECONDS * (2 ** (attempts - 1)), RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _fail(conn, jobs, error):
+    with conn.cursor() as cur:
+        for job_id, _kind, _payload, attempts, max_attempts in jobs:
+            if attempts >= max_attempts:
+                cur.execute("UPDATE jobs SET status = 'failed', last_error = %s, locked_at = NULL WHERE id = %s",
+                            (error, job_id))
+            else:
+                cur.execute('''UPDATE jobs SET status = 'pending', last_error = %s, locked_at = NULL,
+                                   run_at = NOW() + make_interval(secs => %s)
+                               WHERE id = %s''', (error, _backoff(attempts), job_id))
+    conn.commit()
+
+
+def run_batch(conn, batch_size=50):
+    """Claims and runs one batch of due jobs. Returns the number of jobs claimed."""
+    claimed = _claim(conn, batch_size)
+    by_kind = {}
+    for job in claimed:
+        by_kind.setdefault(job[1], []).append(job)
+
+    for kind, jobs in by_kind.items():
+        handler = _handlers.get(kind)
+        if handler is None:
+            _fail(conn, jobs, f"No handler registered for job kind {kind!r}")
+            metrics.JOBS_PROCESSED.inc(len(jobs), kind=kind, outcome='unhandled')
+            continue
+        try:
+            handler(conn, [job[2] for job in jobs])
+            with conn.cursor() as cur:
+                # Completed jobs are deleted; their effects live in the domain tables.
+                cur.execute('DELETE FROM jobs WHERE id = ANY(%s)', ([job[0] for job in jobs],))
+            conn.commit()
+            metrics.JOBS_PROCESSED.inc(len(jobs), kind=kind, outcome='done')
+        except Exception as e:
+            conn.rollback()
+            logger.exception("Job batch of %d %r jobs failed", len(jobs), kind)
+            _fail(conn, jobs, repr(e))
+            metrics.JOBS_PROCESSED.inc(len(jobs), kind=kind, outcome='failed')
+    return len(claimed)
+
+
+class WorkerPool:
+    """A fixed number of threads that poll for and run due jobs."""
+
+    def __init__(self, workers=2, batch_size=50, poll_interval=1.0):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        last_reap = 0.0
+        while not self._stop.is_set():
+            claimed = 0
+            try:
+                with get_pool().connection() as conn:
+                    if time.monotonic() - last_reap > STALE_LOCK_SECONDS / 2:
+                        released = _release_stale(conn)
+                        if released:
+                            logger.warning("Released %d stale jobs", released)
+                        last_reap = time.monotonic()
+                    claimed = run_batch(conn, self.batch_size)
+            except Exception:
+                logger.exception("Job worker loop failed")
+            if claimed < self.batch_size:
+                # Queue drained (or errored): wait, with jitter so workers don't poll in lockstep.
+                self._stop.wait(self.poll_interval * random.uniform(0.5, 1.5))
+
+
+# --- In-process workers for single-service deployments ---
+_local_pool = None
+_local_pid = None
+_local_lock = threading.Lock()
+
+
+def start_in_process_workers():
+    """
+    Starts a small worker pool inside a web process unless JOBS_IN_PROCESS=0.
+    Set JOBS_IN_PROCESS=0 when running `python jobs.py` as its own service.
+    Cheap to call on every request; the pool is started once per process.
+    """
+    global _local_pool, _local_pid
+    if _local_pid == os.getpid():
+        return
+    if os.environ.get('JOBS_IN_PROCESS', '1') == '0' or not os.environ.get('DATABASE_URL'):
+        _local_pid = os.getpid()
+        return
+    with _local_lock:
+        if _local_pid != os.getpid():
+            _local_pid = os.getpid()
+            _local_pool = WorkerPool(workers=int(os.environ.get('JOBS_IN_PROCESS_WORKERS', 1))).start()
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run background job workers.")
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('JOB_WORKERS', 2)))
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--once', action='store_true', help="Run due jobs once and exit.")
+    args = parser.parse_args()
+
+    log_config.configure_logging()
+    import tasks  # noqa: F401  (registers the job handlers)
+
+    if args.once:
+        with get_pool().connection() as conn:
+            while run_batch(conn, args.batch_size) == args.batch_size:
+                pass
+        return
+
+    pool = WorkerPool(args.workers, args.batch_size, args.poll_interval).start()
+    logger.info("Started %d job workers", args.workers)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop(timeout=10)
+
+
+if __name__ == '__main__':
+    # Run through the importable module so handlers registered by `tasks`
+    # land in the same registry the workers read from.
+    import jobs
+    jobs.main()
@@ -0,0 +1,283 @@
+# loadtest_chatbot.py
+# Drives the chatbot endpoints with a realistic mix of messages at a fixed
+# concurrency and reports throughput, latency percentiles, model calls per
+# message and the fallback rate.
+#
+# By default it runs in-process against the Flask app with the offline
+# FakeModel (no network, no API key), so it can run anywhere the app's
+# database is reachable:
+#     python loadtest_chatbot.py --concurrency 8 --requests 400 --latency 0.3
+# Point it at a running server instead with --url (the server's own CHAT_MODEL
+# setting then decides which backend answers):
+#     python loadtest_chatbot.py --url http://localhost:5000 --concurrency 16 --duration 60
+#
+# Each virtual user has its own client address so the per-client rate limit
+# (chat_guard.py) applies per user, as in production. In-process that is the
+# request's REMOTE_ADDR; over HTTP it is an X-Forwarded-For header, which the
+# server only honours when started with TRUSTED_PROXY_HOPS=1. Virtual users
+# send back-to-back, far faster than people type, so in-process runs lift the
+# limit unless --rate-limit is given; against a server, limited requests show
+# up as 429s in the status counts.
+#
+# The before/after counters come from /chat-stats, which needs the server's
+# STATS_TOKEN in the environment (in-process runs set one up themselves).
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+# (weight, message): FAQ-style questions the local engine answers, product
+# searches, open questions that need the model, and order lookups.
+MESSAGE_MIX = [
+    (10, "Hi"),
+    (8, "How long does shipping take?"),
+    (8, "What is your return policy?"),
+    (5, "Do you accept cash on delivery?"),
+    (5, "What size should I buy?"),
+    (10, "Show me running shoes under 8000"),
+    (6, "Women's sneakers between 3000 and 7000"),
+    (4, "Any men's shoes over 10000?"),
+    (12, "Which shoes are best for flat feet?"),
+    (8, "What would you recommend for a half marathon?"),
+    (6, "Are your sneakers good for gym workouts?"),
+    (5, "Compare your most expensive and cheapest running shoes"),
+    (5, "Where is my order 42?"),
+    (4, "Can you tell me a joke?"),
+]
+
+# Tool calls for the offline model, so open questions exercise the tool round-trip.
+FAKE_SCRIPT = [
+    {"match": r"recommend|best|compare|good for",
+     "tool_calls": [{"name": "search_products", "args": {"query": "running shoes"}}]},
+    {"match": r"joke", "reply": "I'm the FITX Bot, and my expertise is limited to our products and your orders."},
+]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class InProcessClient:
+    """Talks to the app through Flask's test client (one per virtual user)."""
+
+    def __init__(self, app, user_ip):
+        self._client = app.test_client()
+        self._client.environ_base['REMOTE_ADDR'] = user_ip
+
+    def post(self, path, message):
+        response = self._client.post(path, json={'message': message}, buffered=False)
+        first_byte = None
+        for _chunk in response.response:
+            if first_byte is None:
+                first_byte = time.perf_counter()
+        response.close()
+        return response.status_code, first_byte
+
+    def get_json(self, path):
+        return self._client.get(path, headers=_stats_headers()).get_json()
+
+
+class HttpClient:
+    """Talks to a running server over HTTP, keeping cookies per virtual user."""
+
+    def __init__(self, base_url, user_ip, timeout=60):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self._headers = {'X-Forwarded-For': user_ip, 'Content-Type': 'application/json'}
+        self._opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def post(self, path, message):
+        request = urllib.request.Request(self.base_url + path, data=json.dumps({'message': message}).encode(),
+                                         headers=self._headers, method='POST')
+        try:
+            with self._opener.open(request, timeout=self.timeout) as response:
+                first_byte = None
+                while response.read(1024):
+                    if first_byte is None:
+                        first_byte = time.perf_counter()
+                return response.status, first_byte
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, None
+
+    def get_json(self, path):
+        request = urllib.request.Request(self.base_url + path, headers=_stats_headers())
+        with self._opener.open(request, timeout=self.timeout) as response:
+            return json.load(response)
+
+
+def _stats_headers():
+    token = os.environ.get('STATS_TOKEN')
+    return {'Authorization': f'Bearer {token}'} if token else {}
+
+
+def run_load(make_client, path, concurrency, total_requests, duration, seed, unique):
+    """Runs the workers; returns (latencies, first_byte_latencies, status_counts, errors, elapsed)."""
+    rng = random.Random(seed)
+    weights = [w for w, _ in MESSAGE_MIX]
+    messages = [m for _, m in MESSAGE_MIX]
+    lock = threading.Lock()
+    issued = [0]
+    latencies, first_bytes, statuses, errors = [], [], {}, []
+    deadline = time.perf_counter() + duration if duration else None
+
+    def next_message():
+        with lock:
+            if total_requests and issued[0] >= total_requests:
+                return None
+            if deadline and time.perf_counter() >= deadline:
+                return None
+            issued[0] += 1
+            message = rng.choices(messages, weights)[0]
+            return f"{message} (v{issued[0]})" if unique else message
+
+    def worker(index):
+        client = make_client(f"10.{index // 250}.{index % 250}.1")
+        while (message := next_message()) is not None:
+            start = time.perf_counter()
+            try:
+                status, first_byte = client.post(path, message)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            end = time.perf_counter()
+            with lock:
+                latencies.append(end - start)
+                if first_byte is not None:
+                    first_bytes.append(first_byte - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, first_bytes, statuses, errors, time.perf_counter() - started
+
+
+def _delta(after, before, *keys):
+    """after[k1][k2]... - before[k1][k2]..., treating missing counters as 0."""
+    def dig(stats):
+        for key in keys:
+            stats = (stats or {}).get(key)
+        return stats or 0
+    return dig(after) - dig(before)
+
+
+def build_report(latencies, first_bytes, statuses, errors, elapsed, stats_before, stats_after, config):
+    latencies, first_bytes = sorted(latencies), sorted(first_bytes)
+    total = sum(_delta(stats_after, stats_before, 'resolutions', 'by_resolution', k)
+                for k in ('local', 'cache', 'model', 'fallback'))
+    model_messages = _delta(stats_after, stats_before, 'model', 'messages')
+    model_calls = _delta(stats_after, stats_before, 'model', 'model_calls')
+    fallbacks = _delta(stats_after, stats_before, 'resolutions', 'by_resolution', 'fallback')
+    ms = lambda values, pct: round(percentile(values, pct) * 1000, 1)
+    return {
+        'config': config,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'status_counts': {str(k): v for k, v in sorted(statuses.items())},
+        'latency_ms': {'p50': ms(latencies, 50), 'p95': ms(latencies, 95), 'p99': ms(latencies, 99),
+                       'max': round(latencies[-1] * 1000, 1) if latencies else 0.0},
+        'first_byte_ms': {'p50': ms(first_bytes, 50), 'p95': ms(first_bytes, 95), 'p99': ms(first_bytes, 99)},
+        'resolutions': {k: _delta(stats_after, stats_before, 'resolutions', 'by_resolution', k)
+                        for k in ('local', 'cache', 'model', 'fallback')},
+        'model_calls_per_message': round(model_calls / total, 3) if total else 0.0,
+        'model_calls_per_model_message': round(model_calls / model_messages, 3) if model_messages else 0.0,
+        'fallback_rate': round(fallbacks / total, 4) if total else 0.0,
+        'guard': {'gate_rejected': _delta(stats_after, stats_before, 'gate', 'rejected'),
+                  'rate_limited': _delta(stats_after, stats_before, 'rate_limit', 'limited'),
+                  'breaker_state': (stats_after or {}).get('breaker', {}).get('state')},
+    }
+
+
+def print_report(report):
+    print(f"Requests:     {report['requests']} in {report['elapsed_seconds']}s "
+          f"({report['throughput_rps']} req/s), errors: {report['errors']}")
+    print(f"Status codes: {report['status_counts']}")
+    lat = report['latency_ms']
+    print(f"Latency (ms): p50={lat['p50']} p95={lat['p95']} p99={lat['p99']} max={lat['max']}")
+    fb = report['first_byte_ms']
+    print(f"First byte:   p50={fb['p50']} p95={fb['p95']} p99={fb['p99']}")
+    print(f"Answered by:  {report['resolutions']}")
+    print(f"Model calls per message: {report['model_calls_per_message']} "
+          f"(per message that reached the model: {report['model_calls_per_model_message']})")
+    print(f"Fallback rate: {report['fallback_rate']:.2%}   guard: {report['guard']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the chatbot endpoints.")
+    parser.add_argument('--url', help="Base URL of a running server (default: in-process app).")
+    parser.add_argument('--stream', action='store_true', help="Use /chatbot/stream instead of /chatbot.")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help="Total requests (ignored with --duration).")
+    parser.add_argument('--duration', type=float, help="Run for this many seconds instead of a fixed count.")
+    parser.add_argument('--seed', type=int, default=1, help="Seed for the message mix.")
+    parser.add_argument('--unique', action='store_true', help="Make every message unique to defeat the answer cache.")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+    parser.add_argument('--rate-limit', action='store_true', help="Keep the per-client chat rate limit in-process.")
+    fake = parser.add_argument_group('in-process fake model')
+    fake.add_argument('--latency', type=float, default=0.2, help="Seconds before the model's first chunk.")
+    fake.add_argument('--chunk-delay', type=float, default=0.02)
+    fake.add_argument('--jitter', type=float, default=0.2, help="Latency jitter as a fraction (0.2 = +/-20%%).")
+    fake.add_argument('--error-rate', type=float, default=0.0)
+    fake.add_argument('--stream-error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    path = '/chatbot/stream' if args.stream else '/chatbot'
+    total_requests = None if args.duration else args.requests
+    config = {k: v for k, v in vars(args).items() if k != 'json'}
+
+    if args.url:
+        make_client = lambda ip: HttpClient(args.url, ip)
+    else:
+        os.environ.setdefault('CHAT_MODEL', 'fake')
+        os.environ.setdefault('JOBS_IN_PROCESS', '0')
+        os.environ.setdefault('STATS_TOKEN', secrets.token_urlsafe(16))
+        if not args.rate_limit:
+            os.environ['CHAT_RATE_PER_MINUTE'] = os.environ['CHAT_RATE_BURST'] = '1000000000'
+        import app as storefront
+        import chat_models
+        if os.environ['CHAT_MODEL'] == 'fake':
+            chat_models.set_chat_model(chat_models.FakeModel(
+                first_chunk_delay=args.latency, chunk_delay=args.chunk_delay, jitter=args.jitter,
+                script=FAKE_SCRIPT, error_rate=args.error_rate, stream_error_rate=args.stream_error_rate,
+                seed=args.seed))
+        app = storefront.create_app()
+        make_client = lambda ip: InProcessClient(app, ip)
+
+    stats_client = make_client('127.0.0.1')
+    stats_before = stats_client.get_json('/chat-stats')
+    latencies, first_bytes, statuses, errors, elapsed = run_load(
+        make_client, path, args.concurrency, total_requests, args.duration, args.seed, args.unique)
+    stats_after = stats_client.get_json('/chat-stats')
+
+    report = build_report(latencies, first_bytes, statuses, errors, elapsed, stats_before, stats_after, config)
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(report)
+    if errors:
+        print(f"First error: {errors[0]}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
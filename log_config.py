@@ -0,0 +1,204 @@
+# log_config.py
+# Structured, non-blocking logging for the web app and the job workers.
+#
+# - Every record is written as one JSON object per line (time, level, logger,
+#   message, request id, any `extra=` fields, traceback) to stderr and to a
+#   size-rotated file (LOG_FILE, default logs/app.log; LOG_MAX_BYTES,
+#   LOG_BACKUP_COUNT; LOG_FILE= disables it).
+# - Request threads only put records on a bounded in-memory queue; a single
+#   background thread formats and writes them. When the queue is full (the disk
+#   or the log pipe has stalled) records are dropped and counted in
+#   log_records_dropped_total rather than making a request wait.
+# - DEBUG records are sampled (LOG_DEBUG_SAMPLE_RATE, default 0.01) so that
+#   turning LOG_LEVEL=DEBUG on in production does not flood the queue.
+# - API keys, bearer tokens, passwords in URLs and password/token/secret
+#   fields are masked before anything is written.
+#
+# Call `configure_logging()` once per process and `init_app(app)` to tag
+# records with the request id (taken from X-Request-ID or generated, and
+# echoed back in the response).
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+
+from flask import g, has_request_context, request
+
+import metrics
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.environ.get('LOG_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'app.log'))
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 0.01))
+
+LOG_RECORDS_DROPPED = metrics.Counter('log_records_dropped_total',
+                                      'Log records discarded because the log queue was full.')
+
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# (pattern, replacement) pairs applied to every message and string field.
+_REDACTIONS = (
+    (re.compile(r'AIza[0-9A-Za-z_-]{35}'), '[REDACTED]'),                       # Google API keys
+    (re.compile(r'(?i)\b(bearer)\s+[A-Za-z0-9._~+/=-]+'), r'\1 [REDACTED]'),
+    (re.compile(r'(\w+://[^:/@\s]+:)[^@\s]+@'), r'\1[REDACTED]@'),                # user:password@host
+    (re.compile(r'(?i)\b(api[_-]?key|password|passwd|secret|token)(["\']?\s*[:=]\s*["\']?)[^\s"\',;&]+'),
+     r'\1\2[REDACTED]'),
+)
+_SECRET_FIELD_RE = re.compile(r'(?i)(api[_-]?key|password|passwd|secret|token|authorization)')
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`.
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'request_id'}
+
+_listener = None
+_listener_pid = None
+
+
+def redact(text):
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _redact_value(key, value):
+    if _SECRET_FIELD_RE.search(key):
+        return '[REDACTED]'
+    if isinstance(value, str):
+        return redact(value)
+    if isinstance(value, dict):
+        return {k: _redact_value(str(k), v) for k, v in value.items()}
+    return value
+
+
+def current_request_id():
+    """The id of the request being handled, or None outside a request."""
+    if has_request_context():
+        return g.get('request_id')
+    return None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; `extra=` fields are included as top-level keys."""
+
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': redact(record.getMessage()),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = _redact_value(key, value)
+        if record.exc_text:
+            entry['exc'] = redact(record.exc_text)
+        entry['pid'] = record.process
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _DebugSampler(logging.Filter):
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < LOG_DEBUG_SAMPLE_RATE
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread; never waits for it."""
+
+    def prepare(self, record):
+        # Resolve everything that depends on the calling thread (request id,
+        # message arguments, the live traceback) before the record changes hands.
+        record = logging.makeLogRecord(vars(record))
+        record.request_id = current_request_id()
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        _ensure_listener(self)
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def _ensure_listener(handler):
+    # Threads do not survive a fork, so a gunicorn worker starts its own writer
+    # (on a fresh queue, whose lock the parent's writer may have held) the first
+    # time it logs.
+    global _listener_pid
+    if _listener_pid == os.getpid() or _listener is None:
+        return
+    _listener_pid = os.getpid()
+    handler.queue = _listener.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _listener._thread = None
+    _listener.start()
+
+
+def _writer_handlers():
+    formatter = JsonFormatter()
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if LOG_FILE:
+        os.makedirs(os.path.dirname(LOG_FILE) or '.', exist_ok=True)
+        handlers.append(logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def configure_logging():
+    """Routes the root logger through the queue to the background writer (idempotent)."""
+    global _listener, _listener_pid
+    if _listener is not None:
+        return
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = _NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(_DebugSampler())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, *_writer_handlers(), respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+    atexit.register(_stop_listener)
+
+
+def _stop_listener():
+    # Flushes what is still queued when the process exits normally.
+    if _listener is not None and _listener_pid == os.getpid() and _listener._thread is not None:
+        _listener.stop()
+
+
+# --- Request ids ---
+def _assign_request_id():
+    incoming = request.headers.get('X-Request-ID', '')
+    g.request_id = incoming if _REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+
+
+def _echo_request_id(response):
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+
+def init_app(app):
+    """Gives every request on `app` an id that its log records carry."""
+    app.before_request_funcs.setdefault(None, []).insert(0, _assign_request_id)
+    app.after_request(_echo_request_id)
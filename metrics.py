@@ -0,0 +1,214 @@
+# metrics.py
+# Request timing and process metrics.
+#
+# - Counters and histograms kept in memory per process and rendered at
+#   /metrics in the Prometheus text format (each gunicorn worker reports its
+#   own; scrape them per instance or aggregate by pod). Like the other stats
+#   pages it is off unless STATS_TOKEN is set, and the scraper must send the
+#   token as a bearer token (`authorization: {credentials: ...}` in Prometheus).
+# - Per-request timings: total, database (query count and time, counted by
+#   db.py's connections), template rendering and model calls. They are added
+#   to every response as a Server-Timing header (SERVER_TIMING=0 turns that
+#   off) and logged, with the breakdown as a `timing` field, when a request
+#   takes longer than SLOW_REQUEST_MS. Streamed responses are timed when they
+#   close, after their headers have gone out, so they get no Server-Timing.
+#
+# Call `init_app(app)` once. Other modules update the metrics below directly or
+# through observe_model_call/record_timing, which also work outside a request.
+
+import bisect
+import logging
+import os
+import threading
+import time
+
+from flask import g, has_app_context, request, before_render_template, template_rendered
+
+import db
+
+logger = logging.getLogger(__name__)
+
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING', '1') != '0'
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 500))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+LAG_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+_registry = []
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _k, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _v), v in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    """A monotonically increasing count per label set."""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Histogram:
+    """Observations bucketed per label set (cumulative buckets, sum and count, as Prometheus expects)."""
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}   # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), series[:-1]):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else repr(float(bound))
+                    lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", le)])} {cumulative}')
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f'{self.name}_sum{labels} {series[-1]}')
+                lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Time spent handling a request in the app.',
+                            ('endpoint', 'method', 'status'))
+REQUEST_DB_QUERIES = Histogram('http_request_db_queries', 'Database statements executed per request.',
+                               ('endpoint',), COUNT_BUCKETS)
+REQUEST_DB_SECONDS = Histogram('http_request_db_seconds', 'Time spent in database statements per request.',
+                               ('endpoint',))
+REQUEST_TEMPLATE_SECONDS = Histogram('http_request_template_seconds', 'Time spent rendering templates per request.',
+                                     ('endpoint',))
+MODEL_CALL_SECONDS = Histogram('chat_model_call_seconds', 'Latency of one chat model call, to its last chunk.',
+                               ('outcome',))
+MODEL_TOKENS = Counter('chat_model_tokens_total', 'Tokens reported by the chat model.', ('kind',))
+JOB_LAG_SECONDS = Histogram('job_lag_seconds', 'Delay between a job becoming due and a worker claiming it.',
+                            ('kind',), LAG_BUCKETS)
+JOBS_PROCESSED = Counter('jobs_processed_total', 'Background jobs run, by outcome.', ('kind', 'outcome'))
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- Per-request timings ---
+def record_timing(name, seconds):
+    """Adds `seconds` to the current request's `name` timing (no-op outside a request)."""
+    if has_app_context() and 'timings' in g:
+        g.timings[name] = g.timings.get(name, 0.0) + seconds
+
+
+def observe_model_call(seconds, outcome, prompt_tokens=None, output_tokens=None):
+    MODEL_CALL_SECONDS.observe(seconds, outcome=outcome)
+    if prompt_tokens:
+        MODEL_TOKENS.inc(prompt_tokens, kind='prompt')
+    if output_tokens:
+        MODEL_TOKENS.inc(output_tokens, kind='output')
+    record_timing('model', seconds)
+
+
+def _before_request():
+    db.reset_query_count()
+    g.request_started = time.perf_counter()
+    g.timings = {}
+    g.template_depth = 0
+
+
+def _before_render(sender, template, context, **extra):
+    if 'timings' in g:
+        if g.template_depth == 0:
+            g.template_started = time.perf_counter()
+        g.template_depth += 1
+
+
+def _after_render(sender, template, context, **extra):
+    # Fragments render inside their page; only the outermost render is timed.
+    if 'timings' in g and g.template_depth > 0:
+        g.template_depth -= 1
+        if g.template_depth == 0:
+            record_timing('template', time.perf_counter() - g.template_started)
+
+
+def _after_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    timings = g.get('timings', {})
+    if response.is_streamed:
+        # The body runs after this hook (under stream_with_context), so a
+        # streamed request is measured when the server closes the response.
+        method, path, status = request.method, request.path, response.status_code
+        response.call_on_close(lambda: _observe_request(started, endpoint, method, path, status, timings))
+        return response
+
+    total, queries, db_seconds = _observe_request(started, endpoint, request.method, request.path,
+                                                  response.status_code, timings)
+    if SERVER_TIMING_ENABLED:
+        entries = [f'app;dur={total * 1000:.1f}', f'db;dur={db_seconds * 1000:.1f};desc="{queries} queries"']
+        entries += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in sorted(timings.items())]
+        response.headers.add('Server-Timing', ', '.join(entries))
+    return response
+
+
+def _observe_request(started, endpoint, method, path, status, timings):
+    """Records a finished request; returns (total seconds, queries, database seconds)."""
+    total = time.perf_counter() - started
+    queries, db_seconds = db.query_count(), db.query_time()
+
+    REQUEST_SECONDS.observe(total, endpoint=endpoint, method=method, status=status)
+    REQUEST_DB_QUERIES.observe(queries, endpoint=endpoint)
+    REQUEST_DB_SECONDS.observe(db_seconds, endpoint=endpoint)
+    REQUEST_TEMPLATE_SECONDS.observe(timings.get('template', 0.0), endpoint=endpoint)
+
+    if total * 1000 >= SLOW_REQUEST_MS:
+        breakdown = {'endpoint': endpoint, 'status': status, 'total_ms': round(total * 1000, 1),
+                     'db_ms': round(db_seconds * 1000, 1), 'db_queries': queries,
+                     **{f'{name}_ms': round(seconds * 1000, 1) for name, seconds in sorted(timings.items())}}
+        logger.warning("Slow request: %s %s took %.0f ms", method, path, total * 1000,
+                       extra={'timing': breakdown})
+    return total, queries, db_seconds
+
+
+def init_app(app):
+    """Starts timing requests on `app`; call before other before_request hooks are registered."""
+    app.before_request_funcs.setdefault(None, []).insert(0, _before_request)
+    app.after_request(_after_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
@@ -0,0 +1,166 @@
+# migrate.py
+# Versioned schema migrations for the PostgreSQL database.
+#
+# Migrations are the files in migrations/, named NNNN_description.sql and
+# applied in order. Each applied version is recorded in `schema_migrations`,
+# so running this again only applies what is new:
+#
+#     python migrate.py            # apply pending migrations
+#     python migrate.py --status   # list applied and pending migrations
+#
+# A migration runs in a single transaction, unless its first line is
+#     -- migrate: no-transaction
+# (needed for CREATE INDEX CONCURRENTLY). Such a file is run one
+# semicolon-terminated statement at a time, so every statement in it should be
+# safe to repeat (IF NOT EXISTS) in case the run is interrupted.
+#
+# Migrations only ever add: never edit one that has been applied anywhere;
+# add a new file instead. create_db.py runs the migrations before seeding.
+
+import argparse
+import hashlib
+import os
+import re
+import sys
+
+from db import connect
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+NO_TRANSACTION_MARKER = '-- migrate: no-transaction'
+# Serializes concurrent runs (e.g. two instances deploying at once).
+LOCK_KEY = 7_412_300_001
+
+_FILE_RE = re.compile(r'^(\d{4})_(\w+)\.sql$')
+
+
+class Migration:
+    def __init__(self, version, name, path):
+        self.version, self.name, self.path = version, name, path
+        with open(path, encoding='utf-8') as f:
+            self.sql = f.read()
+        self.checksum = hashlib.sha1(self.sql.encode('utf-8')).hexdigest()
+        self.transactional = not self.sql.startswith(NO_TRANSACTION_MARKER)
+
+    def statements(self):
+        """The file split into statements (no-transaction migrations only: no $$ bodies)."""
+        without_comments = re.sub(r'--[^\n]*', '', self.sql)
+        return [s.strip() for s in without_comments.split(';') if s.strip()]
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for file_name in sorted(os.listdir(directory)):
+        match = _FILE_RE.match(file_name)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, file_name)))
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def _ensure_version_table(conn):
+    with conn.cursor() as cur:
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                checksum VARCHAR(40) NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        ''')
+    conn.commit()
+
+
+def applied_versions(conn):
+    """{version: checksum} of the migrations already applied."""
+    with conn.cursor() as cur:
+        cur.execute('SELECT version, checksum FROM schema_migrations')
+        return dict(cur.fetchall())
+
+
+def _invalid_indexes(cur):
+    # A CREATE INDEX CONCURRENTLY that fails leaves an INVALID index behind,
+    # which IF NOT EXISTS would then silently skip on the next run.
+    cur.execute('''
+        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE NOT i.indisvalid
+    ''')
+    return [row[0] for row in cur.fetchall()]
+
+
+def apply(conn, migration):
+    if migration.transactional:
+        with conn.cursor() as cur:
+            cur.execute(migration.sql)
+    else:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                for statement in migration.statements():
+                    cur.execute(statement)
+                invalid = _invalid_indexes(cur)
+        finally:
+            conn.autocommit = False
+        if invalid:
+            raise RuntimeError(f"Invalid indexes after {migration.path}: {', '.join(invalid)}. "
+                               "DROP INDEX CONCURRENTLY them and run the migration again.")
+    with conn.cursor() as cur:
+        cur.execute('INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)',
+                    (migration.version, migration.name, migration.checksum))
+    conn.commit()
+
+
+def migrate(conn, migrations=None, log=print):
+    """Applies every pending migration in order; returns the versions applied."""
+    migrations = load_migrations() if migrations is None else migrations
+    _ensure_version_table(conn)
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_advisory_lock(%s)', (LOCK_KEY,))
+    conn.commit()
+    try:
+        applied = applied_versions(conn)
+        conn.commit()
+        done = []
+        for migration in migrations:
+            if migration.version in applied:
+                if applied[migration.version] != migration.checksum:
+                    log(f"Warning: {os.path.basename(migration.path)} has changed since it was applied.")
+                continue
+            log(f"Applying {os.path.basename(migration.path)}...")
+            try:
+                apply(conn, migration)
+            except Exception:
+                conn.rollback()
+                raise
+            done.append(migration.version)
+        return done
+    finally:
+        with conn.cursor() as cur:
+            cur.execute('SELECT pg_advisory_unlock(%s)', (LOCK_KEY,))
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument('--status', action='store_true', help="List migrations and whether they are applied.")
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        if args.status:
+            _ensure_version_table(conn)
+            applied = applied_versions(conn)
+            for migration in load_migrations():
+                state = 'applied' if migration.version in applied else 'pending'
+                print(f"{migration.version:04d} {migration.name:40} {state}")
+            return 0
+        done = migrate(conn)
+        print(f"Applied {len(done)} migration(s)." if done else "The schema is up to date.")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
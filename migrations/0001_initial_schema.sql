@@ -0,0 +1,152 @@
+-- Baseline schema: everything create_db.py used to create directly. Written
+-- with IF NOT EXISTS (and DROP/CREATE for triggers) so databases created
+-- before migrations existed adopt it; the ALTER TABLEs add the columns that
+-- the original create_db.py did not create to those databases.
+
+-- Users Table
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(100) UNIQUE NOT NULL,
+    password_hash VARCHAR(255) NOT NULL
+);
+
+-- Products Table
+CREATE TABLE IF NOT EXISTS products (
+    id INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    category VARCHAR(50),
+    price NUMERIC(10, 2) NOT NULL,
+    mrp NUMERIC(10, 2),
+    description TEXT,
+    style_code VARCHAR(50),
+    origin VARCHAR(100),
+    image_main VARCHAR(255),
+    image_thumb1 VARCHAR(255),
+    image_thumb2 VARCHAR(255),
+    image_thumb3 VARCHAR(255),
+    image_thumb4 VARCHAR(255),
+    badge VARCHAR(50),
+    colors_available INT DEFAULT 1,
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(category, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    ) STORED
+);
+ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(category, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+) STORED;
+
+-- Indexes for SEARCH_BACKEND=postgres (search_index.py): full-text and trigram.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS products_search_vector_idx ON products USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS products_name_trgm_idx ON products USING GIN (name gin_trgm_ops);
+
+-- Orders Table
+CREATE TABLE IF NOT EXISTS orders (
+    id SERIAL PRIMARY KEY,
+    user_id INT REFERENCES users(id),
+    order_date TIMESTAMP NOT NULL,
+    total_amount NUMERIC(10, 2),
+    status VARCHAR(50),
+    customer_name VARCHAR(255),
+    shipping_address TEXT,
+    city VARCHAR(100),
+    postal_code VARCHAR(20),
+    payment_method VARCHAR(50),
+    idempotency_key VARCHAR(64)
+);
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64);
+-- Checkout's ON CONFLICT (user_id, idempotency_key) turns a resubmitted order into a no-op.
+CREATE UNIQUE INDEX IF NOT EXISTS orders_user_idempotency_key_idx ON orders (user_id, idempotency_key);
+
+-- Order Items Table
+CREATE TABLE IF NOT EXISTS order_items (
+    id SERIAL PRIMARY KEY,
+    order_id INT REFERENCES orders(id) ON DELETE CASCADE,
+    product_id INT REFERENCES products(id),
+    product_name VARCHAR(255),
+    product_price NUMERIC(10, 2),
+    quantity INT,
+    size VARCHAR(50),
+    image VARCHAR(255)
+);
+
+-- Wishlist Table
+CREATE TABLE IF NOT EXISTS wishlist (
+    id SERIAL PRIMARY KEY,
+    user_id INT REFERENCES users(id) ON DELETE CASCADE,
+    product_id INT REFERENCES products(id) ON DELETE CASCADE,
+    UNIQUE (user_id, product_id)
+);
+
+-- Carts (server-side, see carts.py). Anonymous carts have no user_id;
+-- a user's cart is claimed at login.
+CREATE TABLE IF NOT EXISTS carts (
+    id VARCHAR(64) PRIMARY KEY,
+    user_id INT UNIQUE REFERENCES users(id) ON DELETE CASCADE,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE TABLE IF NOT EXISTS cart_items (
+    cart_id VARCHAR(64) REFERENCES carts(id) ON DELETE CASCADE,
+    product_id INT REFERENCES products(id) ON DELETE CASCADE,
+    size VARCHAR(50) NOT NULL DEFAULT '',
+    quantity INT NOT NULL CHECK (quantity > 0),
+    PRIMARY KEY (cart_id, product_id, size)
+);
+
+-- Jobs Table (background work queue, see jobs.py)
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    run_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    last_error TEXT,
+    locked_at TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+CREATE INDEX IF NOT EXISTS jobs_due_idx ON jobs (run_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS jobs_running_idx ON jobs (locked_at) WHERE status = 'running';
+
+-- Catalog version: bumped by a trigger on every change to `products` so each
+-- web worker's in-memory catalog (catalog.py) knows when to reload.
+CREATE TABLE IF NOT EXISTS catalog_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+INSERT INTO catalog_state DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+DECLARE
+    new_version BIGINT;
+BEGIN
+    UPDATE catalog_state SET version = version + 1, updated_at = NOW()
+    RETURNING version INTO new_version;
+    PERFORM pg_notify('catalog_changed', new_version::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS products_changed ON products;
+CREATE TRIGGER products_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON products
+FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+-- Tell every web worker to drop its cached copy of a changed user (user_cache.py).
+CREATE OR REPLACE FUNCTION notify_user_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('user_changed', OLD.id::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_changed ON users;
+CREATE TRIGGER users_changed
+AFTER UPDATE OR DELETE ON users
+FOR EACH ROW EXECUTE FUNCTION notify_user_changed();
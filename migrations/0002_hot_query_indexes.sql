@@ -0,0 +1,17 @@
+-- migrate: no-transaction
+-- Indexes for the app's hot queries; check_query_plans.py EXPLAINs those
+-- queries and fails if one still scans a large table. Built CONCURRENTLY so
+-- that adding them to a live database does not block writes.
+-- (wishlist lookups by user already use the UNIQUE (user_id, product_id) index.)
+
+-- Order history: WHERE user_id = ... ORDER BY order_date DESC, id DESC, keyset on (order_date, id).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS orders_user_date_idx ON orders (user_id, order_date DESC, id DESC);
+
+-- Items of a page of orders, of a just-placed order, and the FK from orders.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS order_items_order_id_idx ON order_items (order_id);
+
+-- Catalog listing filtered by category and price.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS products_category_price_idx ON products (category, price);
+
+-- Badge filters ("Bestseller", "New Arrival"); most products have none.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS products_badge_idx ON products (badge) WHERE badge IS NOT NULL;
@@ -0,0 +1,17 @@
+-- Units sold per product, for the bestseller sort of the product listing.
+-- Checkout (place_order in app.py) adds each new order's quantities in the
+-- same statement that inserts the order, so ranking products never has to
+-- aggregate order_items.
+
+CREATE TABLE IF NOT EXISTS product_sales (
+    product_id INT PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+    units_sold BIGINT NOT NULL DEFAULT 0
+);
+
+-- Orders placed before this migration.
+INSERT INTO product_sales (product_id, units_sold)
+SELECT product_id, COALESCE(SUM(quantity), 0)
+FROM order_items
+WHERE product_id IS NOT NULL
+GROUP BY product_id
+ON CONFLICT (product_id) DO UPDATE SET units_sold = EXCLUDED.units_sold;
@@ -0,0 +1,116 @@
+# pg_listener.py
+# One background LISTEN connection per process, fanning PostgreSQL
+# NOTIFY messages out to in-process callbacks (cache invalidation etc.).
+
+import logging
+import os
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+from db import connect
+
+logger = logging.getLogger(__name__)
+
+
+class PgListener:
+    """
+    Dispatches NOTIFY payloads on subscribed channels to callbacks.
+
+    Notifications sent while the listener is disconnected are lost, so
+    `on_reconnect` callbacks run after every (re)connect; caches use them to
+    drop everything they might have missed.
+    """
+
+    def __init__(self, poll_timeout=5.0, retry_delay=2.0):
+        self.poll_timeout = poll_timeout
+        self.retry_delay = retry_delay
+        self._callbacks = {}          # channel -> [callback(payload)]
+        self._reconnect_callbacks = []
+        self._lock = threading.Lock()
+        self._thread_pid = None
+        self._conn = None
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            new_channel = channel not in self._callbacks
+            callbacks = self._callbacks.setdefault(channel, [])
+            if callback not in callbacks:
+                callbacks.append(callback)
+            conn = self._conn
+        if new_channel and conn is not None:
+            # The running thread only LISTENs on channels known at connect time;
+            # force a reconnect so it picks up the new one.
+            self._drop_connection()
+        self._ensure_started()
+        return callback
+
+    def on_reconnect(self, callback):
+        with self._lock:
+            if callback not in self._reconnect_callbacks:
+                self._reconnect_callbacks.append(callback)
+        return callback
+
+    def _ensure_started(self):
+        # Threads do not survive fork(), so each worker process starts its own.
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._conn = None
+            threading.Thread(target=self._run, name='pg-listener', daemon=True).start()
+
+    def _drop_connection(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    def _connect(self):
+        conn = connect()
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with self._lock:
+            channels = list(self._callbacks)
+        with conn.cursor() as cur:
+            for channel in channels:
+                cur.execute('LISTEN "%s"' % channel.replace('"', ''))
+        self._conn = conn
+        for callback in list(self._reconnect_callbacks):
+            try:
+                callback()
+            except Exception:
+                logger.exception("pg_listener reconnect callback failed")
+        return conn
+
+    def _dispatch(self, notify):
+        with self._lock:
+            callbacks = list(self._callbacks.get(notify.channel, ()))
+        for callback in callbacks:
+            try:
+                callback(notify.payload)
+            except Exception:
+                logger.exception("pg_listener callback for %s failed", notify.channel)
+
+    def _run(self):
+        while True:
+            try:
+                conn = self._conn or self._connect()
+                if select.select([conn], [], [], self.poll_timeout) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._dispatch(conn.notifies.pop(0))
+            except Exception:
+                logger.warning("pg_listener connection lost; retrying in %.0fs", self.retry_delay, exc_info=True)
+                self._drop_connection()
+                time.sleep(self.retry_delay)
+
+
+listener = PgListener()
@@ -0,0 +1,88 @@
+# render_cache.py
+# Caches for rendered HTML.
+#
+# - Page cache: whole responses of pages that only vary by the visitor's cart
+#   count (the navbar badge), served to anonymous visitors. Keyed on the path,
+#   the catalog version and the cart count.
+# - Fragment cache: template partials rendered from a template via
+#   `render_fragment` (navbar, footer, product cards), keyed on the template,
+#   the catalog version and the few variables the partial depends on. Logged-in
+#   pages are still rendered per request but reuse these pieces.
+#
+# Both are per-worker LRU caches; a new catalog version changes every key, so
+# edits to products never show stale markup. Set RENDER_CACHE=0 to turn both
+# off (they are also bypassed while the app runs in debug mode, so template
+# edits show up immediately).
+
+import functools
+import os
+from datetime import date
+
+from flask import current_app, render_template, request
+from flask_login import current_user
+from markupsafe import Markup
+
+from cache import TTLCache
+from catalog import get_catalog
+
+RENDER_CACHE_ENABLED = os.environ.get('RENDER_CACHE', '1') != '0'
+
+_pages = TTLCache(
+    maxsize=int(os.environ.get('PAGE_CACHE_SIZE', 256)),
+    ttl=float(os.environ.get('PAGE_CACHE_TTL', 300)),
+    name='pages',
+)
+_fragments = TTLCache(
+    maxsize=int(os.environ.get('FRAGMENT_CACHE_SIZE', 20000)),
+    ttl=float(os.environ.get('FRAGMENT_CACHE_TTL', 600)),
+    name='fragments',
+)
+
+
+def _enabled():
+    return RENDER_CACHE_ENABLED and not current_app.debug
+
+
+def render_fragment(template_name, key=None, **context):
+    """
+    Renders a partial template, cached. `key` identifies the variant (e.g. a
+    product id); without one the context values themselves are the key, so
+    they must be hashable. Exposed to templates as `render_fragment`.
+    """
+    if not _enabled():
+        return Markup(render_template(template_name, **context))
+    # The footer's copyright year comes from a context processor.
+    cache_key = (template_name, get_catalog().version, date.today().year,
+                 key if key is not None else tuple(sorted(context.items())))
+    html = _fragments.get(cache_key)
+    if html is None:
+        html = Markup(render_template(template_name, **context))
+        _fragments.set(cache_key, html)
+    return html
+
+
+def cached_page(vary):
+    """
+    Decorator for GET views whose page is the same for every anonymous visitor
+    apart from the cart count; `vary()` returns that count. Logged-in visitors
+    always get a fresh render.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not _enabled() or current_user.is_authenticated:
+                return view(*args, **kwargs)
+            cache_key = (request.path, get_catalog().version, vary())
+            html = _pages.get(cache_key)
+            if html is None:
+                html = view(*args, **kwargs)
+                if not isinstance(html, str):
+                    return html  # a redirect or custom response; not cacheable
+                _pages.set(cache_key, html)
+            return html
+        return wrapper
+    return decorator
+
+
+def render_cache_stats():
+    return {'pages': _pages.stats(), 'fragments': _fragments.stats()}
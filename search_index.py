@@ -0,0 +1,220 @@
+# search_index.py
+# Product search over the in-memory catalog.
+#
+# An inverted index is built from each catalog snapshot (and rebuilt when the
+# catalog version changes). Queries are tokenized the same way as documents;
+# each query term matches exactly, by prefix, or within one edit of an indexed
+# term, and results are ranked by how many query terms they matched and then
+# by a field-weighted score (name > category > description).
+#
+# With SEARCH_BACKEND=postgres the same API is answered by PostgreSQL's
+# full-text search (`products.search_vector`) and pg_trgm similarity, using
+# the indexes created in migrations/.
+
+import bisect
+import math
+import os
+import re
+import threading
+
+from catalog import catalog_manager
+
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'memory').lower()
+
+FIELD_WEIGHTS = {'name': 3.0, 'category': 2.0, 'description': 1.0}
+EXACT_BOOST, PREFIX_BOOST, FUZZY_BOOST = 1.0, 0.6, 0.4
+MIN_PREFIX_LEN = 2
+MIN_FUZZY_LEN = 4
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def _stem(token):
+    # Very light suffix folding: "shoes" -> "shoe", "running"/"runner" -> "run".
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        token = token[:-1]
+    for suffix in ('ing', 'er'):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            token = token[:-len(suffix)]
+            if len(token) > 3 and token[-1] == token[-2] and token[-1] not in 'aeiouls':
+                token = token[:-1]
+            break
+    return token
+
+
+def tokenize(text):
+    return [_stem(t) for t in _TOKEN_RE.findall((text or '').lower())]
+
+
+def _deletes(term):
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _within_one_edit(a, b):
+    """True if a and b differ by at most one insert, delete, substitution or adjacent swap."""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diffs = [i for i in range(la) if a[i] != b[i]]
+        if len(diffs) == 1:
+            return True
+        return (len(diffs) == 2 and diffs[1] == diffs[0] + 1
+                and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]])
+    if la > lb:
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+class SearchIndex:
+    """An immutable inverted index over one catalog snapshot."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.version = snapshot.version
+        postings = {}                 # term -> {product_id: weight}
+        for product in snapshot.products:
+            for field, weight in FIELD_WEIGHTS.items():
+                for raw in _TOKEN_RE.findall((getattr(product, field) or '').lower()):
+                    # Index the surface form too, so typos are measured against
+                    # "runner" rather than its stem "run".
+                    for token in {raw, _stem(raw)}:
+                        docs = postings.setdefault(token, {})
+                        docs[product.id] = docs.get(product.id, 0.0) + weight
+        self.postings = postings
+        self.vocabulary = sorted(postings)
+
+        total = max(len(snapshot.products), 1)
+        self.idf = {term: math.log(1 + total / len(docs)) for term, docs in postings.items()}
+
+        # Symmetric-delete neighbourhood for one-edit typo tolerance.
+        self.deletes = {}
+        for term in self.vocabulary:
+            if len(term) >= MIN_FUZZY_LEN:
+                for variant in _deletes(term):
+                    self.deletes.setdefault(variant, []).append(term)
+
+    def _expand(self, token):
+        """Indexed terms matching a query token, with their match-quality boost."""
+        matches = {}
+        if token in self.postings:
+            matches[token] = EXACT_BOOST
+        if len(token) >= MIN_PREFIX_LEN:
+            i = bisect.bisect_left(self.vocabulary, token)
+            while i < len(self.vocabulary) and self.vocabulary[i].startswith(token):
+                matches.setdefault(self.vocabulary[i], PREFIX_BOOST)
+                i += 1
+        if len(token) >= MIN_FUZZY_LEN:
+            candidates = set(self.deletes.get(token, ()))
+            for variant in _deletes(token):
+                if variant in self.postings:
+                    candidates.add(variant)
+                candidates.update(self.deletes.get(variant, ()))
+            for term in candidates:
+                if term not in matches and _within_one_edit(token, term):
+                    matches[term] = FUZZY_BOOST
+        return matches
+
+    def search(self, query, min_price=None, max_price=None, limit=None):
+        """Ranked products for `query`, optionally restricted to a price range."""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        scores, coverage = {}, {}
+        for token in tokens:
+            best = {}
+            for term, boost in self._expand(token).items():
+                idf = self.idf[term]
+                for product_id, weight in self.postings[term].items():
+                    score = weight * boost * idf
+                    if score > best.get(product_id, 0.0):
+                        best[product_id] = score
+            for product_id, score in best.items():
+                scores[product_id] = scores.get(product_id, 0.0) + score
+                coverage[product_id] = coverage.get(product_id, 0) + 1
+
+        products = []
+        for product_id in scores:
+            product = self.snapshot.get(product_id)
+            if min_price is not None and product.price < min_price:
+                continue
+            if max_price is not None and product.price > max_price:
+                continue
+            products.append(product)
+        if not products:
+            return []
+
+        # Prefer results that matched every query term; fall back to partial matches.
+        best_coverage = max(coverage[p.id] for p in products)
+        products = [p for p in products if coverage[p.id] == best_coverage]
+        products.sort(key=lambda p: (-scores[p.id], p.id))
+        return products[:limit] if limit is not None else products
+
+
+# --- Index lifecycle: one index per catalog version ---
+_index = None
+_index_lock = threading.Lock()
+
+
+def _rebuild(snapshot):
+    global _index
+    index = SearchIndex(snapshot)
+    with _index_lock:
+        if _index is None or _index.version != snapshot.version:
+            _index = index
+
+
+catalog_manager().on_change(_rebuild)
+
+
+def get_search_index(snapshot):
+    index = _index
+    if index is None or index.version != snapshot.version:
+        _rebuild(snapshot)
+        index = _index
+    return index
+
+
+# --- PostgreSQL backend ---
+def _pg_search(conn, snapshot, query, min_price=None, max_price=None, limit=None):
+    tokens = [t for t in _TOKEN_RE.findall((query or '').lower())]
+    if not tokens:
+        return []
+    # Every token as a prefix term; tokens are [a-z0-9]+ so they are safe in tsquery syntax.
+    tsquery = ' & '.join(f'{t}:*' for t in tokens)
+    sql = '''
+        SELECT id
+        FROM products, to_tsquery('simple', %s) AS q
+        WHERE (search_vector @@ q OR name %% %s)
+    '''
+    params = [tsquery, query]
+    if min_price is not None:
+        sql += ' AND price >= %s'
+        params.append(min_price)
+    if max_price is not None:
+        sql += ' AND price <= %s'
+        params.append(max_price)
+    sql += ' ORDER BY ts_rank_cd(search_vector, q) + similarity(name, %s) DESC, id'
+    params.append(query)
+    if limit is not None:
+        sql += ' LIMIT %s'
+        params.append(limit)
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        ids = [row[0] for row in cur.fetchall()]
+    return [p for p in (snapshot.get(i) for i in ids) if p is not None]
+
+
+def search_products(snapshot, query, min_price=None, max_price=None, limit=None, conn=None):
+    """
+    Ranked full-text product search. Uses PostgreSQL when SEARCH_BACKEND is
+    'postgres' and a connection is given, otherwise the in-memory index.
+    """
+    if SEARCH_BACKEND == 'postgres' and conn is not None:
+        return _pg_search(conn, snapshot, query, min_price, max_price, limit)
+    return get_search_index(snapshot).search(query, min_price, max_price, limit)
@@ -9,6 +9,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // 🔧 Force chat URL to use the correct backend route
     const chatUrl = "/chatbot";  // 👈 important: match Flask route
+    const streamUrl = "/chatbot/stream";  // Server-Sent Events version of the same endpoint
 
     // Toggle chat window
     chatBtn.addEventListener('click', () => {
@@ -27,7 +28,20 @@ document.addEventListener('DOMContentLoaded', function() {
         // Show "typing" indicator
         showTypingIndicator();
 
-        // Send message to Flask backend
+        // Stream the answer token by token; fall back to the plain JSON endpoint
+        // if streaming isn't supported or fails before anything arrives.
+        streamReply(messageText).catch(error => {
+            if (error && error.partial) {
+                removeTypingIndicator();
+                return;
+            }
+            console.warn('Streaming chat failed, falling back:', error);
+            fetchReply(messageText);
+        });
+    });
+
+    // Classic request/response chat
+    function fetchReply(messageText) {
         fetch(chatUrl, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -43,7 +57,71 @@ document.addEventListener('DOMContentLoaded', function() {
             removeTypingIndicator();
             appendMessage('⚠️ Sorry, something went wrong. Please try again.', 'bot-message');
         });
-    });
+    }
+
+    // Streaming chat over Server-Sent Events (read from a POST response body)
+    async function streamReply(messageText) {
+        if (!window.ReadableStream || !window.TextDecoder) throw new Error('Streaming not supported');
+
+        const response = await fetch(streamUrl, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+            body: JSON.stringify({ message: messageText })
+        });
+        if (response.status === 429) {
+            // Rate limited: show the server's message rather than retrying on /chatbot.
+            const data = await response.json();
+            removeTypingIndicator();
+            appendMessage(data.response, 'bot-message');
+            return;
+        }
+        if (!response.ok || !response.body) throw new Error('Bad streaming response: ' + response.status);
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let messageDiv = null;
+
+        const handleEvent = (event, data) => {
+            if (event === 'token' || event === 'error') {
+                if (!messageDiv) {
+                    removeTypingIndicator();
+                    messageDiv = appendMessage('', 'bot-message');
+                }
+                text += (event === 'error' ? ' ' : '') + data.text;
+                messageDiv.innerHTML = text;
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            }
+        };
+
+        try {
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const raw = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+                    let event = 'message';
+                    let data = '';
+                    raw.split('\n').forEach(line => {
+                        if (line.startsWith('event:')) event = line.slice(6).trim();
+                        else if (line.startsWith('data:')) data += line.slice(5).trim();
+                    });
+                    if (data) handleEvent(event, JSON.parse(data));
+                }
+            }
+        } catch (error) {
+            // Keep whatever already arrived instead of asking the question twice.
+            if (messageDiv) error.partial = true;
+            throw error;
+        }
+
+        if (!messageDiv) throw new Error('Empty streaming response');
+        removeTypingIndicator();
+    }
 
     // Add message to chat
     function appendMessage(html, type) {
@@ -52,6 +130,7 @@ document.addEventListener('DOMContentLoaded', function() {
         messageDiv.innerHTML = html;
         chatMessages.appendChild(messageDiv);
         chatMessages.scrollTop = chatMessages.scrollHeight;
+        return messageDiv;
     }
 
     // Show typing dots
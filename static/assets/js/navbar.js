@@ -0,0 +1,40 @@
+// static/assets/js/navbar.js: navbar search toggle (formerly the default scripts block in _base.html)
+document.addEventListener('DOMContentLoaded', function() {
+    const searchBtn = document.getElementById('navbar-search-btn');
+    const searchInput = document.getElementById('navbar-search-input');
+    const searchForm = document.getElementById('navbar-search-form');
+
+    function showSearch() {
+        searchInput.classList.remove('search-hidden');
+        searchInput.classList.add('search-visible');
+        searchInput.focus();
+    }
+    function hideSearch() {
+        searchInput.classList.remove('search-visible');
+        searchInput.classList.add('search-hidden');
+    }
+
+    searchBtn.addEventListener('click', function() {
+        if (searchInput.classList.contains('search-hidden')) {
+            showSearch();
+        } else if (searchInput.value.trim() !== '') {
+            searchForm.submit();
+        } else {
+            searchInput.focus();
+        }
+    });
+
+    // Allow pressing Enter in the input to submit
+    searchInput.addEventListener('keydown', function(e) {
+        if (e.key === 'Enter' && searchInput.value.trim() !== '') {
+            searchForm.submit();
+        }
+    });
+
+    // Hide input if user clicks outside
+    document.addEventListener('click', function(e) {
+        if (!searchForm.contains(e.target)) {
+            hideSearch();
+        }
+    });
+});
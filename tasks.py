@@ -0,0 +1,19 @@
+# tasks.py
+# Background job handlers (see jobs.py for the queue and workers).
+
+import os
+
+from jobs import job_handler
+
+SHIP_ORDER = 'ship_order'
+
+# How long after checkout an order is marked as shipped.
+SHIP_DELAY_SECONDS = float(os.environ.get('ORDER_SHIP_DELAY_SECONDS', 5))
+
+
+@job_handler(SHIP_ORDER)
+def ship_orders(conn, payloads):
+    """Marks every order in the batch as shipped with a single UPDATE."""
+    order_ids = [int(p['order_id']) for p in payloads]
+    with conn.cursor() as cur:
+        cur.execute("UPDATE orders SET status = 'Shipped' WHERE id = ANY(%s) AND status = 'Packed'", (order_ids,))
@@ -0,0 +1,125 @@
+# test_cache.py
+# TTLCache and the user cache built on it.
+
+import pytest
+
+import cache
+import user_cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, 'time', clock)
+    return clock
+
+
+def test_least_recently_used_entry_is_evicted():
+    c = cache.TTLCache(maxsize=2)
+    c.set('a', 1)
+    c.set('b', 2)
+    assert c.get('a') == 1
+    c.set('c', 3)
+    assert 'b' not in c
+    assert c.get('a') == 1 and c.get('c') == 3
+    assert c.stats()['evictions'] == 1
+
+
+def test_entries_expire_after_their_ttl(clock):
+    c = cache.TTLCache(ttl=10)
+    c.set('a', 1)
+    c.set('b', 2, ttl=60)
+    c.set('c', 3, ttl=None)
+    clock.now += 10
+    assert c.get('a') is None
+    assert c.get('b') == 2
+    clock.now += 1000
+    assert c.get('b', 'gone') == 'gone'
+    assert c.get('c') == 3
+    assert c.stats()['expirations'] == 2
+
+
+def test_cached_none_and_falsy_values_are_hits():
+    c = cache.TTLCache()
+    c.set('none', None)
+    c.set('zero', 0)
+    assert 'none' in c and c.get('zero', 'missing') == 0
+    assert c.stats()['hits'] == 2
+
+
+def test_invalidate_and_clear():
+    c = cache.TTLCache()
+    c.set('a', 1)
+    c.set('b', 2)
+    c.invalidate('a')
+    c.invalidate('missing')
+    assert 'a' not in c and 'b' in c
+    c.clear()
+    assert len(c) == 0
+
+
+def test_stats_report_the_hit_rate():
+    c = cache.TTLCache(maxsize=4, ttl=5, name='test')
+    c.set('a', 1)
+    c.get('a')
+    c.get('b')
+    assert c.stats() == {'size': 1, 'maxsize': 4, 'ttl': 5, 'hits': 1, 'misses': 1, 'hit_rate': 0.5,
+                         'evictions': 0, 'expirations': 0}
+
+
+def test_maxsize_must_be_positive():
+    with pytest.raises(ValueError):
+        cache.TTLCache(maxsize=0)
+
+
+@pytest.fixture
+def users(monkeypatch):
+    monkeypatch.setattr(user_cache, '_cache', cache.TTLCache(maxsize=10))
+    return user_cache
+
+
+def test_user_change_notification_drops_that_user(users):
+    users.cache_user(1, 'asha')
+    users.cache_user('2', 'ravi')
+    assert users.get_cached_user('1') == (1, 'asha')
+    users._on_user_changed('1')
+    assert users.get_cached_user(1) is None
+    assert users.get_cached_user(2) == (2, 'ravi')
+
+
+def test_unreadable_notification_clears_every_user(users):
+    users.cache_user(1, 'asha')
+    users.cache_user(2, 'ravi')
+    users._on_user_changed('')
+    assert users.get_cached_user(1) is None and users.get_cached_user(2) is None
+
+
+def test_invalidate_user_notifies_other_workers(users):
+    executed = []
+
+    class Cursor:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def execute(self, sql, params):
+            executed.append(params)
+
+    class Connection:
+        def cursor(self):
+            return Cursor()
+
+    users.cache_user(3, 'meera')
+    users.invalidate_user(3, conn=Connection())
+    assert users.get_cached_user(3) is None
+    assert executed == [(users.USER_CHANNEL, '3')]
@@ -0,0 +1,87 @@
+# test_carts.py
+# Server-side carts: the cached store, its revision tags and claiming on login.
+
+import pytest
+
+import carts
+
+
+@pytest.fixture
+def backend():
+    return carts.MemoryCartBackend()
+
+
+@pytest.fixture
+def store(backend):
+    return carts.CartStore(backend)
+
+
+def test_writes_are_visible_with_the_new_revision(store):
+    revision = store.add('c1', None, 7, '9')
+    revision = store.add('c1', revision, 7, '9', 2)
+    revision = store.add('c1', revision, 8, '10')
+    assert store.items('c1', revision) == {(7, '9'): 3, (8, '10'): 1}
+    revision = store.set_quantity('c1', revision, 7, None, 0)
+    assert store.items('c1', revision) == {(8, '10'): 1}
+    revision = store.clear('c1', revision)
+    assert store.items('c1', revision) == {}
+
+
+def test_quantities_are_capped(store):
+    revision = store.add('c1', None, 7, '9', 8)
+    revision = store.add('c1', revision, 7, '9', 5)
+    assert store.items('c1', revision) == {(7, '9'): carts.MAX_QUANTITY}
+    revision = store.set_quantity('c1', revision, 7, '9', 50)
+    assert store.items('c1', revision) == {(7, '9'): carts.MAX_QUANTITY}
+
+
+def test_each_write_gets_a_new_revision(store):
+    first = store.add('c1', None, 7, '9')
+    second = store.add('c1', first, 7, '9')
+    assert first != second
+
+
+def test_another_workers_write_is_not_shown_stale(backend):
+    # Two workers, each with its own cache, sharing the backend.
+    worker_a, worker_b = carts.CartStore(backend), carts.CartStore(backend)
+    revision = worker_a.add('c1', None, 7, '9')
+    assert worker_b.items('c1', revision) == {(7, '9'): 1}
+    revision = worker_a.add('c1', revision, 8, '10')
+    assert worker_b.items('c1', revision) == {(7, '9'): 1, (8, '10'): 1}
+
+
+def test_write_on_a_stale_copy_reloads_the_cart(backend):
+    worker_a, worker_b = carts.CartStore(backend), carts.CartStore(backend)
+    first = worker_a.add('c1', None, 7, '9')
+    worker_b.items('c1', first)
+    second = worker_a.add('c1', first, 8, '10')
+    third = worker_b.add('c1', second, 9, '11')
+    assert worker_b.items('c1', third) == {(7, '9'): 1, (8, '10'): 1, (9, '11'): 1}
+
+
+def test_claim_keeps_the_first_cart_for_a_new_user(store):
+    store.add('anon', None, 7, '9')
+    cart_id, revision = store.claim('anon', user_id=1)
+    assert cart_id == 'anon'
+    assert store.items(cart_id, revision) == {(7, '9'): 1}
+
+
+def test_claim_merges_into_the_users_cart(store):
+    revision = store.add('mine', None, 7, '9', 9)
+    store.claim('mine', user_id=1)
+    store.add('anon', None, 7, '9', 4)
+    store.add('anon', None, 8, '10')
+    cart_id, revision = store.claim('anon', user_id=1)
+    assert cart_id == 'mine'
+    assert store.items(cart_id, revision) == {(7, '9'): carts.MAX_QUANTITY, (8, '10'): 1}
+    assert store.items('anon', revision) == {}
+
+
+def test_claim_without_any_cart(store):
+    assert store.claim(None, user_id=1) == (None, None)
+
+
+def test_memory_backend_is_used_without_a_database(monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    monkeypatch.delenv('CART_BACKEND', raising=False)
+    assert isinstance(carts.create_cart_store(lambda: None).backend, carts.MemoryCartBackend)
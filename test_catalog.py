@@ -0,0 +1,83 @@
+# test_catalog.py
+# The in-memory catalog: sorted listings, keyset pages and their cursors.
+
+import pytest
+
+import catalog
+from app import decode_product_cursor, encode_product_cursor
+
+
+def matching(snapshot, categories=None, min_price=None, max_price=None, badge=None):
+    return [p for p in snapshot.products
+            if (not categories or p.category in categories) and (not badge or p.badge == badge)
+            and (min_price is None or p.price >= min_price) and (max_price is None or p.price <= max_price)]
+
+
+def all_pages(snapshot, sort, limit, sales=None, **filters):
+    """Every page of a listing, following each page's cursor through its string form."""
+    pages, after = [], None
+    while True:
+        products, last_key, _total = snapshot.page(sort, after, limit, sales=sales, **filters)
+        pages.append(products)
+        if last_key is None:
+            return pages
+        after = decode_product_cursor(encode_product_cursor(last_key))
+
+
+@pytest.mark.parametrize('key', [(7,), (-7,), (2499.0, 12), (-2499.5, -12), (1e20, 3), (-3, 44)])
+def test_cursor_round_trip(key):
+    assert decode_product_cursor(encode_product_cursor(key)) == key
+
+
+@pytest.mark.parametrize('cursor', ['', 'abc', '1_2_3', 'nan_1', 'inf', '1__2', '1.5.2'])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_product_cursor(cursor)
+
+
+@pytest.mark.parametrize('sort', sorted(catalog.SORT_KEYS))
+@pytest.mark.parametrize('filters', [
+    {},
+    {'categories': ['Men']},
+    {'min_price': 2000, 'max_price': 6000},
+    {'categories': ['Women', 'Unisex'], 'max_price': 5000},
+])
+def test_pages_cover_the_listing_once_in_order(snapshot, sort, filters):
+    sales = catalog.SalesRanks({p.id: p.id % 7 for p in snapshot.products}, 1.0)
+    pages = all_pages(snapshot, sort, 7, sales=sales, **filters)
+    expected = sorted(matching(snapshot, **filters), key=catalog.sort_key(sort, sales))
+    assert [p for page in pages for p in page] == expected
+    assert all(len(page) == 7 for page in pages[:-1])
+
+
+def test_last_full_page_has_no_cursor(snapshot):
+    products, last_key, total = snapshot.page('featured', limit=len(snapshot))
+    assert len(products) == len(snapshot) and last_key is None
+
+
+def test_selective_filters_are_counted_exactly(snapshot):
+    badge = next(p.badge for p in snapshot.products if p.badge)
+    _products, _key, total = snapshot.page('price_asc', badge=badge, max_price=3000)
+    assert total == len(matching(snapshot, badge=badge, max_price=3000))
+
+
+def test_estimate_count_is_exact_for_one_filter(snapshot):
+    assert snapshot.estimate_count(categories=['Men']) == (len(matching(snapshot, categories=['Men'])), True)
+    assert snapshot.estimate_count() == (len(snapshot), True)
+    _estimate, exact = snapshot.estimate_count(categories=['Men'], min_price=3000)
+    assert not exact
+
+
+def test_ordering_follows_new_sales_ranks(snapshot):
+    first = catalog.SalesRanks({snapshot.products[-1].id: 10}, 1.0)
+    second = catalog.SalesRanks({snapshot.products[0].id: 10}, 2.0)
+    assert snapshot.ordering('bestseller', first)[0] == snapshot.products[-1]
+    assert snapshot.ordering('bestseller', second)[0] == snapshot.products[0]
+
+
+def test_sales_ranks_fall_back_without_a_database(monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    monkeypatch.setattr(catalog, '_sales', catalog.TTLCache(maxsize=1, ttl=300))
+    ranks = catalog.get_sales_ranks()
+    assert ranks.units == {}
+    assert catalog.get_sales_ranks() is ranks
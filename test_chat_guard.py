@@ -0,0 +1,115 @@
+# test_chat_guard.py
+# Admission control for the chatbot: rate limit, circuit breaker, concurrency gate.
+
+import threading
+
+import pytest
+
+import chat_guard
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(chat_guard, 'time', clock)
+    return clock
+
+
+def test_rate_limiter_allows_a_burst_then_refills(clock):
+    limiter = chat_guard.RateLimiter(rate=1.0, burst=3)
+    assert [limiter.allow('a') for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow('b')
+    clock.now += 1.0
+    assert limiter.allow('a')
+    assert not limiter.allow('a')
+    assert limiter.stats()['limited'] == 2
+
+
+def test_rate_limiter_never_saves_more_than_the_burst(clock):
+    limiter = chat_guard.RateLimiter(rate=1.0, burst=2)
+    limiter.allow('a')
+    clock.now += 60
+    assert [limiter.allow('a') for _ in range(3)] == [True, True, False]
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = chat_guard.CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    assert breaker.stats()['trips'] == 1
+
+
+def test_breaker_lets_one_trial_through_when_half_open(clock):
+    breaker = chat_guard.CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.allow()
+
+
+def test_failed_trial_reopens_the_breaker(clock):
+    breaker = chat_guard.CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.stats()['trips'] == 2
+
+
+def test_cancelled_trial_lets_another_through(clock):
+    breaker = chat_guard.CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_cancelled()
+    assert breaker.allow()
+
+
+def test_gate_rejects_when_slots_and_queue_are_full():
+    gate = chat_guard.ConcurrencyGate(max_concurrent=1, max_waiting=0, wait_timeout=0.01)
+    assert gate.acquire()
+    assert not gate.acquire()
+    gate.release()
+    assert gate.acquire()
+    assert gate.stats() == {'max_concurrent': 1, 'in_flight': 1, 'waiting': 0, 'rejected': 1}
+
+
+def test_gate_hands_a_released_slot_to_a_waiter():
+    gate = chat_guard.ConcurrencyGate(max_concurrent=1, max_waiting=1, wait_timeout=5)
+    assert gate.acquire()
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(gate.acquire()))
+    waiter.start()
+    gate.release()
+    waiter.join()
+    assert result == [True]
+
+
+@pytest.mark.parametrize('hops, expected', [(0, 'ip:10.0.0.2'), (1, 'ip:203.0.113.9')])
+def test_client_key_ignores_spoofed_forwarded_for(monkeypatch, hops, expected):
+    import app
+
+    monkeypatch.setenv('TRUSTED_PROXY_HOPS', str(hops))
+    flask_app = app.create_app()
+    seen = []
+    flask_app.add_url_rule('/_client_key', '_client_key', lambda: seen.append(app.chat_client_key()) or '')
+    flask_app.test_client().get('/_client_key', environ_base={'REMOTE_ADDR': '10.0.0.2'},
+                                headers={'X-Forwarded-For': '1.2.3.4, 203.0.113.9'})
+    assert seen == [expected]
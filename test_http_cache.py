@@ -0,0 +1,80 @@
+# test_http_cache.py
+# ETags, Last-Modified and 304s for catalog pages.
+
+import pytest
+from flask import Flask
+
+import catalog
+import http_cache
+
+
+@pytest.fixture
+def page(snapshot):
+    """A conditional page whose viewer state the test sets; counts how often the view runs."""
+    app = Flask(__name__)
+    state = {'viewer': (0, False), 'extra': None, 'renders': 0}
+
+    @app.route('/listing')
+    @http_cache.conditional_page(viewer=lambda: state['viewer'], extra=lambda: state['extra'])
+    def listing():
+        state['renders'] += 1
+        return 'products'
+
+    state['client'] = app.test_client()
+    return state
+
+
+def test_matching_etag_is_answered_without_running_the_view(page):
+    first = page['client'].get('/listing')
+    assert first.status_code == 200 and first.headers['ETag']
+    again = page['client'].get('/listing', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == first.headers['ETag']
+    assert page['renders'] == 1
+
+
+def test_etag_changes_with_the_catalog_version(page, snapshot):
+    etag = page['client'].get('/listing').headers['ETag']
+    catalog.catalog_manager()._install(catalog.CatalogSnapshot(snapshot.products, version=snapshot.version + 1))
+    response = page['client'].get('/listing', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+
+
+def test_etag_changes_with_the_query_and_the_viewer(page):
+    etag = page['client'].get('/listing').headers['ETag']
+    assert page['client'].get('/listing?sort=newest').headers['ETag'] != etag
+    page['viewer'] = (2, False)
+    assert page['client'].get('/listing').headers['ETag'] != etag
+
+
+def test_anonymous_pages_are_public_with_last_modified(page):
+    response = page['client'].get('/listing')
+    assert response.cache_control.public and response.cache_control.s_maxage == http_cache.CDN_MAX_AGE
+    assert response.cache_control.max_age == 0
+    again = page['client'].get('/listing', headers={'If-Modified-Since': response.headers['Last-Modified']})
+    assert again.status_code == 304
+
+
+def test_visitor_pages_are_private(page):
+    page['viewer'] = (1, True)
+    response = page['client'].get('/listing')
+    assert response.cache_control.private and response.cache_control.no_cache
+    assert 'Last-Modified' not in response.headers
+    assert 'Cookie' in response.vary
+
+
+def test_extra_state_is_validated_by_etag_only(page):
+    page['extra'] = 1.0
+    first = page['client'].get('/listing')
+    assert 'Last-Modified' not in first.headers
+    page['extra'] = 2.0
+    assert page['client'].get('/listing', headers={'If-None-Match': first.headers['ETag']}).status_code == 200
+
+
+def test_products_page_revalidates(snapshot):
+    import app
+
+    client = app.create_app().test_client()
+    first = client.get('/products?category=Men')
+    assert first.status_code == 200
+    assert client.get('/products?category=Men', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
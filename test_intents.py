@@ -0,0 +1,110 @@
+# test_intents.py
+# The local intent engine: FAQ answers, product searches and what it leaves to the model.
+
+import json
+
+import pytest
+
+import intents
+
+
+class User:
+    is_authenticated = True
+
+
+class Anonymous:
+    is_authenticated = False
+
+
+@pytest.fixture(scope='module')
+def engine():
+    with open(intents.KNOWLEDGE_BASE_PATH, encoding='utf-8') as f:
+        return intents.IntentEngine(json.load(f))
+
+
+def ask(engine, message, user=User(), results=True, **kwargs):
+    searches = []
+
+    def search(query, min_price, max_price):
+        searches.append((query, min_price, max_price))
+        return f"found {query}" if results else None
+
+    answer = engine.answer(message, user, search=search, order_status=lambda order_id: f"order {order_id}",
+                           categories=['Men', 'Women', 'Unisex'], **kwargs)
+    return answer, searches
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("shoes under 5k", (None, 5000.0)),
+    ("between 3000 and 6,000", (3000.0, 6000.0)),
+    ("above ₹2000", (2000.0, None)),
+    ("size 9", (None, None)),
+])
+def test_parse_price(text, expected):
+    assert intents.parse_price(text)[:2] == expected
+
+
+def test_phrase_matcher_finds_overlapping_phrases():
+    matcher = intents.PhraseMatcher([(['return'], 'returns'), (['return', 'policy'], 'returns'), (['policy'], 'other')])
+    assert sorted(matcher.find(['your', 'return', 'policy'])) == [(1, 1, 'returns'), (2, 1, 'other'), (2, 2, 'returns')]
+
+
+@pytest.mark.parametrize('message', ["hi", "hello there", "thanks a lot!"])
+def test_greetings_alone_get_the_canned_reply(engine, message):
+    answer, _ = ask(engine, message)
+    assert answer is not None and answer.intent in ('greeting', 'thanks')
+
+
+def test_greeting_does_not_hide_a_question(engine):
+    answer, searches = ask(engine, "hey any sandals?", results=False)
+    assert answer is None
+    assert searches == []
+
+
+def test_greeting_words_are_not_search_terms(engine):
+    answer, searches = ask(engine, "hi, do you have boots under 15000?")
+    assert answer.intent == 'product_search'
+    assert searches == [('boots', None, 15000.0)]
+
+
+def test_currency_words_are_not_search_terms(engine):
+    answer, searches = ask(engine, "show me something under 8000 rupees")
+    assert answer.intent == 'product_search'
+    assert searches == [(None, None, 8000.0)]
+
+
+def test_unmatched_search_words_go_to_the_model(engine):
+    answer, searches = ask(engine, "I need black shoes under 9000", results=False)
+    assert searches == [('black', None, 9000.0)]
+    assert answer is None
+
+
+def test_sizing_answer_lists_every_size(engine):
+    answer, _ = ask(engine, "Do you have size 11?")
+    assert answer.intent == 'sizing'
+    assert '11' in answer.text
+
+
+def test_order_number_is_looked_up(engine):
+    answer, _ = ask(engine, "Where is order 42?")
+    assert answer == intents.LocalAnswer('order_status', "order 42")
+
+
+def test_order_lookup_needs_login(engine):
+    answer, _ = ask(engine, "Where is order 42?", user=Anonymous())
+    assert answer == intents.LocalAnswer('order_status', intents.LOGIN_REQUIRED_REPLY)
+
+
+def test_named_products_go_to_the_model(engine):
+    names = intents.ProductNames(["Pace Runner", "Alpha Runner Pro"])
+    answer, _ = ask(engine, "do the Pace Runner fit true to size", product_names=names)
+    assert answer is None
+
+
+def test_local_answer_with_catalog(snapshot):
+    import app
+
+    with app.create_app().test_request_context():
+        found = app.local_chat_answer("show me something under 8000 rupees", User())
+        assert found.intent == 'product_search' and '₹' in found.text
+        assert app.local_chat_answer("I need black shoes under 9000", User()) is None
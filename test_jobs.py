@@ -0,0 +1,133 @@
+# test_jobs.py
+# The job queue's batching, retry and failure handling, against a connection
+# that records statements (check_query_plans.py checks the SQL on PostgreSQL).
+
+import pytest
+
+import jobs
+import tasks
+
+
+class Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.statements.append((' '.join(sql.split()), params))
+
+    def fetchall(self):
+        rows, self.conn.claimable = self.conn.claimable, []
+        return rows
+
+    def fetchone(self):
+        return (1,)
+
+
+class Connection:
+    """Records statements; the first claim returns `claimable` rows."""
+
+    def __init__(self, claimable=()):
+        self.claimable = list(claimable)
+        self.statements = []
+        self.commits = self.rollbacks = 0
+
+    def cursor(self):
+        return Cursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def executed(self, prefix):
+        return [params for sql, params in self.statements if sql.startswith(prefix)]
+
+
+def job(job_id, kind, payload, attempts=1, max_attempts=jobs.DEFAULT_MAX_ATTEMPTS):
+    return (job_id, kind, payload, attempts, max_attempts, 0.5)
+
+
+@pytest.fixture
+def handled(monkeypatch):
+    calls = []
+    monkeypatch.setitem(jobs._handlers, 'test_ok', lambda conn, payloads: calls.append(payloads))
+
+    def fail(conn, payloads):
+        raise RuntimeError('boom')
+
+    monkeypatch.setitem(jobs._handlers, 'test_fail', fail)
+    return calls
+
+
+def test_jobs_of_a_kind_run_as_one_batch(handled):
+    conn = Connection([job(1, 'test_ok', {'n': 1}), job(2, 'test_ok', {'n': 2})])
+    assert jobs.run_batch(conn) == 2
+    assert handled == [[{'n': 1}, {'n': 2}]]
+    assert conn.executed('DELETE FROM jobs') == [([1, 2],)]
+    assert conn.rollbacks == 0
+
+
+def test_failed_batch_is_retried_with_backoff(handled):
+    conn = Connection([job(3, 'test_fail', {}, attempts=2)])
+    assert jobs.run_batch(conn) == 1
+    assert conn.rollbacks == 1
+    (error, delay, job_id), = conn.executed("UPDATE jobs SET status = 'pending', last_error")
+    assert job_id == 3 and 'boom' in error
+    assert jobs.RETRY_BASE_SECONDS * 2 * 0.8 <= delay <= jobs.RETRY_BASE_SECONDS * 2 * 1.2
+
+
+def test_job_fails_for_good_after_its_last_attempt(handled):
+    conn = Connection([job(4, 'test_fail', {}, attempts=3, max_attempts=3)])
+    jobs.run_batch(conn)
+    assert conn.executed("UPDATE jobs SET status = 'failed'") == [("RuntimeError('boom')", 4)]
+
+
+def test_unknown_kind_is_failed_not_run(handled):
+    conn = Connection([job(5, 'no_such_kind', {}), job(6, 'test_ok', {})])
+    assert jobs.run_batch(conn) == 2
+    assert handled == [[{}]]
+    (error, _delay, job_id), = conn.executed("UPDATE jobs SET status = 'pending', last_error")
+    assert job_id == 5 and 'no_such_kind' in error
+
+
+def test_empty_queue():
+    conn = Connection()
+    assert jobs.run_batch(conn) == 0
+    assert len(conn.statements) == 1
+
+
+@pytest.mark.parametrize('attempts, base', [(1, 5), (3, 20), (20, jobs.RETRY_MAX_SECONDS)])
+def test_backoff_doubles_up_to_the_cap(attempts, base):
+    for _ in range(20):
+        assert base * 0.8 <= jobs._backoff(attempts) <= base * 1.2
+
+
+def test_enqueue_sql_for_one_job_or_one_per_row():
+    single = ' '.join(jobs.enqueue_sql().split())
+    assert single.startswith('INSERT INTO jobs (kind, payload, run_at, max_attempts) SELECT %s, %s,')
+    assert 'FROM' not in single
+    per_row = ' '.join(jobs.enqueue_sql("jsonb_build_object('order_id', id)", source='new_order').split())
+    assert per_row.endswith('FROM new_order')
+
+
+def test_enqueue_uses_the_callers_transaction():
+    conn = Connection()
+    with conn.cursor() as cur:
+        assert jobs.enqueue(cur, tasks.SHIP_ORDER, {'order_id': 9}, delay=5) == 1
+    assert conn.statements[0][1] == (tasks.SHIP_ORDER, '{"order_id": 9}', 5, jobs.DEFAULT_MAX_ATTEMPTS)
+    assert conn.commits == 0
+
+
+def test_ship_orders_updates_the_batch_at_once():
+    conn = Connection()
+    tasks.ship_orders(conn, [{'order_id': 1}, {'order_id': '2'}])
+    assert conn.executed("UPDATE orders SET status = 'Shipped'") == [([1, 2],)]
+    assert conn.commits == 0
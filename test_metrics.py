@@ -0,0 +1,85 @@
+# test_metrics.py
+# Request timing: histograms, Server-Timing and streamed responses.
+
+import time
+
+import pytest
+from flask import Flask, Response, stream_with_context
+
+import metrics
+
+
+def observed(endpoint):
+    """(count, total seconds) of http_request_duration_seconds for an endpoint."""
+    count, total = 0, 0.0
+    for (name, _method, _status), series in metrics.REQUEST_SECONDS._series.items():
+        if name == endpoint:
+            count += sum(series[:-1])
+            total += series[-1]
+    return count, total
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    metrics.init_app(app)
+
+    @app.route('/metrics-test/page')
+    def metrics_test_page():
+        return 'ok'
+
+    @app.route('/metrics-test/stream')
+    def metrics_test_stream():
+        def body():
+            yield 'a'
+            time.sleep(0.05)
+            yield 'b'
+        return Response(stream_with_context(body()))
+
+    return app.test_client()
+
+
+def test_page_is_timed_with_server_timing(client):
+    before = observed('metrics_test_page')[0]
+    response = client.get('/metrics-test/page')
+    assert response.headers['Server-Timing'].startswith('app;dur=')
+    assert observed('metrics_test_page')[0] == before + 1
+
+
+def test_streamed_response_is_timed_when_it_closes(client):
+    count, seconds = observed('metrics_test_stream')
+    response = client.get('/metrics-test/stream', buffered=False)
+    assert 'Server-Timing' not in response.headers
+    assert observed('metrics_test_stream')[0] == count
+    assert b''.join(response.response) == b'ab'
+    response.close()
+    after_count, after_seconds = observed('metrics_test_stream')
+    assert after_count == count + 1
+    assert after_seconds - seconds >= 0.05
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram('test_render_seconds', 'Test.', ('kind',), buckets=(0.1, 1.0))
+    metrics._registry.remove(histogram)
+    histogram.observe(0.05, kind='a')
+    histogram.observe(0.5, kind='a')
+    histogram.observe(5, kind='a')
+    assert histogram.render()[2:] == [
+        'test_render_seconds_bucket{kind="a",le="0.1"} 1',
+        'test_render_seconds_bucket{kind="a",le="1.0"} 2',
+        'test_render_seconds_bucket{kind="a",le="+Inf"} 3',
+        'test_render_seconds_sum{kind="a"} 5.55',
+        'test_render_seconds_count{kind="a"} 3',
+    ]
+
+
+def test_chatbot_stream_is_timed_after_its_events(snapshot):
+    import app
+
+    client = app.create_app().test_client()
+    count = observed('main.chatbot_stream')[0]
+    response = client.post('/chatbot/stream', json={'message': 'hi'}, buffered=False)
+    assert observed('main.chatbot_stream')[0] == count
+    assert b'event: done' in b''.join(response.response)
+    response.close()
+    assert observed('main.chatbot_stream')[0] == count + 1
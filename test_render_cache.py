@@ -0,0 +1,80 @@
+# test_render_cache.py
+# The page and fragment caches, and their invalidation by catalog version.
+
+import pytest
+from flask import Flask
+from flask_login import LoginManager, UserMixin
+
+import cache
+import catalog
+import render_cache
+
+
+class User(UserMixin):
+    id = 1
+
+
+@pytest.fixture
+def site(snapshot, tmp_path, monkeypatch):
+    monkeypatch.setattr(render_cache, '_pages', cache.TTLCache())
+    monkeypatch.setattr(render_cache, '_fragments', cache.TTLCache())
+    (tmp_path / '_card.html').write_text('<p>{{ name }} {{ renders.append(1) or "" }}</p>')
+
+    app = Flask(__name__, template_folder=str(tmp_path))
+    login_manager = LoginManager(app)
+    login_manager.request_loader(lambda request: User() if request.headers.get('X-Test-User') else None)
+    state = {'cart_count': 0, 'views': 0, 'renders': []}
+
+    @app.route('/home')
+    @render_cache.cached_page(vary=lambda: state['cart_count'])
+    def home():
+        state['views'] += 1
+        return f"home {state['views']}"
+
+    @app.route('/card')
+    def card():
+        return render_cache.render_fragment('_card.html', key=7, name='Trail Runner', renders=state['renders'])
+
+    state['app'], state['client'] = app, app.test_client()
+    return state
+
+
+def test_anonymous_page_is_rendered_once(site):
+    assert site['client'].get('/home').text == 'home 1'
+    assert site['client'].get('/home').text == 'home 1'
+
+
+def test_page_varies_by_cart_count(site):
+    site['client'].get('/home')
+    site['cart_count'] = 2
+    assert site['client'].get('/home').text == 'home 2'
+
+
+def test_signed_in_visitors_get_a_fresh_page(site):
+    site['client'].get('/home')
+    assert site['client'].get('/home', headers={'X-Test-User': '1'}).text == 'home 2'
+    assert site['client'].get('/home', headers={'X-Test-User': '1'}).text == 'home 3'
+
+
+def test_new_catalog_version_renders_again(site, snapshot):
+    site['client'].get('/home')
+    site['client'].get('/card')
+    catalog.catalog_manager()._install(catalog.CatalogSnapshot(snapshot.products, version=snapshot.version + 1))
+    assert site['client'].get('/home').text == 'home 2'
+    site['client'].get('/card')
+    assert len(site['renders']) == 2
+
+
+def test_fragment_is_rendered_once_per_key(site):
+    assert site['client'].get('/card').text == '<p>Trail Runner </p>'
+    site['client'].get('/card')
+    assert len(site['renders']) == 1
+
+
+def test_debug_mode_bypasses_the_caches(site):
+    site['app'].debug = True
+    site['client'].get('/home')
+    site['client'].get('/card')
+    site['client'].get('/card')
+    assert site['client'].get('/home').text == 'home 2'
+    assert len(site['renders']) == 2
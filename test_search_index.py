@@ -0,0 +1,90 @@
+# test_search_index.py
+# The in-memory product search: matching, typo tolerance and ranking.
+
+import pytest
+
+import catalog
+import search_index
+
+
+def product(product_id, name, category='Men', price=3000.0, description=''):
+    return catalog.Product(product_id, name, category, price, price, description,
+                           None, None, None, None, None, None, None, None, 1)
+
+
+@pytest.fixture
+def index():
+    return search_index.SearchIndex(catalog.CatalogSnapshot([
+        product(1, 'Trail Runner', description='Grippy outsole for muddy trails'),
+        product(2, 'City Sneaker', 'Women', 2500.0, 'A light everyday shoe'),
+        product(3, 'Leather Boots', price=8000.0, description='Waterproof running-season boots'),
+        product(4, 'Running Shoes', 'Unisex', 4500.0, 'Cushioned shoes for road running'),
+    ], version=1))
+
+
+def ids(products):
+    return [p.id for p in products]
+
+
+@pytest.mark.parametrize('text, tokens', [
+    ("Running Shoes", ['run', 'shoe']),
+    ("Sneakers, BOOTS and glass", ['sneak', 'boot', 'and', 'glass']),
+    ("", []),
+    (None, []),
+])
+def test_tokenize_folds_case_and_suffixes(text, tokens):
+    assert search_index.tokenize(text) == tokens
+
+
+@pytest.mark.parametrize('a, b, expected', [
+    ('sneaker', 'sneaker', True),
+    ('sneaker', 'snaeker', True),
+    ('sneaker', 'sneakr', True),
+    ('sneaker', 'sneakers', True),
+    ('sneaker', 'sneakerss', False),
+    ('sneaker', 'snaekre', False),
+])
+def test_within_one_edit(a, b, expected):
+    assert search_index._within_one_edit(a, b) is expected
+
+
+def test_name_matches_outrank_description_matches(index):
+    assert ids(index.search('boots')) == [3]
+    assert ids(index.search('running')) == [4, 1, 3]
+
+
+def test_prefixes_and_typos_match(index):
+    assert ids(index.search('sneak')) == [2]
+    assert ids(index.search('snaeker')) == [2]
+    assert ids(index.search('leathr')) == [3]
+
+
+def test_results_matching_every_word_come_first(index):
+    assert ids(index.search('waterproof boots')) == [3]
+    assert ids(index.search('road shoes')) == [4]
+
+
+def test_price_range_and_limit(index):
+    assert ids(index.search('running', max_price=5000)) == [4, 1]
+    assert ids(index.search('running', min_price=5000)) == [3]
+    assert ids(index.search('running', limit=1)) == [4]
+
+
+def test_nothing_matches(index):
+    assert index.search('sandals') == []
+    assert index.search('   ') == []
+
+
+def test_index_is_rebuilt_for_a_new_catalog_version(snapshot):
+    first = search_index.get_search_index(snapshot)
+    assert search_index.get_search_index(snapshot) is first
+    newer = catalog.CatalogSnapshot(snapshot.products[:5], version=snapshot.version + 1)
+    rebuilt = search_index.get_search_index(newer)
+    assert rebuilt.version == newer.version
+    assert set(ids(rebuilt.search('shoes'))) <= {p.id for p in newer.products}
+
+
+def test_every_product_is_found_by_its_name(snapshot):
+    index = search_index.SearchIndex(snapshot)
+    for p in snapshot.products:
+        assert p.id in ids(index.search(p.name)), p.name
@@ -0,0 +1,16 @@
+# test_startup.py
+# The import-time budget from check_startup.py, run with the test suite.
+
+import check_startup
+
+
+def test_import_stays_within_budget():
+    budget_ms = check_startup.default_budget_ms()
+    runs = [check_startup.import_profile('import app') for _ in range(3)]
+    _modules, seconds = min(runs, key=lambda run: run[1])
+    assert seconds * 1000 <= budget_ms, f"importing app took {seconds * 1000:.0f} ms (budget {budget_ms:.0f} ms)"
+
+
+def test_heavy_modules_are_deferred():
+    modules, _seconds = check_startup.import_profile('import app')
+    assert check_startup.deferred_imports(modules) == []
@@ -0,0 +1,63 @@
+# user_cache.py
+# Bounded TTL/LRU cache for Flask-Login's `load_user`.
+#
+# Only what the `User` object needs for a logged-in request (id, username) is
+# cached; password hashes are always read fresh at login. Every worker keeps
+# its own cache, so changes are broadcast with NOTIFY on the `user_changed`
+# channel (a trigger on `users` does this for any writer; `invalidate_user`
+# does it explicitly from the app) and each worker drops its copy.
+
+import os
+
+from cache import TTLCache
+from pg_listener import listener
+
+USER_CHANNEL = 'user_changed'
+
+_cache = TTLCache(
+    maxsize=int(os.environ.get('USER_CACHE_SIZE', 10000)),
+    ttl=float(os.environ.get('USER_CACHE_TTL', 300)),
+    name='users',
+)
+_subscribed_pid = None
+
+
+def _on_user_changed(payload):
+    try:
+        _cache.invalidate(int(payload))
+    except (TypeError, ValueError):
+        _cache.clear()
+
+
+def _ensure_subscribed():
+    global _subscribed_pid
+    if _subscribed_pid != os.getpid():
+        _subscribed_pid = os.getpid()
+        if os.environ.get('DATABASE_URL'):
+            listener.on_reconnect(_cache.clear)
+            listener.subscribe(USER_CHANNEL, _on_user_changed)
+
+
+def get_cached_user(user_id):
+    """Returns the cached (id, username) tuple for `user_id`, or None."""
+    _ensure_subscribed()
+    return _cache.get(int(user_id))
+
+
+def cache_user(user_id, username):
+    _cache.set(int(user_id), (int(user_id), username))
+
+
+def invalidate_user(user_id, conn=None):
+    """
+    Drops a user from this worker's cache. With `conn`, also queues a NOTIFY
+    that other workers receive when the caller's transaction commits.
+    """
+    _cache.invalidate(int(user_id))
+    if conn is not None:
+        with conn.cursor() as cur:
+            cur.execute('SELECT pg_notify(%s, %s)', (USER_CHANNEL, str(int(user_id))))
+
+
+def user_cache_stats():
+    return _cache.stats()